@@ -0,0 +1,132 @@
+import queue
+import threading
+import time
+import traceback
+from dataclasses import dataclass
+
+import numpy as np
+
+
+def frozen_copy(array):
+    # Private read-only copy for publishing across threads
+    array = np.array(array)
+    array.setflags(write=False)
+    return array
+
+
+@dataclass(frozen=True)
+class AnalysisSnapshot:
+    # Immutable result published by the worker; the GUI only reads these.
+    # Arrays are private read-only copies so painting never races the worker.
+    # In multi-channel mode every array has a leading channel axis.
+    sequence: int
+    # time.perf_counter_ns() when the newest contributing block was captured
+    capture_ns: int
+    samples_processed: int
+    waveform: np.ndarray
+    spectrogram: np.ndarray
+    key_probs: np.ndarray
+    # Student model key distribution, None when no student model is loaded
+    student_probs: np.ndarray = None
+    # Embedding of the current window for the 3D view (student hidden layer,
+    # or chroma without a student); None before the first STFT frame
+    embedding: np.ndarray = None
+    # Sample index of each waveform point when the waveform is a min/max
+    # envelope (shared read-only array); None for raw samples
+    waveform_x: np.ndarray = None
+    # F0 in Hz (0 when unvoiced) and voicing confidence per spectrogram
+    # column, same length and order as the spectrogram history
+    f0: np.ndarray = None
+    voicing: np.ndarray = None
+    # Smoothed phonation type distribution (simulation.PHONATION_MODES order)
+    phonation: np.ndarray = None
+    # Sequence of the snapshot whose analysis (everything but the waveform)
+    # this one carries; older than `sequence` while a VAD gates silence
+    analysis_sequence: int = 0
+
+
+class AnalysisWorker(threading.Thread):
+    # Consumes (capture_ns, samples) items from audio_queue (every pending
+    # item per wake-up, coalesced into one block), feeds them to an
+    # analyzer (see key_engine.StreamAnalyzer) and publishes its snapshot. The
+    # latest snapshot is swapped in with a single reference assignment, so
+    # readers never need a lock. Queue dwell time goes to `latencies`.
+    # An analyzer exception does not end the thread: it is logged, counted
+    # in `failures` and kept in `error` for the view to show, and analysis
+    # starts over from the next block.
+
+    def __init__(self, audio_queue, analyzer, latencies=None):
+        super().__init__(name="analysis-worker", daemon=True)
+        self.audio_queue = audio_queue
+        self.analyzer = analyzer
+        self.latencies = latencies
+
+        self.latest = None
+        self.failures = 0
+        # "Type: message" of the newest analyzer exception, None if none
+        self.error = None
+        self._sequence = 0
+        self._stop_event = threading.Event()
+        self._reset_event = threading.Event()
+        # Notified after every publish, for callers that wait on progress
+        self._published = threading.Condition()
+
+    def stop(self, timeout=1.0):
+        self._stop_event.set()
+        if self.is_alive():
+            self.join(timeout)
+
+    def reset(self):
+        # Handled on the worker thread before the next chunk
+        self._reset_event.set()
+
+    def wait_for_samples(self, n_samples, timeout=None):
+        # Block until a published snapshot covers n_samples input samples
+        # (offline replay keeps analysis in lock-step with its virtual clock)
+        with self._published:
+            return self._published.wait_for(
+                lambda: self.latest is not None and self.latest.samples_processed >= n_samples, timeout)
+
+    def run(self):
+        while not self._stop_event.is_set():
+            try:
+                item = self.audio_queue.get(timeout=0.1)
+            except queue.Empty:
+                continue
+
+            if self._reset_event.is_set():
+                self._reset_event.clear()
+                self.analyzer.reset()
+                self.latest = None
+
+            # Drain everything already waiting and analyse it as one block
+            try:
+                capture_ns = self._consume([item] + self.audio_queue.drain())
+                snapshot = self.analyzer.snapshot(self._sequence + 1, capture_ns)
+            except Exception as e:
+                self._failed(e)
+                continue
+
+            self._sequence += 1
+            self.latest = snapshot
+            with self._published:
+                self._published.notify_all()
+
+    def _failed(self, error):
+        # The traceback is printed once per distinct error, not per block
+        message = f"{type(error).__name__}: {error}"
+        if message != self.error:
+            print(f"Analysis failed: {message}")
+            traceback.print_exc()
+        self.error = message
+        self.failures += 1
+        # Partly updated state would skew every later estimate
+        self.analyzer.reset()
+
+    def _consume(self, items):
+        if self.latencies is not None:
+            now = time.perf_counter_ns()
+            for capture_ns, _ in items:
+                self.latencies.record("queue_dwell", now - capture_ns)
+        self.analyzer.consume_many([samples for _, samples in items])
+        return items[-1][0]
@@ -0,0 +1,251 @@
+import glob
+import os
+
+import numpy as np
+
+
+AUDIO_EXTENSIONS = ('.wav', '.mp3', '.flac', '.ogg')
+
+
+def find_audio_files(patterns):
+    # Expand directories (recursively) and glob patterns into a sorted file list
+    paths = set()
+    for pattern in patterns:
+        if os.path.isdir(pattern):
+            for root, _, names in os.walk(pattern):
+                paths.update(os.path.join(root, name) for name in names
+                             if name.lower().endswith(AUDIO_EXTENSIONS))
+        else:
+            paths.update(p for p in glob.glob(pattern) if os.path.isfile(p))
+    return sorted(paths)
+
+
+def pcm_to_float32(samples, out=None, channels=None):
+    # Mono float32 in [-1, 1) from float or integer PCM, shape (n,) or
+    # (n, channels). Integer views (e.g. from a memory-mapped WAV) are only
+    # converted here, one chunk at a time, into `out` when provided.
+    # With `channels` set the result is (n, channels) instead of a downmix;
+    # input columns are reused cyclically, so mono feeds every channel.
+    samples = np.asarray(samples)
+    n = len(samples)
+    if out is None:
+        out = np.empty((n,) if channels is None else (n, channels), dtype=np.float32)
+    out = out[:n]
+
+    if samples.ndim == 2 and samples.shape[1] == 1:
+        samples = samples[:, 0]
+    if channels is not None:
+        if samples.ndim == 1 or samples.shape[1] == channels:
+            out[:] = samples if samples.ndim == 2 else samples[:, None]
+        else:
+            for c in range(channels):
+                out[:, c] = samples[:, c % samples.shape[1]]
+    elif samples.ndim == 2:
+        # Column adds beat np.mean's reduction over a short inner axis
+        channels = samples.shape[1]
+        out[:] = samples[:, 0]
+        for c in range(1, channels):
+            out += samples[:, c]
+        out *= 1.0 / channels
+    else:
+        out[:] = samples
+
+    kind = samples.dtype.kind
+    if kind == 'i':
+        out *= 1.0 / (2 ** (8 * samples.dtype.itemsize - 1))
+    elif kind == 'u':
+        # 8-bit WAV is unsigned with a 128 offset
+        out -= 128.0
+        out *= 1.0 / 128.0
+    return out
+
+
+def read_wav_header(path):
+    # Returns (sample_rate, channels, dtype, data_offset, n_frames). Streamed
+    # WAVs (e.g. ffmpeg writing to a pipe) leave the RIFF/data sizes as
+    # 0xFFFFFFFF, which scipy.io.wavfile rejects when memory-mapping, so the
+    # data length is clamped to what is actually in the file.
+    file_size = os.path.getsize(path)
+    with open(path, 'rb') as f:
+        riff = f.read(12)
+        if riff[:4] != b'RIFF' or riff[8:12] != b'WAVE':
+            raise ValueError(f"{path} is not a RIFF/WAVE file")
+
+        fmt = None
+        while True:
+            header = f.read(8)
+            if len(header) < 8:
+                raise ValueError(f"{path} has no data chunk")
+            chunk_id, chunk_size = header[:4], int.from_bytes(header[4:], 'little')
+            if chunk_id == b'fmt ':
+                fmt = f.read(chunk_size)
+                if chunk_size % 2:
+                    f.seek(1, os.SEEK_CUR)
+            elif chunk_id == b'data':
+                data_offset = f.tell()
+                break
+            else:
+                f.seek(chunk_size + chunk_size % 2, os.SEEK_CUR)
+
+    if fmt is None:
+        raise ValueError(f"{path} has no fmt chunk")
+    format_tag = int.from_bytes(fmt[0:2], 'little')
+    channels = int.from_bytes(fmt[2:4], 'little')
+    sample_rate = int.from_bytes(fmt[4:8], 'little')
+    bits = int.from_bytes(fmt[14:16], 'little')
+    if format_tag == 0xFFFE and len(fmt) >= 26:
+        # WAVE_FORMAT_EXTENSIBLE: the real format is the first field of the subformat GUID
+        format_tag = int.from_bytes(fmt[24:26], 'little')
+
+    if format_tag == 1 and bits in (8, 16, 32):
+        dtype = {8: np.uint8, 16: np.int16, 32: np.int32}[bits]
+    elif format_tag == 3 and bits in (32, 64):
+        dtype = {32: np.float32, 64: np.float64}[bits]
+    else:
+        raise ValueError(f"unsupported WAV format {format_tag} with {bits} bits in {path}")
+
+    dtype = np.dtype(dtype).newbyteorder('<')
+    frame_bytes = dtype.itemsize * channels
+    declared = chunk_size if chunk_size != 0xFFFFFFFF else file_size
+    available = min(declared, file_size - data_offset)
+    return sample_rate, channels, dtype, data_offset, available // frame_bytes
+
+
+class MmapWavReader:
+    # Memory-mapped WAV source. Opening is O(1) and chunks are zero-copy views
+    # of the file in its native sample format (int16 for most recordings), so
+    # multi-hour files play with constant RSS. Conversion to float happens
+    # per chunk in the analyzer via pcm_to_float32.
+
+    def __init__(self, path):
+        self.path = path
+        self.sample_rate, self.channels, dtype, offset, n_frames = read_wav_header(path)
+        if n_frames:
+            self.data = np.memmap(path, dtype=dtype, mode='r', offset=offset,
+                                  shape=(n_frames, self.channels))
+        else:
+            self.data = np.zeros((0, self.channels), dtype=dtype)
+
+    def __len__(self):
+        return len(self.data)
+
+    @property
+    def duration(self):
+        return len(self.data) / self.sample_rate
+
+    def chunks(self, block_size=1024, loop=False):
+        while True:
+            for start in range(0, len(self.data), block_size):
+                yield self.data[start:start + block_size]
+            if not loop or len(self.data) == 0:
+                return
+
+
+class StreamingResampler:
+    # Stateful polyphase FIR resampler (same Kaiser low-pass design as
+    # scipy.signal.resample_poly). Blocks can have any size; the last taps-1
+    # input samples are carried over so block boundaries are seamless, and the
+    # filter's group delay is compensated so output stays aligned with input.
+
+    def __init__(self, src_rate, dst_rate):
+        from math import gcd
+        from scipy.signal import firwin
+
+        g = gcd(int(src_rate), int(dst_rate))
+        self.up = int(dst_rate) // g
+        self.down = int(src_rate) // g
+        max_rate = max(self.up, self.down)
+        half_len = 10 * max_rate
+        h = firwin(2 * half_len + 1, 1.0 / max_rate, window=('kaiser', 5.0)) * self.up
+
+        # One time-reversed sub-filter per output phase, all padded to `taps`
+        self.taps = -(-len(h) // self.up)
+        h = np.concatenate([h, np.zeros(self.taps * self.up - len(h))])
+        self.phases = h.reshape(self.taps, self.up).T[:, ::-1].astype(np.float32)
+        self.delay = half_len
+
+        self._history = np.zeros(self.taps - 1, dtype=np.float32)
+        self._n_in = 0
+        self._m_next = 0
+
+    def process(self, block):
+        block = np.asarray(block, dtype=np.float32)
+        # buffer[j] holds input sample n = first + j
+        buffer = np.concatenate([self._history, block])
+        first = self._n_in - (self.taps - 1)
+        self._n_in += len(block)
+
+        # Output m needs input up to (m * down + delay) // up; emit every output
+        # whose newest input sample has now arrived
+        m_last = (self._n_in * self.up - 1 - self.delay) // self.down
+        if m_last < self._m_next:
+            out = np.empty(0, dtype=np.float32)
+        else:
+            k = np.arange(self._m_next, m_last + 1) * self.down + self.delay
+            start = k // self.up - first - (self.taps - 1)
+            windows = np.lib.stride_tricks.sliding_window_view(buffer, self.taps)
+            out = np.einsum('ij,ij->i', windows[start], self.phases[k % self.up])
+            self._m_next = m_last + 1
+
+        self._history = buffer[len(buffer) - (self.taps - 1):].copy()
+        return out
+
+    def flush(self):
+        # Remaining outputs for the samples seen so far (assumes silence after)
+        expected = -(-self._n_in * self.up // self.down)
+        missing = expected - self._m_next
+        if missing <= 0:
+            return np.empty(0, dtype=np.float32)
+        return self.process(np.zeros(self.taps, dtype=np.float32))[:missing]
+
+
+def iter_decoded_blocks(path, sample_rate=44100, block_size=1024, read_size=16384):
+    # Streaming decode (any format soundfile reads, incl. MP3) to mono float32
+    # at `sample_rate`, yielded as fixed-size blocks (the last may be short).
+    # Only one read block and one output block are held at a time, so memory
+    # stays flat regardless of track length. Each yielded block is a fresh
+    # array, safe to queue.
+    src_rate, _, _ = audio_info(path)
+    resampler = StreamingResampler(src_rate, sample_rate) if src_rate != sample_rate else None
+
+    pending = np.empty(0, dtype=np.float32)
+    for block in iter_audio_blocks(path, read_size):
+        if resampler is not None:
+            block = resampler.process(block)
+        pending = np.concatenate([pending, block])
+        n_full = len(pending) // block_size * block_size
+        for start in range(0, n_full, block_size):
+            yield pending[start:start + block_size].copy()
+        pending = pending[n_full:]
+
+    if resampler is not None:
+        pending = np.concatenate([pending, resampler.flush()])
+    for start in range(0, len(pending), block_size):
+        yield pending[start:start + block_size].copy()
+
+
+def audio_info(path):
+    import soundfile as sf
+    info = sf.info(path)
+    return info.samplerate, info.channels, info.frames
+
+
+def iter_audio_blocks(path, block_size=65536):
+    # Decode a file block by block as mono float32, so memory stays bounded by
+    # block_size regardless of the file length. The yielded array is reused
+    # between blocks; copy it if it must outlive the iteration step.
+    import soundfile as sf
+
+    with sf.SoundFile(path) as f:
+        frames = np.empty((block_size, f.channels), dtype=np.float32)
+        mono = np.empty(block_size, dtype=np.float32)
+        while True:
+            block = f.read(block_size, dtype='float32', always_2d=True, out=frames)
+            n = len(block)
+            if n == 0:
+                break
+            if f.channels == 1:
+                mono[:n] = block[:, 0]
+            else:
+                np.mean(block, axis=1, out=mono[:n])
+            yield mono[:n]
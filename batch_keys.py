@@ -0,0 +1,123 @@
+import argparse
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from audio_io import audio_info, find_audio_files
+from feature_cache import DEFAULT_CACHE_DIR, FeatureCache, file_frame_features
+from key_estimation import KEY_NAMES, StreamingKeyEstimator
+
+
+def analyze_file(path, block_size=65536, cache_dir=None):
+    # Runs in a worker process: accumulate a file-level key estimate from
+    # the chroma of every STFT frame (decay=1.0 keeps them all). Frame
+    # features come from the shared feature cache when this content was
+    # analysed before; otherwise the file is stream-decoded and they are
+    # cached for next time.
+    start = time.perf_counter()
+    sample_rate, channels, n_frames = audio_info(path)
+    cache = FeatureCache(cache_dir) if cache_dir else None
+    frames = file_frame_features(path, cache=cache, block_size=block_size)
+
+    estimator = StreamingKeyEstimator(decay=1.0)
+    estimator.update_chroma(frames[:, :12])
+    probs = estimator.probabilities()
+    best = int(probs.argmax())
+    return {
+        "path": path,
+        "key": KEY_NAMES[best],
+        "confidence": float(probs[best]),
+        "probabilities": {name: round(float(p), 6) for name, p in zip(KEY_NAMES, probs)},
+        "sample_rate": sample_rate,
+        "channels": channels,
+        "duration_s": n_frames / sample_rate,
+        "elapsed_s": time.perf_counter() - start,
+        "cached": bool(cache and cache.hits),
+    }
+
+
+def parquet_missing():
+    # Name of the missing Parquet dependency, or None; checked before the
+    # batch runs so a long batch is not thrown away at the end
+    from importlib.util import find_spec
+    if find_spec("pandas") is None:
+        return "pandas"
+    if find_spec("pyarrow") is None and find_spec("fastparquet") is None:
+        return "pyarrow (or fastparquet)"
+    return None
+
+
+def write_parquet(results, path):
+    import pandas as pd
+
+    rows = []
+    for result in results:
+        row = {k: v for k, v in result.items() if k not in ("probabilities", "error")}
+        row.update({f"p_{name}": p for name, p in result.get("probabilities", {}).items()})
+        row["error"] = result.get("error")
+        rows.append(row)
+    pd.DataFrame(rows).to_parquet(path, index=False)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Batch key detection over audio files")
+    parser.add_argument("inputs", nargs="+", help="audio files, directories or glob patterns")
+    parser.add_argument("-o", "--output", default="keys.jsonl",
+                        help="output file; .parquet writes Parquet, anything else JSON lines")
+    parser.add_argument("-j", "--workers", type=int, default=os.cpu_count(),
+                        help="worker processes (default: one per core)")
+    parser.add_argument("--block-size", type=int, default=65536,
+                        help="samples decoded per block")
+    parser.add_argument("--cache-dir", default=DEFAULT_CACHE_DIR,
+                        help="feature cache directory shared by the workers")
+    parser.add_argument("--no-cache", action="store_true",
+                        help="always decode and extract features")
+    args = parser.parse_args(argv)
+
+    paths = find_audio_files(args.inputs)
+    if not paths:
+        parser.error("no audio files matched")
+
+    parquet = args.output.endswith(".parquet")
+    if parquet:
+        missing = parquet_missing()
+        if missing:
+            parser.error(f"writing {args.output} needs {missing}; install it or use a .jsonl output")
+    results = []
+    audio_seconds = 0.0
+    start = time.perf_counter()
+
+    jsonl = None if parquet else open(args.output, "w")
+    try:
+        with ProcessPoolExecutor(max_workers=args.workers) as pool:
+            cache_dir = None if args.no_cache else args.cache_dir
+            futures = {pool.submit(analyze_file, path, args.block_size, cache_dir): path for path in paths}
+            for future in as_completed(futures):
+                try:
+                    result = future.result()
+                    audio_seconds += result["duration_s"]
+                    print(f"{result['key']:>4} {result['confidence']:.2f}  {result['path']}")
+                except Exception as e:
+                    result = {"path": futures[future], "error": str(e)}
+                    print(f"Error analyzing {futures[future]}: {e}", file=sys.stderr)
+                results.append(result)
+                if jsonl:
+                    jsonl.write(json.dumps(result) + "\n")
+    finally:
+        if jsonl:
+            jsonl.close()
+
+    if parquet:
+        write_parquet(results, args.output)
+
+    wall = time.perf_counter() - start
+    print(f"{len(paths)} files, {audio_seconds:.1f} s of audio in {wall:.2f} s: "
+          f"{len(paths) / wall:.2f} files/s, real-time factor {wall / max(audio_seconds, 1e-9):.4f} "
+          f"({audio_seconds / wall:.1f}x real time), "
+          f"{sum(bool(r.get('cached')) for r in results)} from the feature cache -> {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,160 @@
+import asyncio
+import time
+
+import numpy as np
+
+from latency import StageLatencies
+
+
+class MicroBatcher:
+    # Collects requests from many coroutines (one per session) into batches
+    # for a vectorized `run_batch(items) -> results`, one result per item in
+    # order, and hands each submitter its own result.
+    #
+    # A batch is dispatched once it holds max_batch units of work (`size` of
+    # each item, e.g. its number of analysis windows) or max_wait seconds
+    # after its oldest request arrived, whichever comes first. At most
+    # `concurrency` batches run at once (one per pool worker); while they
+    # are all busy the next batch keeps filling up to max_batch, so under
+    # load batches grow by themselves and when idle a lone request waits at
+    # most max_wait. max_wait=0 dispatches whatever is pending as soon as a
+    # slot is free.
+
+    def __init__(self, run_batch, max_batch=64, max_wait=0.005, concurrency=1, size=len):
+        self.run_batch = run_batch
+        self.max_batch = max(1, max_batch)
+        self.max_wait = max_wait
+        self.concurrency = max(1, concurrency)
+        self.size = size
+        self.metrics = BatchMetrics()
+        self._pending = []
+        self._pending_size = 0
+        self._wakeup = None
+        self._slots = None
+        self._task = None
+
+    async def submit(self, item):
+        if self._task is None:
+            self._wakeup = asyncio.Event()
+            self._slots = asyncio.Semaphore(self.concurrency)
+            self._task = asyncio.create_task(self._collect())
+        future = asyncio.get_running_loop().create_future()
+        self._pending.append((item, future, time.perf_counter_ns()))
+        self._pending_size += self.size(item)
+        self._wakeup.set()
+        return await future
+
+    def close(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    async def _collect(self):
+        while True:
+            while not self._pending:
+                self._wakeup.clear()
+                await self._wakeup.wait()
+
+            # Fill until max_batch or until the oldest request is max_wait old
+            deadline = self._pending[0][2] / 1e9 + self.max_wait
+            while self._pending_size < self.max_batch:
+                remaining = deadline - time.perf_counter()
+                if remaining <= 0:
+                    break
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), remaining)
+                except asyncio.TimeoutError:
+                    break
+
+            await self._slots.acquire()
+            # Take whole requests up to max_batch (always at least one)
+            taken, size = 0, 0
+            while taken < len(self._pending):
+                item_size = self.size(self._pending[taken][0])
+                if taken and size + item_size > self.max_batch:
+                    break
+                size += item_size
+                taken += 1
+            batch, self._pending = self._pending[:taken], self._pending[taken:]
+            self._pending_size -= size
+            asyncio.create_task(self._dispatch(batch, size))
+
+    async def _dispatch(self, batch, size):
+        started = time.perf_counter_ns()
+        for _, _, queued in batch:
+            self.metrics.latencies.record("batch_wait", started - queued)
+        try:
+            results = await self.run_batch([item for item, _, _ in batch])
+        except Exception as e:
+            for _, future, _ in batch:
+                if not future.done():
+                    future.set_exception(e)
+        else:
+            for (_, future, _), result in zip(batch, results):
+                # A submitter whose session closed meanwhile is cancelled
+                if not future.done():
+                    future.set_result(result)
+        finally:
+            self._slots.release()
+            self.metrics.record(len(batch), size, time.perf_counter_ns() - started)
+
+    def stats(self):
+        return dict(self.metrics.stats(), max_batch=self.max_batch, max_wait_ms=self.max_wait * 1000,
+                    concurrency=self.concurrency)
+
+    def format(self):
+        stats = self.stats()
+        return (f"batches {stats['batches']}  mean {stats['mean_requests']:.1f} requests / "
+                f"{stats['mean_size']:.1f} windows  {stats['windows_per_second']:.0f} windows/s  "
+                f"wait p50 {stats['wait_p50_ms']:.2f} ms  run p50 {stats['run_p50_ms']:.2f} ms")
+
+
+class BatchMetrics:
+    # Batch sizes and timings for the throughput / latency tradeoff: how
+    # long requests waited to be batched (batch_wait), how long a batch took
+    # to run (batch_run), the rolling sizes, and windows per second of
+    # batch run time and of wall time since the first batch.
+
+    def __init__(self, window=2048):
+        self.window = window
+        self.latencies = StageLatencies(window, stages=("batch_wait", "batch_run"))
+        self._requests = np.zeros(window, dtype=np.int64)
+        self._sizes = np.zeros(window, dtype=np.int64)
+        self.batches = 0
+        self.requests = 0
+        self.windows = 0
+        self.busy_ns = 0
+        self.started = None
+
+    def record(self, requests, size, elapsed_ns):
+        if self.started is None:
+            self.started = time.perf_counter() - elapsed_ns / 1e9
+        i = self.batches % self.window
+        self._requests[i] = requests
+        self._sizes[i] = size
+        self.batches += 1
+        self.requests += requests
+        self.windows += size
+        self.busy_ns += elapsed_ns
+        self.latencies.record("batch_run", elapsed_ns)
+
+    def stats(self):
+        n = min(self.batches, self.window)
+        wait = self.latencies.percentiles("batch_wait")
+        run = self.latencies.percentiles("batch_run")
+        elapsed = time.perf_counter() - self.started if self.started is not None else 0.0
+        return {
+            "batches": self.batches,
+            "requests": self.requests,
+            "windows": self.windows,
+            "mean_requests": float(self._requests[:n].mean()) if n else 0.0,
+            "mean_size": float(self._sizes[:n].mean()) if n else 0.0,
+            "max_size": int(self._sizes[:n].max()) if n else 0,
+            "windows_per_second": self.windows / elapsed if elapsed else 0.0,
+            "windows_per_busy_second": self.windows / (self.busy_ns / 1e9) if self.busy_ns else 0.0,
+            "wait_p50_ms": wait[0] if n else 0.0,
+            "wait_p95_ms": wait[1] if n else 0.0,
+            "run_p50_ms": run[0] if n else 0.0,
+            "run_p95_ms": run[1] if n else 0.0,
+        }
@@ -0,0 +1,663 @@
+import argparse
+import os
+import queue
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+from audio_io import iter_decoded_blocks, pcm_to_float32
+from features import KeyFeatureExtractor
+from key_estimation import StreamingKeyEstimator
+from ring_buffer import AudioRingBuffer
+from simulation import PHONATION_MODES, DistillationCurves, PhonationSpectrogramModel
+from student_model import StudentKeyModel, load_default_model
+from streaming_stft import StreamingSTFT
+from transport import AudioChunkQueue, SharedAudioRing
+
+
+def time_per_call(fn, repeats=200):
+    # Best-of-three mean wall time per call, in microseconds
+    best = float("inf")
+    for _ in range(3):
+        start = time.perf_counter()
+        for _ in range(repeats):
+            fn()
+        best = min(best, (time.perf_counter() - start) / repeats)
+    return best * 1e6
+
+
+def bench_ring_buffer(chunk_size=1024, sample_rate=44100):
+    # Current np.roll path in process_audio vs the preallocated ring buffer
+    print(f"Ring buffer vs np.roll (chunk={chunk_size} samples)")
+    print(f"{'buffer':>12} {'np.roll us':>12} {'ring us':>10} {'speedup':>9}")
+    chunk = np.random.standard_normal(chunk_size).astype(np.float32)
+
+    for seconds in (0.1, 1, 5, 10, 30):
+        buffer_size = int(seconds * sample_rate)
+        state = {"buffer": np.zeros(buffer_size, dtype=np.float32)}
+
+        def roll_update():
+            buffer = np.roll(state["buffer"], -chunk_size)
+            buffer[-chunk_size:] = chunk
+            state["buffer"] = buffer
+            return buffer
+
+        ring = AudioRingBuffer(buffer_size)
+
+        def ring_update():
+            ring.write(chunk)
+            return ring.view(buffer_size)
+
+        roll_us = time_per_call(roll_update)
+        ring_us = time_per_call(ring_update)
+        print(f"{seconds:>10.1f} s {roll_us:>12.1f} {ring_us:>10.1f} {roll_us / ring_us:>8.1f}x")
+
+
+def bench_key_estimator(sample_rate=44100, hop_ms=100, budget_ms=5.0):
+    # CPU cost of one key-estimation hop against the per-hop budget
+    hop = sample_rate * hop_ms // 1000
+    ring = AudioRingBuffer(sample_rate)
+    ring.write(np.random.standard_normal(sample_rate).astype(np.float32))
+    print(f"Key estimator per {hop_ms} ms hop (budget {budget_ms:.1f} ms)")
+    print(f"{'n_fft':>8} {'per hop ms':>12} {'within budget':>14}")
+
+    for n_fft in (2048, 4096, 8192):
+        estimator = StreamingKeyEstimator(sample_rate=sample_rate, n_fft=n_fft)
+        chunk = np.random.standard_normal(hop).astype(np.float32)
+
+        def hop_update():
+            ring.write(chunk)
+            estimator.update(ring.view(n_fft))
+
+        hop_ms_cost = time_per_call(hop_update) / 1000
+        print(f"{n_fft:>8} {hop_ms_cost:>12.3f} {str(hop_ms_cost <= budget_ms):>14}")
+
+
+def bench_streaming_stft(chunk_size=1024, sample_rate=44100, n_fft=4096, hop=1024):
+    # Recomputing the spectrogram of the whole rolling buffer per chunk vs
+    # transforming only the frames completed by the new chunk
+    print(f"Spectrogram update per {chunk_size}-sample chunk (n_fft={n_fft}, hop={hop})")
+    print(f"{'buffer':>12} {'full us':>12} {'streaming us':>13} {'speedup':>9}")
+    window = np.hanning(n_fft).astype(np.float32)
+    chunk = np.random.standard_normal(chunk_size).astype(np.float32)
+
+    for seconds in (1, 5, 10):
+        buffer_size = int(seconds * sample_rate)
+        ring = AudioRingBuffer(buffer_size)
+        ring.write(np.random.standard_normal(buffer_size).astype(np.float32))
+
+        def full_update():
+            ring.write(chunk)
+            frames = sliding_window_view(ring.view(), n_fft)[::hop]
+            return np.abs(np.fft.rfft(frames * window, axis=1)) ** 2
+
+        stft = StreamingSTFT(n_fft=n_fft, hop_length=hop, history=buffer_size // hop)
+
+        def streaming_update():
+            ring.write(chunk)
+            return stft.push(ring.view(chunk_size))
+
+        full_us = time_per_call(full_update, repeats=20)
+        streaming_us = time_per_call(streaming_update, repeats=20)
+        print(f"{seconds:>10.1f} s {full_us:>12.1f} {streaming_us:>13.1f} {full_us / streaming_us:>8.1f}x")
+
+
+def legacy_phonation_spectrogram(mode, frame, n_time=100, n_freq=100):
+    # The per-harmonic loop generate_phonation_spectrogram used before
+    # vectorization, generalised to n_time x n_freq for comparison
+    t = np.linspace(0, 10, n_time)
+    spec = np.zeros((n_time, n_freq))
+    for j in range(n_freq):
+        i = j * 100.0 / n_freq
+        if mode == "Modal":
+            harmonic_strength = np.exp(-i/20)
+            freq = i / 2
+        elif mode == "Falsetto":
+            if i < 20:
+                harmonic_strength = np.exp(-(i-20)**2/200)
+            else:
+                harmonic_strength = np.exp(-(i-50)**2/500)
+            freq = i / 1.5
+        elif mode == "Breathy":
+            harmonic_strength = np.exp(-i/30) * 0.6
+            freq = i / 2
+        else:
+            harmonic_strength = np.exp(-i/15) * 1.2
+            if j % 2 == 0:
+                harmonic_strength *= 1.3
+            freq = i / 2
+        spec[:, j] = np.sin(2*np.pi*freq*t + frame/10) * harmonic_strength
+    if mode == "Breathy":
+        spec += np.random.normal(0, 0.2, size=spec.shape)
+    spec *= (1 + np.sin(frame / 20) * 0.2)
+    return (spec - spec.min()) / (spec.max() - spec.min() + 1e-9)
+
+
+def bench_phonation_spectrogram():
+    # Per-frame cost of the simulated phonation spectrogram, loop vs vectorized
+    print("Phonation spectrogram per frame")
+    print(f"{'resolution':>12} {'mode':>9} {'loop us':>10} {'vector us':>10} {'speedup':>9} {'max err':>9}")
+
+    for n_time, n_freq in ((100, 100), (1024, 512)):
+        model = PhonationSpectrogramModel(n_time=n_time, n_freq=n_freq)
+        repeats = 50 if n_time <= 100 else 5
+        for mode in PHONATION_MODES:
+            state = {"frame": 0}
+
+            def loop_frame():
+                state["frame"] += 1
+                return legacy_phonation_spectrogram(mode, state["frame"], n_time, n_freq)
+
+            def vector_frame():
+                state["frame"] += 1
+                return model.render(mode, state["frame"])
+
+            loop_us = time_per_call(loop_frame, repeats)
+            vector_us = time_per_call(vector_frame, repeats)
+            if mode in model.NOISE_MODES:
+                error = "noise"
+            else:
+                reference = legacy_phonation_spectrogram(mode, 7, n_time, n_freq)
+                error = f"{np.abs(reference - model.render(mode, 7)).max():.1e}"
+            print(f"{n_time:>6}x{n_freq:<5} {mode:>9} {loop_us:>10.1f} {vector_us:>10.1f} "
+                  f"{loop_us / vector_us:>8.1f}x {error:>9}")
+
+
+def bench_streaming_decode(sample_rate=44100, block_size=1024):
+    # Peak Python-heap memory while stream-decoding/resampling the bundled
+    # tracks; it should not grow with track length
+    here = os.path.dirname(os.path.abspath(__file__))
+    paths = sorted(os.path.join(here, name) for name in os.listdir(here)
+                   if name.lower().endswith(('.mp3', '.wav')))
+    print(f"Streaming decode to {sample_rate} Hz in {block_size}-sample blocks")
+    print(f"{'file':>32} {'audio s':>8} {'x real time':>12} {'peak MB':>8}")
+
+    # Warm up so lazy imports (soundfile, scipy.signal) are not counted
+    for path in paths:
+        next(iter_decoded_blocks(path, sample_rate, block_size), None)
+
+    for path in paths:
+        tracemalloc.start()
+        start = time.perf_counter()
+        n = 0
+        for block in iter_decoded_blocks(path, sample_rate, block_size):
+            n += len(block)
+        elapsed = time.perf_counter() - start
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        seconds = n / sample_rate
+        print(f"{os.path.basename(path)[-32:]:>32} {seconds:>8.1f} {seconds / elapsed:>12.1f} {peak / 2**20:>8.2f}")
+
+
+def legacy_distillation_curves(frame):
+    # The per-frame curve generation update_visualization used before
+    t = np.linspace(0, 4*np.pi, 100)
+    teacher_y = np.sin(t + frame/10) * 0.5 + np.sin(2*t + frame/8) * 0.3
+    soft_targets = np.sin(t + frame/10) * 0.5 + np.sin(2*t + frame/8) * 0.3
+    soft_targets += np.random.normal(0, 0.05, size=len(t))
+    student_preds = np.sin(t + frame/10) * 0.5 + np.sin(2*t + frame/8) * 0.3
+    student_preds += np.random.normal(0, 0.15, size=len(t))
+    return teacher_y, soft_targets, student_preds
+
+
+def traced_peak(fn, frames=200):
+    # Peak traced heap growth over `frames` calls; tracemalloc sees numpy
+    # array buffers as well as Python objects
+    fn(0)
+    tracemalloc.start()
+    for frame in range(1, frames + 1):
+        fn(frame)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return peak
+
+
+def bench_curve_allocations(frames=200, max_peak_bytes=512):
+    # Regression check: the teacher/student curves must not allocate arrays
+    # per frame (one 100-point curve is 800 bytes; the limit leaves room for
+    # Python scalar temporaries only). Returns False (non-zero exit) if the
+    # peak exceeds the limit.
+    curves = DistillationCurves()
+    print(f"Distillation curve allocations over {frames} frames")
+    print(f"{'version':>10} {'peak bytes':>11} {'us/frame':>9}")
+    results = {}
+    for name, fn in (("legacy", legacy_distillation_curves), ("in-place", curves.update)):
+        peak = traced_peak(fn, frames)
+        state = {"frame": 0}
+
+        def step():
+            state["frame"] += 1
+            fn(state["frame"])
+
+        results[name] = peak
+        print(f"{name:>10} {peak:>11d} {time_per_call(step):>9.1f}")
+
+    ok = results["in-place"] <= max_peak_bytes
+    print("OK" if ok else f"REGRESSION: in-place curves allocated {results['in-place']} bytes "
+                          f"(limit {max_peak_bytes})")
+    return ok
+
+
+def bench_student_inference(budget_ms=2.0):
+    # Student key model cost per window, single window vs batched, against
+    # the 2 ms/window budget. Run with OMP_NUM_THREADS=1 for a one-core figure.
+    extractor = KeyFeatureExtractor()
+    model = load_default_model() or StudentKeyModel.initialize(extractor.n_features)
+    print(f"Student key model per window (budget {budget_ms:.1f} ms, context {model.context} frames)")
+    print(f"{'batch':>8} {'per call us':>12} {'per window us':>14} {'within budget':>14}")
+
+    for batch in (1, 16, 256, 4096):
+        windows = np.random.standard_normal((batch, extractor.n_features)).astype(np.float32)
+        call_us = time_per_call(lambda: model.predict_proba(windows), repeats=50)
+        per_window = call_us / batch
+        print(f"{batch:>8} {call_us:>12.1f} {per_window:>14.2f} {str(per_window / 1000 <= budget_ms):>14}")
+
+    # Including feature extraction from one 4096-point power frame
+    power = np.abs(np.fft.rfft(np.random.standard_normal(4096))) ** 2
+    history = np.zeros((model.context, extractor.n_features), dtype=np.float32)
+
+    def features_and_inference():
+        history[0] = extractor(power)[0]
+        return model.predict_proba(history.mean(axis=0)[None, :])
+
+    total_us = time_per_call(features_and_inference)
+    print(f"features + inference for one new frame: {total_us:.1f} us")
+
+
+def bench_audio_transport(block_size=1024, channels=2):
+    # Per-block cost of handing a PortAudio block to analysis: the callback
+    # side (what runs on the audio thread) and the round trip through a reader
+    print(f"Audio transport per {block_size}x{channels} block")
+    print(f"{'transport':>24} {'callback us':>12} {'round trip us':>14}")
+    indata = np.random.standard_normal((block_size, channels)).astype(np.float32)
+
+    legacy = queue.Queue(maxsize=64)
+
+    def legacy_put():
+        try:
+            legacy.put_nowait(np.mean(indata, axis=1))
+        except queue.Full:
+            pass
+
+    def legacy_round_trip():
+        legacy_put()
+        return legacy.get_nowait()
+
+    chunk_queue = AudioChunkQueue(maxsize=64)
+
+    def chunk_queue_put():
+        chunk_queue.put((0, np.mean(indata, axis=1)))
+
+    def chunk_queue_round_trip():
+        chunk_queue_put()
+        return chunk_queue.drain()
+
+    ring = SharedAudioRing.create(n_slots=64, slot_size=block_size)
+    try:
+        def ring_write():
+            ring.write(indata, 0)
+
+        def ring_round_trip():
+            ring_write()
+            return ring.drain()
+
+        for name, put, round_trip in (("queue.Queue + np.mean", legacy_put, legacy_round_trip),
+                                      ("AudioChunkQueue", chunk_queue_put, chunk_queue_round_trip),
+                                      ("SharedAudioRing", ring_write, ring_round_trip)):
+            callback_us = time_per_call(put, repeats=2000)
+            round_trip_us = time_per_call(round_trip, repeats=2000)
+            print(f"{name:>24} {callback_us:>12.2f} {round_trip_us:>14.2f}")
+    finally:
+        ring.close()
+
+    # A lapped reader must never see a slot the producer is rewriting: fill a
+    # 4-slot drop-oldest ring, then read while the 5th write (into slot 0)
+    # has only converted half of its samples
+    ring = SharedAudioRing.create(n_slots=4, slot_size=8)
+    try:
+        for _ in range(4):
+            ring.write(np.full(8, 99, dtype=np.int16), 0)
+        ring._slots[0][:4] = 0
+        first = ring.get_nowait()[1]
+        torn = not np.all(first == pcm_to_float32(np.full(8, 99, dtype=np.int16)))
+        print(f"lapped read during an in-flight write: {'torn slot' if torn else 'skipped'}, "
+              f"{ring.dropped_chunks} dropped")
+    finally:
+        ring.close()
+
+    # Under block the producer never laps, so a full ring is read in full
+    ring = SharedAudioRing.create(n_slots=4, slot_size=8, policy="block")
+    try:
+        for i in range(4):
+            ring.write(np.full(8, i, dtype=np.float32), 0)
+        full_read = len(ring.drain()) == 4 and ring.dropped_chunks == 0
+    finally:
+        ring.close()
+    if torn or not full_read:
+        return False
+
+
+def bench_multichannel_analysis(block_size=1024):
+    # One batched multi-channel analyzer vs one mono analyzer per channel
+    from key_engine import StreamAnalyzer
+
+    print(f"Per-block analysis of N singers ({block_size}-sample blocks)")
+    print(f"{'channels':>9} {'per-channel us':>15} {'batched us':>11} {'speedup':>9}")
+    for channels in (2, 4, 8):
+        block = np.random.standard_normal((block_size, channels)).astype(np.float32)
+        separate = [StreamAnalyzer() for _ in range(channels)]
+        batched = StreamAnalyzer(channels=channels)
+
+        def per_channel():
+            for c, analyzer in enumerate(separate):
+                analyzer.consume(block[:, c])
+                analyzer.key_probabilities()
+
+        def vectorized():
+            batched.consume(block)
+            batched.key_probabilities()
+
+        loop_us = time_per_call(per_channel)
+        batched_us = time_per_call(vectorized)
+        print(f"{channels:>9} {loop_us:>15.1f} {batched_us:>11.1f} {loop_us / batched_us:>8.1f}x")
+
+
+def bench_embedding_cloud(n_features=64, frame_ms=50.0):
+    # Per-frame cost of adding one window and re-projecting the 3D cloud,
+    # against the 20 fps embedding timer
+    from embedding import EmbeddingCloud
+
+    print(f"Embedding cloud add + re-project per frame (budget {frame_ms:.0f} ms)")
+    print(f"{'points':>8} {'per frame us':>13} {'budget used':>12}")
+    rng = np.random.default_rng(0)
+    for points in (1000, 5000, 10000):
+        cloud = EmbeddingCloud(n_features, capacity=points)
+        cloud.add(rng.standard_normal((points, n_features)).astype(np.float32), rng.integers(24, size=points))
+        window = rng.standard_normal((1, n_features)).astype(np.float32)
+
+        def frame():
+            cloud.add(window, [0])
+            return cloud.update()
+
+        frame_us = time_per_call(frame)
+        print(f"{points:>8} {frame_us:>13.1f} {frame_us / (frame_ms * 10):>11.1f}%")
+
+
+def bench_waveform_decimation(columns=800, sample_rate=44100):
+    # Waveform published per snapshot: the raw window copy vs its min/max
+    # envelope at the plot's pixel width
+    from waveform import WaveformDecimator
+
+    print(f"Waveform per snapshot, raw vs min/max at {columns} columns")
+    print(f"{'window':>9} {'raw points':>11} {'raw us':>8} {'envelope points':>16} {'envelope us':>12}")
+    for seconds in (0.5, 2, 10, 30):
+        n = int(seconds * sample_rate)
+        ring = AudioRingBuffer(n + sample_rate)
+        ring.write(np.random.standard_normal(n + sample_rate).astype(np.float32))
+        decimator = WaveformDecimator(n, columns)
+
+        raw_us = time_per_call(lambda: ring.view(n).copy())
+        envelope_us = time_per_call(lambda: decimator(ring.view(n)).copy())
+        print(f"{seconds:>7.1f} s {n:>11} {raw_us:>8.1f} {len(decimator.out):>16} {envelope_us:>12.1f}")
+
+
+def bench_pitch_tracker(sample_rate=44100, n_fft=4096, hop_length=1024, budget_ms=1.0):
+    # F0 error on harmonic test tones and per-hop cost of tracking from the
+    # STFT power frames the key estimator already has
+    from pitch import StreamingPitchTracker
+
+    print(f"Pitch tracking from shared STFT frames (budget {budget_ms:.1f} ms per hop)")
+    print(f"{'f0 Hz':>8} {'median Hz':>10} {'error cents':>12} {'voiced':>7}")
+    t = np.arange(sample_rate) / sample_rate
+    worst = 0.0
+    for f0 in (82.4, 146.8, 220.0, 329.6, 523.3, 880.0):
+        tone = sum(0.6 ** h * np.sin(2 * np.pi * f0 * h * t + h) for h in range(1, 8))
+        stft = StreamingSTFT(n_fft=n_fft, hop_length=hop_length, history=1, max_bin=1)
+        tracker = StreamingPitchTracker(sample_rate, n_fft)
+        estimate, confidence = tracker.push(stft.push((0.3 * tone).astype(np.float32)))
+        # Skip the frames that still overlap the zero-filled start
+        estimate, confidence = estimate[4:], confidence[4:]
+        cents = 1200 * abs(np.log2(np.median(estimate) / f0))
+        worst = max(worst, cents)
+        print(f"{f0:>8.1f} {np.median(estimate):>10.2f} {cents:>12.2f} {np.mean(confidence > 0):>6.0%}")
+
+    stft = StreamingSTFT(n_fft=n_fft, hop_length=hop_length, history=1, max_bin=1)
+    power = stft.push(np.random.standard_normal(n_fft).astype(np.float32))
+    tracker = StreamingPitchTracker(sample_rate, n_fft)
+    hop_ms = time_per_call(lambda: tracker.push(power)) / 1000
+    print(f"per hop {hop_ms:.3f} ms  worst error {worst:.2f} cents")
+    return hop_ms <= budget_ms and worst < 5.0
+
+
+def bench_phonation_classifier(sample_rate=44100, n_fft=4096, hop_length=1024, budget_ms=1.0,
+                               voices=8, spread_db=3.0, min_accuracy=0.8):
+    # Frame accuracy on synthetic voices of each phonation type and per-hop
+    # cost of features + classifier. DEFAULT_MEANS were calibrated on
+    # synthetic_voice itself, so unseen seeds of the same generator only
+    # show how well the calibration fits; the held-out column perturbs the
+    # generator (harmonic slope and H1 level by up to spread_db, aspiration
+    # noise by up to 2**(spread_db / 4)) and is what the check uses. Neither
+    # says how the defaults do on real voices.
+    from phonation import PhonationClassifier, PhonationFeatureExtractor
+    from pitch import StreamingPitchTracker
+    from simulation import VOICE_PARAMS, synthetic_voice
+
+    extractor = PhonationFeatureExtractor(sample_rate, n_fft)
+    classifier = PhonationClassifier()
+    rng = np.random.default_rng(100)
+
+    def accuracy(index, mode, perturb):
+        slope, h1_gain, noise, (low, high) = VOICE_PARAMS[mode]
+        correct = total = 0
+        for f0 in rng.uniform(low, high, voices):
+            params = None
+            if perturb:
+                params = (slope + rng.uniform(-spread_db, spread_db), h1_gain + rng.uniform(-spread_db, spread_db),
+                          noise * 2.0 ** rng.uniform(-spread_db / 4, spread_db / 4))
+            stft = StreamingSTFT(n_fft=n_fft, hop_length=hop_length, history=1, max_bin=1)
+            tracker = StreamingPitchTracker(sample_rate, n_fft)
+            power = stft.push(synthetic_voice(mode, f0, sample_rate, rng=rng, params=params))
+            f0s, _ = tracker.push(power)
+            features = extractor(power, f0s, tracker.periodicity)
+            voiced = f0s > 0
+            # Skip the frames that still overlap the zero-filled start
+            voiced[:4] = False
+            predicted = classifier.frame_probabilities(features[voiced]).argmax(axis=1)
+            correct += int(np.sum(predicted == index))
+            total += int(voiced.sum())
+        return correct / max(total, 1)
+
+    print(f"Phonation classification on {voices} synthetic voices per type")
+    print(f"{'mode':>9} {'calibration generator':>22} {'held-out generator':>19}")
+    held_out = []
+    for index, mode in enumerate(PHONATION_MODES):
+        seen = accuracy(index, mode, perturb=False)
+        held_out.append(accuracy(index, mode, perturb=True))
+        print(f"{mode:>9} {seen:>21.1%} {held_out[-1]:>18.1%}")
+    print(f"held-out mean {np.mean(held_out):.1%} (minimum {min_accuracy:.0%}); "
+          f"not validated on real voice")
+
+    stft = StreamingSTFT(n_fft=n_fft, hop_length=hop_length, history=1, max_bin=1)
+    tracker = StreamingPitchTracker(sample_rate, n_fft)
+    power = stft.push(synthetic_voice("Modal", 200.0, sample_rate, seconds=0.2))[-1:]
+    f0s, _ = tracker.push(power)
+
+    def hop():
+        features = extractor(power, f0s, tracker.periodicity)
+        return classifier.frame_weights(classifier.update(features, f0s > 0), f0s > 0)
+
+    hop_ms = time_per_call(hop) / 1000
+    print(f"features + classifier per hop {hop_ms:.3f} ms (budget {budget_ms:.1f} ms)")
+    return hop_ms <= budget_ms and np.mean(held_out) >= min_accuracy
+
+
+def bench_vad_gating(block_size=1024, sample_rate=44100, student=True):
+    # Analysis cost per block (consume + snapshot) while the input is quiet
+    # room noise, with and without the VAD gate, and how much of a session
+    # that alternates phrases and pauses is skipped
+    from key_engine import StreamAnalyzer
+
+    model = load_default_model() if student else None
+    rng = np.random.default_rng(0)
+    noise = (rng.standard_normal(block_size) * 10 ** (-70 / 20)).astype(np.float32)
+    print(f"Analysis per {block_size}-sample block of -70 dBFS room noise")
+    print(f"{'vad':>5} {'per block us':>13}")
+    costs = {}
+    for vad in (False, True):
+        analyzer = StreamAnalyzer(sample_rate=sample_rate, student_model=model, vad=vad)
+        sequence = iter(range(1 << 30))
+
+        def block():
+            analyzer.consume(noise)
+            return analyzer.snapshot(next(sequence), 0)
+
+        block()
+        costs[vad] = time_per_call(block)
+        print(f"{'on' if vad else 'off':>5} {costs[vad]:>13.1f}")
+
+    # 2 s phrases of a harmonic tone separated by 2 s pauses of room noise
+    t = np.arange(2 * sample_rate) / sample_rate
+    phrase = (0.2 * np.sin(2 * np.pi * 220 * t)).astype(np.float32)
+    pause = (rng.standard_normal(2 * sample_rate) * 10 ** (-70 / 20)).astype(np.float32)
+    session = np.concatenate([phrase, pause] * 5)
+    analyzer = StreamAnalyzer(sample_rate=sample_rate, student_model=model)
+    for start in range(0, len(session), block_size):
+        analyzer.consume(session[start:start + block_size])
+    print(f"idle cost cut {costs[False] / costs[True]:.1f}x; half-silent session: {analyzer.vad.format()}")
+
+
+def bench_replay(seconds=10.0, min_realtime_factor=1.0):
+    # End-to-end offline replay of the sample recording through the full
+    # window (offscreen unless a platform is set): audio seconds processed
+    # per wall second and real per-frame paint times
+    os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+    from PyQt5.QtWidgets import QApplication
+    from pipeline import SAMPLE_RECORDING, RealTimeKeyIdentificationViz
+    from replay import VirtualClock, format_report, run_replay
+
+    app = QApplication.instance() or QApplication(sys.argv[:1])
+    print(f"Offline replay of {os.path.basename(SAMPLE_RECORDING)} (at most {seconds:.0f} s)")
+    window = RealTimeKeyIdentificationViz(seed=0, clock=VirtualClock())
+    window.show()
+    try:
+        report = run_replay(window, app, SAMPLE_RECORDING, max_seconds=seconds)
+    finally:
+        window.close()
+    print(format_report(report))
+    if report["realtime_factor"] < min_realtime_factor:
+        print(f"slower than {min_realtime_factor:.1f}x real time")
+        return False
+
+
+def bench_server_load(sessions=200, seconds=2.0, port=8779):
+    # Streams to a spawned server.py from `sessions` concurrent WebSocket
+    # clients at real-time pace; fails if any session is refused or loses
+    # replies. Real-time capacity scales with the analysis workers (cores)
+    import loadtest
+    print(f"{sessions} sessions x {seconds:.0f} s of audio against server.py")
+    if loadtest.main(["--spawn", "--port", str(port), "-n", str(sessions), "--seconds", str(seconds)]):
+        return False
+
+
+def bench_micro_batching(seconds=1.5, light_sessions=8, heavy_sessions=64, windows=4,
+                         policies=((1, 0.0), (16, 0.002), (64, 0.005), (256, 0.010))):
+    # Throughput against latency of server.py's micro-batching, in process
+    # (no sockets; batches run on the event loop like --workers 0). Light
+    # load: sessions paced at real time, where waiting for a batch only adds
+    # latency. Saturated: sessions that resubmit as soon as they get a
+    # reply, where bigger batches buy throughput.
+    import asyncio
+    from batching import MicroBatcher
+    from server import HopAnalyzer
+    from simulation import synthetic_voice
+
+    analyzer = HopAnalyzer()
+    audio = synthetic_voice("Modal", 220.0, seconds=1.0, rng=0)
+    frames = np.stack([audio[i * 1024:i * 1024 + 4096] for i in range(windows)])
+    period = windows * 1024 / 44100
+
+    async def run_batch(requests):
+        request_frames, key_chroma, phonation_probs = zip(*requests)
+        return analyzer(list(request_frames), np.stack(key_chroma), np.stack(phonation_probs))
+
+    async def run(max_batch, max_wait, sessions, paced):
+        batcher = MicroBatcher(run_batch, max_batch, max_wait, size=lambda request: len(request[0]))
+        latencies = []
+
+        async def session(index):
+            state = (np.zeros(12, dtype=np.float32), np.full(4, 0.25, dtype=np.float32))
+            start = time.perf_counter() + index * period / sessions
+            i = 0
+            while time.perf_counter() - start < seconds:
+                if paced:
+                    await asyncio.sleep(max(0.0, start + i * period - time.perf_counter()))
+                submitted = time.perf_counter()
+                state = (await batcher.submit((frames,) + state))[:2]
+                latencies.append(time.perf_counter() - submitted)
+                i += 1
+
+        await asyncio.gather(*(session(i) for i in range(sessions)))
+        batcher.close()
+        return batcher.stats(), latencies
+
+    print(f"{windows}-window requests; latency is submit to result")
+    print(f"{'load':>10} {'batch':>6} {'wait ms':>8} {'windows/s':>10} {'mean batch':>11} {'p50 ms':>8} {'p95 ms':>8}")
+    throughput = {}
+    for label, sessions, paced in (("light", light_sessions, True), ("saturated", heavy_sessions, False)):
+        for max_batch, max_wait in policies:
+            stats, latencies = asyncio.run(run(max_batch, max_wait, sessions, paced))
+            throughput[label, max_batch] = stats["windows_per_second"]
+            print(f"{label:>10} {max_batch:>6} {max_wait * 1000:>8.0f} {stats['windows_per_second']:>10.0f} "
+                  f"{stats['mean_size']:>11.1f} {np.percentile(latencies, 50) * 1000:>8.1f} "
+                  f"{np.percentile(latencies, 95) * 1000:>8.1f}")
+    unbatched, batched = throughput["saturated", 1], throughput["saturated", policies[-1][0]]
+    print(f"saturated throughput {batched / unbatched:.1f}x with batches of up to {policies[-1][0]} windows")
+    if batched < unbatched:
+        return False
+
+
+BENCHMARKS = {
+    "ring_buffer": bench_ring_buffer,
+    "key_estimator": bench_key_estimator,
+    "streaming_stft": bench_streaming_stft,
+    "phonation_spectrogram": bench_phonation_spectrogram,
+    "streaming_decode": bench_streaming_decode,
+    "curve_allocations": bench_curve_allocations,
+    "student_inference": bench_student_inference,
+    "audio_transport": bench_audio_transport,
+    "multichannel_analysis": bench_multichannel_analysis,
+    "embedding_cloud": bench_embedding_cloud,
+    "waveform_decimation": bench_waveform_decimation,
+    "pitch_tracker": bench_pitch_tracker,
+    "vad_gating": bench_vad_gating,
+    "phonation_classifier": bench_phonation_classifier,
+    "replay": bench_replay,
+    "server_load": bench_server_load,
+    "micro_batching": bench_micro_batching,
+}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Microbenchmarks for the real-time pipeline")
+    parser.add_argument("names", nargs="*", metavar="NAME",
+                        help=f"benchmarks to run (default: all of {', '.join(BENCHMARKS)})")
+    args = parser.parse_args()
+    unknown = set(args.names) - set(BENCHMARKS)
+    if unknown:
+        parser.error(f"unknown benchmark(s): {', '.join(sorted(unknown))}")
+
+    failed = []
+    for name in args.names or BENCHMARKS:
+        if BENCHMARKS[name]() is False:
+            failed.append(name)
+        print()
+    if failed:
+        print(f"Failed checks: {', '.join(failed)}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,122 @@
+import colorsys
+
+import numpy as np
+
+
+class IncrementalPCA:
+    # Streaming PCA from running first and second moments. partial_fit() only
+    # touches the new rows (one (k, d) x (d, k) product), and refitting is an
+    # eigendecomposition of the d x d covariance, so the cost does not grow
+    # with the number of points seen. `forget` < 1 down-weights old rows
+    # (per row), so the projection follows the recent audio.
+
+    def __init__(self, n_features, n_components=3, forget=0.999):
+        self.n_features = n_features
+        self.n_components = n_components
+        self.forget = forget
+        self.weight = 0.0
+        self._sum = np.zeros(n_features)
+        self._outer = np.zeros((n_features, n_features))
+        self.mean = np.zeros(n_features, dtype=np.float32)
+        # Until there is data, project onto the first axes
+        self.components = np.eye(n_components, n_features, dtype=np.float32)
+        self.scales = np.ones(n_components, dtype=np.float32)
+
+    def reset(self):
+        self.__init__(self.n_features, self.n_components, self.forget)
+
+    def partial_fit(self, rows):
+        rows = np.atleast_2d(rows).astype(np.float64)
+        decay = self.forget ** len(rows)
+        self.weight = self.weight * decay + len(rows)
+        self._sum *= decay
+        self._sum += rows.sum(axis=0)
+        self._outer *= decay
+        self._outer += rows.T @ rows
+        if self.weight >= 2:
+            self._refit()
+
+    def _refit(self):
+        mean = self._sum / self.weight
+        cov = self._outer / self.weight - np.outer(mean, mean)
+        eigvals, eigvecs = np.linalg.eigh(cov)
+        # eigh sorts ascending; keep the largest, flipping signs to stay
+        # aligned with the previous basis so the cloud does not mirror
+        top = eigvecs[:, ::-1][:, :self.n_components].T
+        top *= np.where(np.sum(top * self.components, axis=1) < 0, -1.0, 1.0)[:, None]
+        self.mean[:] = mean
+        self.components[:] = top
+        self.scales[:] = 1.0 / np.sqrt(np.maximum(eigvals[::-1][:self.n_components], 1e-12))
+
+    def transform(self, x, out=None):
+        # Whitened projection of (n, d) rows into `out` (n, n_components);
+        # the mean is removed after projecting, on 3 columns instead of d
+        out = np.matmul(x, self.components.T, out=out)
+        out -= self.mean @ self.components.T
+        out *= self.scales
+        return out
+
+
+def key_colors():
+    # (24, 3) RGB per key: hue around the circle of fifths, minor keys darker
+    fifths = [(7 * pc) % 12 for pc in range(12)]
+    rgb = np.empty((24, 3), dtype=np.float32)
+    for pc in range(12):
+        hue = fifths[pc] / 12.0
+        rgb[pc] = colorsys.hsv_to_rgb(hue, 0.55, 1.0)
+        rgb[12 + pc] = colorsys.hsv_to_rgb(hue, 0.7, 0.65)
+    return rgb
+
+
+class EmbeddingCloud:
+    # Bounded 3D point cloud of recent analysis windows for the embedding
+    # view. Raw embeddings live in a capacity-row ring; every update re-
+    # projects them with the current IncrementalPCA basis straight into the
+    # preallocated `pos` and `color` arrays, and returns views of the filled
+    # rows, so the scatter item is fed in place however large the cloud gets.
+    # Points are coloured by their key and fade with age.
+
+    def __init__(self, n_features, capacity=10000, spread=8.0, min_alpha=0.15):
+        self.capacity = capacity
+        self.spread = spread
+        self.pca = IncrementalPCA(n_features)
+        self.features = np.zeros((capacity, n_features), dtype=np.float32)
+        self.pos = np.zeros((capacity, 3), dtype=np.float32)
+        self.color = np.ones((capacity, 4), dtype=np.float32)
+        self.count = 0
+        self._head = 0
+
+        self._key_rgb = key_colors()
+        self._index = np.arange(capacity)
+        self._ages = np.zeros(capacity, dtype=np.int64)
+        # Alpha by age, newest first
+        self._alpha = np.linspace(1.0, min_alpha, capacity, dtype=np.float32)
+
+    def clear(self):
+        self.count = 0
+        self._head = 0
+        self.pca.reset()
+
+    def add(self, embeddings, keys):
+        # (k, n_features) embeddings with the index of each row's key
+        embeddings = np.atleast_2d(embeddings)[-self.capacity:]
+        keys = np.atleast_1d(keys)[-self.capacity:]
+        rows = (self._head + np.arange(len(embeddings))) % self.capacity
+        self.features[rows] = embeddings
+        self.color[rows, :3] = self._key_rgb[keys]
+        self._head = (self._head + len(embeddings)) % self.capacity
+        self.count = min(self.count + len(embeddings), self.capacity)
+        self.pca.partial_fit(embeddings)
+
+    def update(self):
+        # (count, 3) positions and (count, 4) colours, views of the buffers
+        n = self.count
+        pos = self.pca.transform(self.features[:n], out=self.pos[:n])
+        pos *= self.spread / 3.0
+
+        # Row i was written (head - 1 - i) mod capacity additions ago
+        ages = self._ages[:n]
+        np.subtract(self._head - 1, self._index[:n], out=ages)
+        np.mod(ages, self.capacity, out=ages)
+        np.take(self._alpha, ages, out=self.color[:n, 3], mode='clip')
+        return pos, self.color[:n]
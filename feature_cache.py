@@ -0,0 +1,231 @@
+import hashlib
+import json
+import os
+import tempfile
+
+import numpy as np
+
+from audio_io import iter_decoded_blocks
+from features import FEATURE_VERSION, KeyFeatureExtractor
+from streaming_stft import StreamingSTFT
+
+
+# On-disk cache of per-file arrays (STFT frame features, decoded PCM), keyed
+# by a hash of the file's content plus the parameters that produced them, so
+# a renamed or copied recording still hits and an edited one misses. Entries
+# are plain .npy files opened with mmap_mode='r': a hit costs one content
+# hash and no decoding or feature extraction. Least-recently-used entries
+# (by mtime, refreshed on every hit) are evicted to keep the directory under
+# max_bytes. Writes go through a temporary file and os.replace, so several
+# batch worker processes can share one directory.
+
+DEFAULT_CACHE_DIR = os.environ.get(
+    "KEY_FEATURE_CACHE", os.path.join(os.path.expanduser("~"), ".cache", "key_features"))
+
+# (path, size, mtime_ns) -> content digest, so a file is hashed once per process
+_digests = {}
+
+
+def content_digest(path, chunk_size=1 << 20):
+    stat = os.stat(path)
+    memo_key = (os.path.abspath(path), stat.st_size, stat.st_mtime_ns)
+    digest = _digests.get(memo_key)
+    if digest is None:
+        h = hashlib.sha256()
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(chunk_size), b''):
+                h.update(chunk)
+        digest = _digests[memo_key] = h.hexdigest()
+    return digest
+
+
+class FeatureCache:
+    def __init__(self, directory=DEFAULT_CACHE_DIR, max_bytes=1 << 30):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        os.makedirs(directory, exist_ok=True)
+
+    def key(self, path, params):
+        # params must be JSON-serializable; key order does not matter
+        blob = json.dumps({"content": content_digest(path), "params": params}, sort_keys=True)
+        return hashlib.sha256(blob.encode()).hexdigest()[:40]
+
+    def entry_path(self, key):
+        return os.path.join(self.directory, key + ".npy")
+
+    def get(self, path, params):
+        # Read-only memory-mapped array, or None on a miss
+        entry = self.entry_path(self.key(path, params))
+        try:
+            array = np.load(entry, mmap_mode='r')
+        except (FileNotFoundError, ValueError):
+            # Missing, or truncated by a crash before os.replace
+            self.misses += 1
+            return None
+        os.utime(entry)
+        self.hits += 1
+        return array
+
+    def put(self, path, params, array):
+        entry = self.entry_path(self.key(path, params))
+        fd, tmp = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                np.save(f, np.ascontiguousarray(array))
+            os.replace(tmp, entry)
+        except BaseException:
+            os.unlink(tmp)
+            raise
+        # Map before evicting: an entry larger than max_bytes is still returned
+        array = np.load(entry, mmap_mode='r')
+        self.evict()
+        return array
+
+    def stream_writer(self, path, params, dtype=np.float32):
+        # StreamingEntry for a 1-D array written block by block
+        return StreamingEntry(self, self.entry_path(self.key(path, params)), dtype)
+
+    def get_or_compute(self, path, params, compute):
+        array = self.get(path, params)
+        if array is None:
+            array = self.put(path, params, compute())
+        return array
+
+    def entries(self):
+        # (mtime, size, path) of every entry, oldest first
+        found = []
+        with os.scandir(self.directory) as it:
+            for entry in it:
+                if entry.name.endswith(".npy"):
+                    try:
+                        stat = entry.stat()
+                    except FileNotFoundError:
+                        continue
+                    found.append((stat.st_mtime, stat.st_size, entry.path))
+        return sorted(found)
+
+    def size_bytes(self):
+        return sum(size for _, size, _ in self.entries())
+
+    def evict(self):
+        # Drop least-recently-used entries until the cache fits. Open memory
+        # maps of a removed entry stay valid on POSIX.
+        entries = self.entries()
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in entries:
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total -= size
+
+    def clear(self):
+        for _, _, path in self.entries():
+            os.remove(path)
+
+
+class StreamingEntry:
+    # A 1-D cache entry appended to as its data arrives, so a long file can
+    # be cached without ever holding it in memory. The data goes to a
+    # temporary file behind a reserved .npy header; finish() writes the
+    # header for the final length and moves the file into place, abort()
+    # (or exceeding the cache's max_bytes) discards it.
+
+    HEADER_BYTES = 128
+
+    def __init__(self, cache, entry, dtype):
+        self.cache = cache
+        self.entry = entry
+        self.dtype = np.dtype(dtype)
+        self.length = 0
+        fd, self.tmp = tempfile.mkstemp(dir=cache.directory, suffix=".tmp")
+        self.file = os.fdopen(fd, 'wb')
+        self.file.seek(self.HEADER_BYTES)
+
+    def write(self, block):
+        if self.file is None:
+            return
+        if (self.length + len(block)) * self.dtype.itemsize > self.cache.max_bytes:
+            # Would be evicted straight away
+            self.abort()
+            return
+        self.file.write(np.ascontiguousarray(block, dtype=self.dtype).tobytes())
+        self.length += len(block)
+
+    def finish(self):
+        if self.file is None:
+            return
+        header = {"descr": np.lib.format.dtype_to_descr(self.dtype), "fortran_order": False,
+                  "shape": (self.length,)}
+        try:
+            self.file.seek(0)
+            np.lib.format.write_array_header_1_0(self.file, header)
+            if self.file.tell() != self.HEADER_BYTES:
+                raise ValueError(f"unexpected .npy header size {self.file.tell()}")
+            self.file.close()
+            self.file = None
+            os.replace(self.tmp, self.entry)
+        except BaseException:
+            self.abort()
+            raise
+        self.cache.evict()
+
+    def abort(self):
+        if self.file is None:
+            return
+        self.file.close()
+        self.file = None
+        os.unlink(self.tmp)
+
+
+def file_frame_features(path, sample_rate=44100, n_fft=4096, hop_length=1024, cache=None,
+                        block_size=65536, n_mels=40, n_mfcc=13):
+    # (frames, 12 + n_mfcc) KeyFeatureExtractor rows for every STFT frame of
+    # a file decoded at sample_rate, from the cache when it has them.
+    # block_size only bounds decode memory; it does not change the result.
+    params = {"kind": "frame_features", "version": FEATURE_VERSION, "sample_rate": sample_rate,
+              "n_fft": n_fft, "hop_length": hop_length, "n_mels": n_mels, "n_mfcc": n_mfcc}
+
+    def compute():
+        extractor = KeyFeatureExtractor(sample_rate, n_fft, n_mels, n_mfcc)
+        stft = StreamingSTFT(n_fft=n_fft, hop_length=hop_length, history=1, max_bin=1)
+        features = []
+        for block in iter_decoded_blocks(path, sample_rate, block_size=block_size):
+            power = stft.push(block)
+            if len(power):
+                features.append(extractor(power))
+        return np.vstack(features) if features else np.empty((0, extractor.n_features), dtype=np.float32)
+
+    return compute() if cache is None else cache.get_or_compute(path, params, compute)
+
+
+def file_pcm_blocks(path, sample_rate=44100, block_size=1024, cache=None):
+    # Mono float32 blocks of a file decoded at sample_rate. With a cache, a
+    # known file is replayed from its memory-mapped entry with no decoding,
+    # and an unknown one is stream-decoded and written to the cache while
+    # it plays; the entry is only kept if the whole file was decoded. Memory
+    # stays at one block either way. Decoding and hashing happen wherever
+    # the generator is iterated (the playback thread in the GUI).
+    if cache is None:
+        yield from iter_decoded_blocks(path, sample_rate, block_size)
+        return
+    params = {"kind": "pcm", "sample_rate": sample_rate}
+    pcm = cache.get(path, params)
+    if pcm is not None:
+        for start in range(0, len(pcm), block_size):
+            yield pcm[start:start + block_size]
+        return
+
+    writer = cache.stream_writer(path, params)
+    try:
+        for block in iter_decoded_blocks(path, sample_rate, block_size):
+            writer.write(block)
+            yield block
+        writer.finish()
+    finally:
+        # Stopped part-way (or failed): nothing half-decoded is stored
+        writer.abort()
@@ -0,0 +1,118 @@
+import numpy as np
+
+
+def fft_frequencies(sample_rate, n_fft):
+    return np.fft.rfftfreq(n_fft, d=1.0 / sample_rate)
+
+
+def chroma_filterbank(sample_rate, n_fft, fmin=55.0, fmax=2000.0, width=0.3):
+    # (12, n_fft // 2 + 1) matrix mapping a power spectrum onto pitch classes.
+    # Each bin inside [fmin, fmax] spreads its energy over the nearby pitch
+    # classes with a Gaussian of `width` semitones, measured on the circle.
+    freqs = fft_frequencies(sample_rate, n_fft)
+    in_range = (freqs >= fmin) & (freqs <= fmax)
+
+    midi = np.zeros_like(freqs)
+    midi[in_range] = 69.0 + 12.0 * np.log2(freqs[in_range] / 440.0)
+
+    pitch_classes = np.arange(12)[:, None]
+    distance = np.abs((midi[None, :] - pitch_classes + 6.0) % 12.0 - 6.0)
+    weights = np.exp(-0.5 * (distance / width) ** 2)
+    weights[:, ~in_range] = 0.0
+
+    # Equal total weight per bin so low bins (few, wide) do not dominate
+    weights /= weights.sum(axis=0, keepdims=True) + 1e-12
+    return weights.astype(np.float32)
+
+
+class ChromaExtractor:
+    # Per-frame chroma with a preallocated window and filterbank
+
+    def __init__(self, sample_rate=44100, n_fft=4096, fmin=55.0, fmax=2000.0):
+        self.sample_rate = sample_rate
+        self.n_fft = n_fft
+        self.window = np.hanning(n_fft).astype(np.float32)
+        self.filterbank = chroma_filterbank(sample_rate, n_fft, fmin, fmax)
+        self._frame = np.zeros(n_fft, dtype=np.float32)
+
+    def power_spectrum(self, samples):
+        # Windowed power spectrum of the newest n_fft samples (zero-padded if short)
+        n = min(len(samples), self.n_fft)
+        self._frame[:self.n_fft - n] = 0.0
+        self._frame[self.n_fft - n:] = samples[len(samples) - n:]
+        self._frame *= self.window
+        spectrum = np.fft.rfft(self._frame)
+        return spectrum.real ** 2 + spectrum.imag ** 2
+
+    def from_power(self, power):
+        # Works on a single spectrum (n_bins,) or a batch of frames (..., n_bins)
+        return power @ self.filterbank.T
+
+    def __call__(self, samples):
+        return self.from_power(self.power_spectrum(samples))
+
+
+def hz_to_mel(f):
+    return 2595.0 * np.log10(1.0 + np.asarray(f) / 700.0)
+
+
+def mel_to_hz(m):
+    return 700.0 * (10.0 ** (np.asarray(m) / 2595.0) - 1.0)
+
+
+def mel_filterbank(sample_rate, n_fft, n_mels=40, fmin=60.0, fmax=8000.0):
+    # (n_mels, n_fft // 2 + 1) triangular filters, equal area per filter
+    freqs = fft_frequencies(sample_rate, n_fft)
+    edges = mel_to_hz(np.linspace(hz_to_mel(fmin), hz_to_mel(min(fmax, sample_rate / 2)), n_mels + 2))
+    lower, center, upper = edges[:-2, None], edges[1:-1, None], edges[2:, None]
+    rising = (freqs[None, :] - lower) / (center - lower)
+    falling = (upper - freqs[None, :]) / (upper - center)
+    weights = np.maximum(0.0, np.minimum(rising, falling))
+    weights *= (2.0 / (upper - lower))
+    return weights.astype(np.float32)
+
+
+def dct_matrix(n_out, n_in):
+    # Orthonormal DCT-II as a matrix, so MFCCs are one product per batch
+    k = np.arange(n_out)[:, None]
+    n = np.arange(n_in)[None, :]
+    basis = np.cos(np.pi * k * (2 * n + 1) / (2 * n_in)) * np.sqrt(2.0 / n_in)
+    basis[0] /= np.sqrt(2.0)
+    return basis.astype(np.float32)
+
+
+# Version of the KeyFeatureExtractor output. Bump it whenever the features
+# change for the same parameters (filterbanks, DCT, normalisation), so
+# feature_cache entries written by older code stop matching.
+FEATURE_VERSION = 1
+
+
+class KeyFeatureExtractor:
+    # Per-frame [chroma (12, sums to 1) | MFCC (n_mfcc)] features from STFT
+    # power frames, computed for a whole batch of frames with three matrix
+    # products. Used by the student key model and its training script.
+
+    def __init__(self, sample_rate=44100, n_fft=4096, n_mels=40, n_mfcc=13):
+        self.n_mels = n_mels
+        self.n_mfcc = n_mfcc
+        self.chroma_fb = chroma_filterbank(sample_rate, n_fft)
+        self.mel_fb = mel_filterbank(sample_rate, n_fft, n_mels)
+        self.dct = dct_matrix(n_mfcc, n_mels)
+        self.n_features = 12 + n_mfcc
+
+    def __call__(self, power):
+        power = np.atleast_2d(power)
+        chroma = power @ self.chroma_fb.T
+        chroma /= chroma.sum(axis=1, keepdims=True) + 1e-10
+        mfcc = np.log(power @ self.mel_fb.T + 1e-10) @ self.dct.T
+        return np.hstack([chroma, mfcc]).astype(np.float32)
+
+
+def window_means(frame_features, context):
+    # Mean over each run of `context` consecutive frames (one row per window
+    # ending at every frame from context-1 on), via a cumulative sum
+    if len(frame_features) < context:
+        return np.empty((0, frame_features.shape[1]), dtype=np.float32)
+    csum = np.cumsum(frame_features, axis=0, dtype=np.float64)
+    csum = np.vstack([np.zeros((1, frame_features.shape[1])), csum])
+    return ((csum[context:] - csum[:-context]) / context).astype(np.float32)
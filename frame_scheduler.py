@@ -0,0 +1,119 @@
+import math
+import time
+
+
+class FrameTask:
+    def __init__(self, name, callback, period=0.0, dirty=None):
+        self.name = name
+        self.callback = callback
+        # Minimum seconds between runs; 0 runs on every frame
+        self.period = period
+        # Optional callable; a clean task is skipped without redrawing
+        self.dirty = dirty
+        self.last_run = -math.inf
+        self.runs = 0
+        self.skips = 0
+
+
+class FrameScheduler:
+    # One render tick for every panel instead of a timer per panel.
+    #
+    # Frames are paced at an integer multiple (`divider`) of the display
+    # refresh period, so the frame rate divides the refresh rate evenly; the
+    # smallest divider honours target_fps. Ticks come from a timer, so they
+    # are not locked to the vblank phase and drift against it. A frame whose
+    # work takes more than overrun_fraction of its interval backs off by one
+    # more refresh period (down to min_fps); after recover_frames frames with
+    # plenty of headroom it steps back up. Each task runs at most once per
+    # `period` and only when its dirty() check says its data changed.
+    #
+    # Qt-free: the view drives tick() from a single-shot timer re-armed with
+    # next_delay_ms(), and can pass a virtual clock for deterministic replay.
+
+    def __init__(self, refresh_hz=60.0, target_fps=30.0, min_fps=5.0, overrun_fraction=0.75,
+                 recover_frames=30, clock=time.perf_counter):
+        self.refresh_period = 1.0 / (refresh_hz or 60.0)
+        self.min_divider = max(1, math.ceil((refresh_hz or 60.0) / target_fps))
+        self.max_divider = max(self.min_divider, math.floor((refresh_hz or 60.0) / min_fps))
+        self.overrun_fraction = overrun_fraction
+        self.recover_frames = recover_frames
+        self.clock = clock
+        self.tasks = []
+        self.divider = self.min_divider
+        self.reset_stats()
+
+    def add(self, name, callback, period=0.0, dirty=None):
+        task = FrameTask(name, callback, period, dirty)
+        self.tasks.append(task)
+        return task
+
+    @property
+    def interval(self):
+        return self.divider * self.refresh_period
+
+    def reset_stats(self):
+        self.frames = 0
+        self.overruns = 0
+        self.last_frame_time = 0.0
+        self._headroom_frames = 0
+        self._frame_start = None
+        self._fps_frames = 0
+        self._fps_start = self.clock()
+        self.fps = 0.0
+        for task in self.tasks:
+            task.runs = task.skips = 0
+
+    def tick(self):
+        # Run every due, dirty task; returns the seconds of work done
+        start = self.clock()
+        # Half a frame of slack so a period equal to the interval runs every frame
+        slack = 0.5 * self.interval
+        for task in self.tasks:
+            if start - task.last_run < task.period - slack:
+                continue
+            if task.dirty is not None and not task.dirty():
+                # Checked again next frame, so new data is not held back
+                task.skips += 1
+                continue
+            task.last_run = start
+            task.callback()
+            task.runs += 1
+
+        elapsed = self.clock() - start
+        self._frame_start = start
+        self.last_frame_time = elapsed
+        self.frames += 1
+        self._adapt(elapsed)
+
+        self._fps_frames += 1
+        if start - self._fps_start >= 1.0:
+            self.fps = self._fps_frames / (start - self._fps_start)
+            self._fps_frames = 0
+            self._fps_start = start
+        return elapsed
+
+    def _adapt(self, elapsed):
+        if elapsed > self.overrun_fraction * self.interval:
+            self.overruns += 1
+            self._headroom_frames = 0
+            self.divider = min(self.divider + 1, self.max_divider)
+        elif self.divider > self.min_divider and elapsed < 0.4 * (self.divider - 1) * self.refresh_period:
+            # Would still fit comfortably one refresh period sooner
+            self._headroom_frames += 1
+            if self._headroom_frames >= self.recover_frames:
+                self._headroom_frames = 0
+                self.divider -= 1
+        else:
+            self._headroom_frames = 0
+
+    def next_delay_ms(self):
+        # Time left until the next frame boundary after the current tick
+        if self._frame_start is None:
+            return 0
+        remaining = self._frame_start + self.interval - self.clock()
+        return max(0, int(round(remaining * 1000)))
+
+    def format(self):
+        skipped = ", ".join(f"{t.name} {t.skips}" for t in self.tasks if t.skips)
+        return (f"frames {self.fps:4.1f} fps (every {self.divider} refreshes, {self.interval * 1000:.0f} ms)  "
+                f"overruns {self.overruns}  skipped {skipped or 'none'}")
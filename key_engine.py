@@ -0,0 +1,454 @@
+import dataclasses
+import threading
+import time
+
+import numpy as np
+
+from analysis_worker import AnalysisSnapshot, AnalysisWorker, frozen_copy
+from audio_io import MmapWavReader, pcm_to_float32
+from feature_cache import file_pcm_blocks
+from features import KeyFeatureExtractor
+from key_estimation import StreamingKeyEstimator
+from latency import StageLatencies
+from phonation import PhonationClassifier, PhonationFeatureExtractor
+from pitch import StreamingPitchTracker
+from ring_buffer import AudioRingBuffer
+from streaming_stft import StreamingSTFT
+from transport import AudioChunkQueue, SharedAudioRing, run_capture_process
+from vad import VoiceActivityDetector
+from waveform import WaveformDecimator
+
+
+# Headless key identification: capture, buffering, features and key
+# estimation with no Qt dependency. pipeline.py is a view over this module;
+# servers and batch jobs can import it directly (numpy only at import time,
+# sounddevice is imported lazily when live capture starts).
+
+
+def hop_features(power, pitch, phonation_features, chroma_extractor):
+    # Feature extraction for a batch of STFT power frames, shared by
+    # StreamAnalyzer and server.HopAnalyzer so the two cannot drift: F0 and
+    # voicing confidence, phonation features and frame chroma
+    f0, confidence = pitch.push(power)
+    features = phonation_features(power, f0, pitch.periodicity)
+    return f0, confidence, features, chroma_extractor.from_power(power)
+
+
+def update_hop_models(phonation, key_estimator, f0, confidence, features, frame_chroma):
+    # Model stages for frames from hop_features: the phonation classifier,
+    # then the key estimate with each voiced frame weighted by its phonation
+    # type. Returns the key probabilities.
+    voiced = f0 > 0
+    phonation_probs = phonation.update(features, voiced)
+    return key_estimator.update_chroma(frame_chroma, f0, confidence,
+                                       phonation.frame_weights(phonation_probs, voiced))
+
+
+class StreamAnalyzer:
+    # Synchronous per-stream analysis chain: ring buffer -> incremental STFT ->
+    # F0 tracker -> phonation classifier -> chroma key estimator (the teacher),
+    # plus the optional distilled student model over the last `context` frames
+    # of [chroma | MFCC] features. Every stage reads the same STFT power
+    # frames; phonation type weights each frame's share of the key estimate.
+    # Not thread-safe; AnalysisWorker drives it from one thread, batch jobs
+    # call consume() directly.
+    #
+    # channels > 1 keeps the inputs separate (one singer per input): ring,
+    # STFT, key estimator and student model all carry a leading channel axis
+    # and process every channel in the same batched call, and the snapshot
+    # holds one waveform, spectrogram and key distribution per channel.
+    #
+    # With waveform_points set, snapshot waveforms are min/max envelopes of
+    # the newest waveform_size samples at that many columns (the plot's pixel
+    # width), so long display windows cost O(pixels) to publish and draw.
+    #
+    # With vad=True silent chunks (see vad.VoiceActivityDetector) still reach
+    # the waveform ring but skip every spectral stage, and their snapshots
+    # carry the previous analysis unchanged (same arrays, same
+    # analysis_sequence), so the view can skip its heavy redraws too.
+
+    def __init__(self, sample_rate=44100, waveform_size=1000, n_fft=4096, hop_length=1024,
+                 ring_capacity=None, decay=0.975, student_model=None, latencies=None, channels=1,
+                 waveform_points=None, vad=True):
+        self.sample_rate = sample_rate
+        # Optional StageLatencies receiving buffer_update/features/model_update/
+        # inference timings
+        self.latencies = latencies
+        self.waveform_size = waveform_size
+        self.channels = channels
+        multi = channels if channels > 1 else None
+        self.ring = AudioRingBuffer(ring_capacity or max(waveform_size, n_fft) + 8 * hop_length,
+                                    channels=multi)
+        self.stft = StreamingSTFT(n_fft=n_fft, hop_length=hop_length, history=200,
+                                  max_bin=int(5000 * n_fft / sample_rate), channels=multi)
+        # Decay is per STFT frame (0.975 is ~0.6 s memory at 1024-sample
+        # hops); 1.0 accumulates the whole stream, e.g. for a file-level key
+        self.key_estimator = StreamingKeyEstimator(sample_rate=sample_rate, n_fft=n_fft, decay=decay,
+                                                   channels=multi)
+        # Per-frame F0 and voicing, column-aligned with the spectrogram history
+        self.pitch = StreamingPitchTracker(sample_rate=sample_rate, n_fft=n_fft, history=200,
+                                           channels=multi)
+        self.phonation_features = PhonationFeatureExtractor(sample_rate, n_fft)
+        self.phonation = PhonationClassifier(channels=multi)
+        self._multi = multi
+        self.vad = VoiceActivityDetector(hop_length, channels=multi) if vad else None
+        self.active = True
+        self._analysed = None
+        self.decimator = None
+        self.set_waveform_points(waveform_points)
+        self._pcm = np.empty((n_fft,) if multi is None else (n_fft, channels), dtype=np.float32)
+
+        self.student_model = student_model
+        if student_model is not None:
+            self.feature_extractor = KeyFeatureExtractor(sample_rate, n_fft)
+            self.feature_history = np.zeros((student_model.context, channels,
+                                             self.feature_extractor.n_features), dtype=np.float32)
+            self.feature_frames = 0
+
+    def reset(self):
+        self.ring.clear()
+        self.stft.reset()
+        self.pitch.reset()
+        self.phonation.reset()
+        self.key_estimator.reset()
+        if self.vad is not None:
+            self.vad.reset()
+        self.active = True
+        self._analysed = None
+        if self.student_model is not None:
+            self.feature_history.fill(0)
+            self.feature_frames = 0
+
+    def set_waveform_points(self, n_columns):
+        # Swapped in as one new object, so it is safe to call from the view
+        # thread (e.g. on resize) while the worker publishes snapshots
+        if n_columns and self.waveform_size > 2 * n_columns:
+            self.decimator = WaveformDecimator(self.waveform_size, n_columns, channels=self._multi)
+        else:
+            self.decimator = None
+
+    def to_float32(self, samples, out=None):
+        # float32 PCM in this analyzer's layout: mono, or (n, channels)
+        return pcm_to_float32(samples, out=out, channels=self._multi)
+
+    def consume(self, samples):
+        # Accepts float or integer PCM, mono or (n, channels); integer views
+        # are converted here, into a reused scratch buffer. A single analyzer
+        # downmixes; a multi-channel one keeps the channels apart.
+        t0 = time.perf_counter_ns()
+        if len(samples) > len(self._pcm):
+            self._pcm = np.empty((2 * len(samples),) + self._pcm.shape[1:], dtype=np.float32)
+        samples = self.to_float32(samples, out=self._pcm)
+        self.ring.write(samples)
+        t1 = time.perf_counter_ns()
+
+        self.active = self.vad is None or self.vad(samples)
+        if not self.active:
+            if self.latencies is not None:
+                self.latencies.record("buffer_update", time.perf_counter_ns() - t0)
+            return self.stft.skip(samples)
+
+        power_frames = self.stft.push(samples)
+        t2 = t1
+        if power_frames.shape[-2]:
+            # Feature extraction: everything derived from the power frames
+            f0, confidence, features, frame_chroma = hop_features(
+                power_frames, self.pitch, self.phonation_features, self.key_estimator.chroma_extractor)
+            if self.student_model is not None:
+                # Frames of every channel through the extractor as one batch
+                student_features = self.feature_extractor(power_frames.reshape(-1, power_frames.shape[-1]))
+                student_features = student_features.reshape(self.channels, -1, student_features.shape[-1])
+            t2 = time.perf_counter_ns()
+
+            # Model stages: classifier and key / student state updates
+            update_hop_models(self.phonation, self.key_estimator, f0, confidence, features, frame_chroma)
+            if self.student_model is not None:
+                self._append_features(student_features.swapaxes(0, 1))
+
+        if self.latencies is not None:
+            t3 = time.perf_counter_ns()
+            self.latencies.record("buffer_update", t1 - t0)
+            self.latencies.record("features", t2 - t1)
+            if power_frames.shape[-2]:
+                self.latencies.record("model_update", t3 - t2)
+        return power_frames
+
+    def consume_many(self, chunks):
+        # Several queued chunks as one block: one STFT batch instead of a
+        # Python round trip per chunk
+        if len(chunks) == 1:
+            return self.consume(chunks[0])
+        return self.consume(np.concatenate([self.to_float32(chunk) for chunk in chunks]))
+
+    def _append_features(self, features):
+        # Row ring of the newest `context` frames, each (channels, n_features);
+        # order does not matter for the mean
+        context = len(self.feature_history)
+        features = features[-context:]
+        rows = (self.feature_frames + np.arange(len(features))) % context
+        self.feature_history[rows] = features
+        self.feature_frames += len(features)
+
+    def student_outputs(self):
+        # (hidden layer, key probabilities) of the student for the current
+        # window, or (None, None) before the first frame
+        if self.student_model is None or self.feature_frames == 0:
+            return None, None
+        # Until the ring is full only the first feature_frames rows are filled
+        n = min(self.feature_frames, len(self.feature_history))
+        windows = self.feature_history[:n].mean(axis=0)
+        # One batched inference over all channels
+        hidden = self.student_model.hidden(windows)
+        probs = self.student_model.proba_from_hidden(hidden)
+        return (hidden, probs) if self._multi else (hidden[0], probs[0])
+
+    def student_probabilities(self):
+        return self.student_outputs()[1]
+
+    @property
+    def embedding_size(self):
+        # Width of snapshot embeddings: the student's hidden layer, or the
+        # 12-bin decayed chroma without a student
+        return 12 if self.student_model is None else self.student_model.w1.shape[1]
+
+    def key_probabilities(self):
+        return self.key_estimator.probabilities()
+
+    def snapshot(self, sequence, capture_ns):
+        decimator = self.decimator
+        if decimator is None:
+            waveform, waveform_x = self.ring.view(self.waveform_size), None
+        else:
+            waveform, waveform_x = decimator(self.ring.view(self.waveform_size)), decimator.x
+        if not self.active and self._analysed is not None:
+            # Gated silence: only the waveform moved
+            return dataclasses.replace(self._analysed, sequence=sequence, capture_ns=capture_ns,
+                                       samples_processed=self.ring.total_written,
+                                       waveform=frozen_copy(waveform), waveform_x=waveform_x)
+
+        t0 = time.perf_counter_ns()
+        key_probs = self.key_estimator.probabilities()
+        hidden, student_probs = self.student_outputs()
+        embedding = self.key_estimator.chroma if self.student_model is None else hidden
+        pitch = self.pitch.history()
+        if self.latencies is not None:
+            self.latencies.record("inference", time.perf_counter_ns() - t0)
+        self._analysed = AnalysisSnapshot(
+            sequence=sequence,
+            analysis_sequence=sequence,
+            capture_ns=capture_ns,
+            samples_processed=self.ring.total_written,
+            waveform=frozen_copy(waveform),
+            waveform_x=waveform_x,
+            spectrogram=frozen_copy(self.stft.history()),
+            f0=frozen_copy(pitch[0]),
+            voicing=frozen_copy(pitch[1]),
+            phonation=frozen_copy(self.phonation.probs),
+            key_probs=frozen_copy(key_probs),
+            student_probs=None if student_probs is None else frozen_copy(student_probs),
+            embedding=None if embedding is None else frozen_copy(embedding),
+        )
+        return self._analysed
+
+
+def simulated_chunk(frame, size=100):
+    # Synthetic input used by the "Simulated Input" source
+    t = np.linspace(0, 2*np.pi, size)
+    current_t = (frame % 100) * 2*np.pi/100
+    return (np.sin(t + current_t) * 0.5).astype(np.float32)
+
+
+class PlaybackSource(threading.Thread):
+    # Pushes chunks from an iterable into the engine at the pace of a live
+    # input stream (speed=1.0), faster (speed>1) or unpaced (speed=None), so
+    # recordings take exactly the same path as microphone blocks.
+
+    def __init__(self, engine, chunks, sample_rate, speed=1.0):
+        super().__init__(name="audio-playback", daemon=True)
+        self.engine = engine
+        self.chunks = chunks
+        self.sample_rate = sample_rate
+        self.speed = speed
+        self._stop_event = threading.Event()
+
+    def stop(self, timeout=1.0):
+        self._stop_event.set()
+        if self.is_alive() and threading.current_thread() is not self:
+            self.join(timeout)
+
+    def run(self):
+        start = time.perf_counter()
+        pushed = 0
+        for chunk in self.chunks:
+            if self._stop_event.is_set():
+                return
+            if self.speed:
+                # Sleep until this chunk would have been captured
+                due = start + pushed / (self.sample_rate * self.speed)
+                delay = due - time.perf_counter()
+                if delay > 0:
+                    self._stop_event.wait(delay)
+            # Unpaced playback must not outrun analysis, so it waits for room
+            self.engine.push(chunk, block=True if self.speed is None else None)
+            pushed += len(chunk)
+
+
+class KeyIdentificationEngine:
+    # Owns the audio queue, the analysis worker and the optional live capture
+    # stream. push() is safe to call from any single producer thread.
+    # `queue_policy` decides what happens when analysis falls behind (see
+    # transport.AudioChunkQueue); drops and driver overruns are counted there.
+    # transport="shared" swaps the queue for a transport.SharedAudioRing and
+    # runs live capture in its own process; other processes can attach to
+    # the ring by `audio_queue.name` and read the same samples.
+    # channels > 1 captures that many inputs and analyses each separately
+    # (see StreamAnalyzer); snapshots then hold one key distribution per input.
+    # vad=False analyses silence too instead of gating it (see StreamAnalyzer).
+    # With a feature_cache.FeatureCache, recordings that need decoding are
+    # decoded once and replayed from a memory-mapped cache entry.
+    # `latencies` collects per-stage timings from capture to inference; the
+    # view adds paint and end-to-end timings to the same object.
+
+    def __init__(self, sample_rate=44100, block_size=1024, waveform_size=1000, queue_size=32,
+                 queue_policy="drop-oldest", transport="queue", student_model=None, channels=1,
+                 cache=None, waveform_points=None, vad=True):
+        self.sample_rate = sample_rate
+        self.block_size = block_size
+        self.channels = channels
+        self.cache = cache
+        if transport == "shared":
+            self.audio_queue = SharedAudioRing.create(n_slots=queue_size, slot_size=block_size,
+                                                      policy=queue_policy, channels=channels)
+        elif transport == "queue":
+            self.audio_queue = AudioChunkQueue(maxsize=queue_size, policy=queue_policy)
+        else:
+            raise ValueError(f"unknown transport {transport!r}, expected 'queue' or 'shared'")
+        self.transport = transport
+        self.latencies = StageLatencies()
+        self.analyzer = StreamAnalyzer(sample_rate=sample_rate, waveform_size=waveform_size,
+                                       student_model=student_model, latencies=self.latencies,
+                                       channels=channels, waveform_points=waveform_points, vad=vad)
+        self.worker = None
+        self.audio_stream = None
+        self.capture_process = None
+        self.playback = None
+
+    @property
+    def latest(self):
+        # Newest AnalysisSnapshot, or None before the first chunk
+        return self.worker.latest if self.worker is not None else None
+
+    def start(self):
+        if self.worker is None or not self.worker.is_alive():
+            self.worker = AnalysisWorker(self.audio_queue, self.analyzer, latencies=self.latencies)
+            self.worker.start()
+
+    def shutdown(self):
+        self.stop_capture()
+        if self.worker is not None:
+            self.worker.stop()
+        if self.transport == "shared":
+            self.audio_queue.close()
+
+    def reset(self):
+        if self.worker is not None and self.worker.is_alive():
+            self.worker.reset()
+        else:
+            self.analyzer.reset()
+
+    def push(self, samples, capture_ns=None, block=None):
+        # Returns False if a chunk was dropped because analysis is behind;
+        # block=None follows the queue policy, True waits for room instead
+        # (offline sources only)
+        if capture_ns is None:
+            capture_ns = time.perf_counter_ns()
+        return self.audio_queue.put((capture_ns, samples), block=block)
+
+    def wait_for_samples(self, n_samples, timeout=None):
+        # True once analysis has caught up with n_samples pushed samples
+        return self.worker is not None and self.worker.wait_for_samples(n_samples, timeout)
+
+    def transport_stats(self):
+        return self.audio_queue.stats()
+
+    def start_capture(self, device=None):
+        if self.transport == "shared":
+            return self._start_capture_process(device)
+        import sounddevice as sd
+
+        def audio_callback(indata, frames, time_info, status):
+            t0 = time.perf_counter_ns()
+            if status.input_overflow:
+                self.audio_queue.record_overrun()
+            elif status:
+                print(f"Audio status: {status}")
+            # PortAudio reuses indata, so queue a copy
+            self.push(indata[:, 0].copy() if self.channels == 1 else indata.copy(), capture_ns=t0)
+            self.latencies.record("audio_callback", time.perf_counter_ns() - t0)
+
+        self.stop_capture()
+        self.audio_stream = sd.InputStream(
+            callback=audio_callback,
+            device=device,
+            channels=self.channels,
+            samplerate=self.sample_rate,
+            blocksize=self.block_size
+        )
+        self.audio_stream.start()
+
+    def _start_capture_process(self, device=None):
+        # Spawned rather than forked so the child does not inherit Qt/GL state
+        import multiprocessing
+
+        self.stop_capture()
+        context = multiprocessing.get_context("spawn")
+        stop_event = context.Event()
+        process = context.Process(
+            target=run_capture_process, name="audio-capture", daemon=True,
+            args=(self.audio_queue.name, self.sample_rate, self.block_size, device, self.channels,
+                  stop_event))
+        process.start()
+        self.capture_process = (process, stop_event)
+
+    def recording_chunks(self, path, loop=False):
+        # Block iterator for a recording at the engine's sample rate. WAVs at
+        # the engine rate are memory-mapped (zero-copy views in the file's
+        # sample format); anything else (MP3, other rates) is stream-decoded
+        # and resampled on the fly with bounded memory, or, with a cache,
+        # replayed from the cached decode (see feature_cache.file_pcm_blocks).
+        # Nothing is decoded until the iterator is first advanced, so
+        # start_playback does its decoding on the playback thread.
+        if path.lower().endswith('.wav'):
+            reader = MmapWavReader(path)
+            if reader.sample_rate == self.sample_rate:
+                return reader.chunks(self.block_size, loop=loop)
+
+        def decoded():
+            while True:
+                yield from file_pcm_blocks(path, self.sample_rate, self.block_size, cache=self.cache)
+                if not loop:
+                    return
+        return decoded()
+
+    def start_playback(self, path, loop=True, speed=1.0):
+        # Play a recording through the same queue as microphone blocks
+        chunks = self.recording_chunks(path, loop=loop)
+        self.stop_capture()
+        self.playback = PlaybackSource(self, chunks, self.sample_rate, speed=speed)
+        self.playback.start()
+
+    def stop_capture(self):
+        if self.playback is not None:
+            self.playback.stop()
+            self.playback = None
+        if self.audio_stream is not None:
+            self.audio_stream.stop()
+            self.audio_stream.close()
+            self.audio_stream = None
+        if self.capture_process is not None:
+            process, stop_event = self.capture_process
+            stop_event.set()
+            process.join(2.0)
+            if process.is_alive():
+                process.terminate()
+            self.capture_process = None
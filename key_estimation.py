@@ -0,0 +1,176 @@
+from functools import lru_cache
+
+import numpy as np
+
+from features import ChromaExtractor
+from pitch import pitch_class_profile
+
+
+PITCH_CLASSES = ['C', 'C#', 'D', 'D#', 'E', 'F', 'F#', 'G', 'G#', 'A', 'A#', 'B']
+KEY_NAMES = PITCH_CLASSES + [pc + 'm' for pc in PITCH_CLASSES]
+
+# Krumhansl-Kessler probe-tone ratings, tonic first
+MAJOR_PROFILE = np.array([6.35, 2.23, 3.48, 2.33, 4.38, 4.09, 2.52, 5.19, 2.39, 3.66, 2.29, 2.88])
+MINOR_PROFILE = np.array([6.33, 2.68, 3.52, 5.38, 2.60, 3.53, 2.54, 4.75, 3.98, 2.69, 3.34, 3.17])
+
+
+def _zscore(x, axis=-1):
+    x = x - x.mean(axis=axis, keepdims=True)
+    return x / (x.std(axis=axis, keepdims=True) + 1e-12)
+
+
+@lru_cache(maxsize=None)
+def key_profile_matrix():
+    # (24, 12) z-scored profiles for every major then minor key. A dot product
+    # with a z-scored chroma vector / 12 is the Pearson correlation, so all 24
+    # keys are scored with one matrix multiply. Built once and read-only, as
+    # estimators are created per batch of server sessions.
+    major = np.stack([np.roll(MAJOR_PROFILE, k) for k in range(12)])
+    minor = np.stack([np.roll(MINOR_PROFILE, k) for k in range(12)])
+    profiles = (_zscore(np.vstack([major, minor])) / 12.0).astype(np.float32)
+    profiles.setflags(write=False)
+    return profiles
+
+
+def key_correlations(chroma):
+    # Pearson correlation of chroma vectors (..., 12) with all 24 key
+    # profiles, as one matrix product -> (..., 24)
+    return _zscore(np.asarray(chroma, dtype=np.float32)) @ key_profile_matrix().T
+
+
+class StreamingKeyEstimator:
+    # Key estimation from an exponentially decayed chroma vector.
+    #
+    # Each hop contributes the chroma of the newest n_fft samples only; older
+    # hops fade out with `decay`, so the cost per hop is one FFT plus two small
+    # matrix products regardless of how long the session runs.
+    #
+    # With `channels` set there is one chroma state per channel, (channels, 12),
+    # updated from (channels, k, n_bins) power in a single batched pass;
+    # probabilities() is then (channels, 24), one key distribution per input.
+    #
+    # When a pitch tracker's per-frame F0 and voicing confidence are passed
+    # along, each frame's chroma is blended with the sung pitch class, by up
+    # to `pitch_weight` for a fully voiced frame, so the melody counts for
+    # more than the accompaniment around it. Optional per-frame weights (e.g.
+    # phonation.PhonationClassifier.frame_weights) scale each frame's share.
+
+    def __init__(self, sample_rate=44100, n_fft=4096, decay=0.9, temperature=0.1, channels=None,
+                 pitch_weight=0.3):
+        self.sample_rate = sample_rate
+        self.n_fft = n_fft
+        self.decay = decay
+        self.temperature = temperature
+        self.pitch_weight = pitch_weight
+        self.channels = channels
+        self.profiles = key_profile_matrix()
+        lead = () if channels is None else (channels,)
+        self.chroma = np.zeros(lead + (12,), dtype=np.float32)
+        self._probs = np.full(lead + (len(KEY_NAMES),), 1.0 / len(KEY_NAMES))
+        self._chroma_extractor = None
+
+    @property
+    def chroma_extractor(self):
+        # Built on first use: estimators fed precomputed chroma (batch files,
+        # server sessions) never need the filterbank
+        if self._chroma_extractor is None:
+            self._chroma_extractor = ChromaExtractor(self.sample_rate, self.n_fft)
+        return self._chroma_extractor
+
+    def reset(self):
+        self.chroma.fill(0)
+        self._probs.fill(1.0 / len(KEY_NAMES))
+
+    def update(self, samples):
+        # Feed the newest window of audio (e.g. a ring buffer view)
+        return self.update_power(self.chroma_extractor.power_spectrum(samples))
+
+    def update_power(self, power, f0=None, confidence=None, frame_weight=None):
+        # Feed one power spectrum (n_bins,) or several new frames (k, n_bins),
+        # per channel in multi-channel mode, with optional per-frame F0 (Hz)
+        # and voicing confidence from pitch.StreamingPitchTracker
+        if self.channels is not None:
+            return self._update_channels(power, f0, confidence, frame_weight)
+        return self.update_chroma(self.chroma_extractor.from_power(power), f0, confidence, frame_weight)
+
+    def _blend_pitch(self, normalized, f0, confidence):
+        # Mix each unit-sum frame chroma (..., 12) with its F0's pitch class
+        if f0 is None or not self.pitch_weight:
+            return normalized
+        mix = (self.pitch_weight * np.asarray(confidence, dtype=np.float32))[..., None]
+        normalized *= 1.0 - mix
+        normalized += mix * pitch_class_profile(f0)
+        return normalized
+
+    def update_chroma(self, frame_chroma, f0=None, confidence=None, frame_weight=None):
+        # Feed precomputed frame chroma (k, 12), e.g. from a feature cache,
+        # or (channels, k, 12) in multi-channel mode; each frame is
+        # normalized to unit sum before accumulating
+        if self.channels is not None:
+            return self._accumulate_channels(frame_chroma, f0, confidence, frame_weight)
+        frame_chroma = np.atleast_2d(frame_chroma)
+        totals = frame_chroma.sum(axis=1)
+
+        # Silent frames carry no tonal information; keep the current estimate
+        voiced = totals > 1e-10
+        if voiced.any():
+            normalized = frame_chroma[voiced] / totals[voiced, None]
+            if f0 is not None:
+                normalized = self._blend_pitch(normalized, np.atleast_1d(f0)[voiced],
+                                               np.atleast_1d(confidence)[voiced])
+            k = len(normalized)
+            weights = self.decay ** np.arange(k - 1, -1, -1, dtype=np.float32)
+            if frame_weight is not None:
+                weights *= np.atleast_1d(frame_weight)[voiced]
+            self.chroma *= self.decay ** k
+            self.chroma += weights @ normalized
+        return self.probabilities()
+
+    def _update_channels(self, power, f0=None, confidence=None, frame_weight=None):
+        return self._accumulate_channels(self.chroma_extractor.from_power(power), f0, confidence, frame_weight)
+
+    def _accumulate_channels(self, frame_chroma, f0=None, confidence=None, frame_weight=None):
+        if frame_chroma.ndim == 2:
+            frame_chroma = frame_chroma[:, None, :]
+            if f0 is not None:
+                f0, confidence = np.asarray(f0)[:, None], np.asarray(confidence)[:, None]
+            if frame_weight is not None:
+                frame_weight = np.asarray(frame_weight)[:, None]
+        totals = frame_chroma.sum(axis=-1)
+
+        # Same decayed sum as the mono path, but each channel skips its own
+        # silent frames: a voiced frame's weight is decay ** (number of voiced
+        # frames after it in this batch)
+        voiced = totals > 1e-10
+        later = np.cumsum(voiced[:, ::-1], axis=1)[:, ::-1] - voiced
+        weights = np.where(voiced, self.decay ** later.astype(np.float32), 0.0).astype(np.float32)
+        if frame_weight is not None:
+            weights *= frame_weight
+        normalized = frame_chroma / np.where(voiced, totals, 1.0)[..., None]
+        normalized = self._blend_pitch(normalized, f0, confidence)
+        self.chroma *= (self.decay ** voiced.sum(axis=1, dtype=np.float32))[:, None]
+        self.chroma += np.einsum('ck,ckp->cp', weights, normalized)
+        return self.probabilities()
+
+    def correlations(self):
+        if not self.chroma.any():
+            return np.zeros(self.chroma.shape[:-1] + (len(KEY_NAMES),), dtype=np.float32)
+        # A silent channel z-scores to zeros and so scores every key equally
+        return _zscore(self.chroma) @ self.profiles.T
+
+    def probabilities(self):
+        if not self.chroma.any():
+            return self._probs
+        logits = self.correlations() / self.temperature
+        logits -= logits.max(axis=-1, keepdims=True)
+        np.exp(logits, out=logits)
+        self._probs = logits / logits.sum(axis=-1, keepdims=True)
+        return self._probs
+
+    def best_key(self):
+        # (name, probability), or one pair per channel in multi-channel mode
+        probs = self.probabilities()
+        if probs.ndim == 2:
+            return [(KEY_NAMES[i], float(p[i])) for i, p in zip(probs.argmax(axis=1), probs)]
+        idx = int(np.argmax(probs))
+        return KEY_NAMES[idx], float(probs[idx])
@@ -0,0 +1,121 @@
+import numpy as np
+
+
+class LatencyHistogram:
+    # Fixed log-spaced histogram of latencies in milliseconds. Recording is a
+    # single searchsorted + increment, so it is cheap enough for the paint path.
+
+    def __init__(self, min_ms=0.1, max_ms=2000.0, n_bins=40):
+        self.edges = np.geomspace(min_ms, max_ms, n_bins + 1)
+        # One underflow and one overflow bin around the log-spaced range
+        self.counts = np.zeros(n_bins + 2, dtype=np.int64)
+        self.total = 0
+        self.max_ms = 0.0
+
+    def record(self, seconds):
+        ms = seconds * 1000.0
+        self.counts[np.searchsorted(self.edges, ms, side='right')] += 1
+        self.total += 1
+        self.max_ms = max(self.max_ms, ms)
+
+    def reset(self):
+        self.counts.fill(0)
+        self.total = 0
+        self.max_ms = 0.0
+
+    def percentile(self, q):
+        # Upper edge of the bin holding the q-th percentile
+        if self.total == 0:
+            return float('nan')
+        b = int(np.searchsorted(np.cumsum(self.counts), q / 100.0 * self.total))
+        if b < len(self.edges):
+            return min(float(self.edges[b]), self.max_ms)
+        return self.max_ms
+
+    def format(self, width=40):
+        # ASCII rendering of the non-empty bins, for logs
+        if self.total == 0:
+            return "no samples"
+        lines = [f"n={self.total} p50={self.percentile(50):.1f} ms "
+                 f"p95={self.percentile(95):.1f} ms max={self.max_ms:.1f} ms"]
+        lows = np.concatenate([[0.0], self.edges])
+        highs = np.concatenate([self.edges, [np.inf]])
+        peak = self.counts.max()
+        for low, high, count in zip(lows, highs, self.counts):
+            if count:
+                bar = '#' * max(1, int(width * count / peak))
+                lines.append(f"{low:8.1f}-{high:<8.1f} ms {count:6d} {bar}")
+        return "\n".join(lines)
+
+
+class StageLatencies:
+    # Rolling per-stage timings from time.perf_counter_ns() probes. Each stage
+    # keeps the newest `window` samples in a preallocated int64 ring, so
+    # record() is an index store; percentiles are computed only when asked
+    # for (overlay refresh, export). Each stage should be recorded from a
+    # single thread.
+
+    # features: STFT, chroma, MFCC, pitch and phonation features;
+    # model_update: phonation classifier, key estimator and student context
+    # updates per hop; inference: key and student probabilities per snapshot
+    STAGES = ("audio_callback", "queue_dwell", "buffer_update", "features",
+              "model_update", "inference", "paint", "end_to_end")
+
+    def __init__(self, window=2048, stages=STAGES):
+        self.window = window
+        self._samples = {stage: np.zeros(window, dtype=np.int64) for stage in stages}
+        self._counts = dict.fromkeys(stages, 0)
+
+    @property
+    def stages(self):
+        return list(self._samples)
+
+    def record(self, stage, elapsed_ns):
+        count = self._counts[stage]
+        self._samples[stage][count % self.window] = elapsed_ns
+        self._counts[stage] = count + 1
+
+    def reset(self):
+        for stage in self._samples:
+            self._counts[stage] = 0
+
+    def percentiles(self, stage, qs=(50, 95, 99)):
+        # Milliseconds over the rolling window, NaN before the first sample
+        n = min(self._counts[stage], self.window)
+        if n == 0:
+            return [float('nan')] * len(qs)
+        return list(np.percentile(self._samples[stage][:n], qs) / 1e6)
+
+    def summary(self):
+        rows = []
+        for stage in self._samples:
+            p50, p95, p99 = self.percentiles(stage)
+            rows.append({"stage": stage, "count": self._counts[stage],
+                         "p50_ms": p50, "p95_ms": p95, "p99_ms": p99})
+        return rows
+
+    def format(self):
+        lines = [f"{'stage':<15}{'p50':>8}{'p95':>8}{'p99':>8}  ms"]
+        for row in self.summary():
+            lines.append(f"{row['stage']:<15}{row['p50_ms']:>8.2f}{row['p95_ms']:>8.2f}{row['p99_ms']:>8.2f}")
+        return "\n".join(lines)
+
+    def export(self, path):
+        # JSON (summary plus raw rolling samples) or CSV (summary) by extension
+        rows = self.summary()
+        if path.lower().endswith('.csv'):
+            import csv
+            with open(path, 'w', newline='') as f:
+                writer = csv.DictWriter(f, fieldnames=list(rows[0]))
+                writer.writeheader()
+                writer.writerows(rows)
+        else:
+            import json
+            samples = {stage: (self._samples[stage][:min(self._counts[stage], self.window)] / 1e6).tolist()
+                       for stage in self._samples}
+            # Stages without samples export null rather than non-standard NaN
+            rows = [{k: (None if isinstance(v, float) and v != v else v) for k, v in row.items()}
+                    for row in rows]
+            with open(path, 'w') as f:
+                json.dump({"stages": rows, "samples_ms": samples}, f, indent=2)
+        return path
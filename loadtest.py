@@ -0,0 +1,227 @@
+import argparse
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import time
+from collections import deque
+
+import numpy as np
+
+from replay import percentile_ms
+from simulation import PHONATION_MODES, synthetic_voice
+from websocket_protocol import ConnectionClosed, connect
+
+
+# Load test for server.py: many concurrent client stand-ins on one event
+# loop, each streaming PCM over its own WebSocket the way a live capture
+# would (fixed-size chunks, paced at real time unless --speed 0) and timing
+# every reply. Reports connected sessions, hop throughput, reply latency and
+# the server's own /stats. With --spawn a server is started on the port for
+# the duration of the test.
+
+SAMPLE_RATE = 44100
+
+
+def client_audio(index, seconds, path=None):
+    # Float32 mono audio for one client: the file when given, otherwise a
+    # synthetic voice with a per-client phonation type and pitch
+    if path is not None:
+        from audio_io import iter_decoded_blocks
+        blocks = []
+        for block in iter_decoded_blocks(path, SAMPLE_RATE, block_size=65536):
+            blocks.append(block)
+            if sum(len(b) for b in blocks) >= seconds * SAMPLE_RATE:
+                break
+        return np.concatenate(blocks)
+    mode = PHONATION_MODES[index % len(PHONATION_MODES)]
+    f0 = 110.0 * 2.0 ** ((index * 5 % 24) / 12.0)
+    return synthetic_voice(mode, f0, SAMPLE_RATE, seconds=min(seconds, 4.0), rng=index)
+
+
+def encode(chunk, sample_format):
+    if sample_format == "s16":
+        return (np.clip(chunk, -1.0, 1.0 - 1.0 / 32768) * 32768).astype("<i2").tobytes()
+    return chunk.astype("<f4").tobytes()
+
+
+class ClientStats:
+    def __init__(self):
+        self.connected = 0
+        self.failed = 0
+        self.errors = 0
+        self.messages = 0
+        self.hops = 0
+        self.latencies = []
+
+
+async def run_client(host, port, index, audio, stats, seconds, chunk, speed, sample_format, reply_timeout=30.0):
+    try:
+        socket = await connect(host, port, f"/stream?rate={SAMPLE_RATE}&channels=1&format={sample_format}")
+    except (OSError, ConnectionError, asyncio.IncompleteReadError):
+        stats.failed += 1
+        return
+    stats.connected += 1
+    sent = deque()
+
+    async def receive():
+        try:
+            while True:
+                _, payload = await socket.recv()
+                stats.latencies.append(time.perf_counter() - sent.popleft())
+                stats.messages += 1
+                stats.hops += len(json.loads(payload)["hops"])
+        except ConnectionClosed:
+            pass
+
+    receiver = asyncio.create_task(receive())
+    n_chunks = int(seconds * SAMPLE_RATE) // chunk
+    start = time.perf_counter()
+    try:
+        for i in range(n_chunks):
+            if speed > 0:
+                delay = start + i * chunk / SAMPLE_RATE / speed - time.perf_counter()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+            offset = i * chunk % max(1, len(audio) - chunk)
+            sent.append(time.perf_counter())
+            await socket.send(encode(audio[offset:offset + chunk], sample_format))
+        # Wait for the outstanding replies while they keep coming
+        waiting, last = len(sent), time.perf_counter()
+        while sent and not receiver.done() and time.perf_counter() - last < reply_timeout:
+            await asyncio.sleep(0.05)
+            if len(sent) < waiting:
+                waiting, last = len(sent), time.perf_counter()
+        await socket.close()
+    except (ConnectionClosed, ConnectionError):
+        pass
+    finally:
+        receiver.cancel()
+        socket.writer.close()
+    # Messages that never got a reply
+    if sent:
+        stats.errors += 1
+
+
+async def fetch_json(host, port, path):
+    reader, writer = await asyncio.open_connection(host, port)
+    writer.write(f"GET {path} HTTP/1.1\r\nHost: {host}:{port}\r\n\r\n".encode())
+    await writer.drain()
+    response = await reader.read()
+    writer.close()
+    return json.loads(response.split(b"\r\n\r\n", 1)[1])
+
+
+async def wait_for_server(host, port, timeout=30.0):
+    deadline = time.perf_counter() + timeout
+    while True:
+        try:
+            return await fetch_json(host, port, "/health")
+        except (OSError, ValueError):
+            if time.perf_counter() > deadline:
+                raise
+            await asyncio.sleep(0.2)
+
+
+async def run_load(host="127.0.0.1", port=8765, sessions=200, seconds=10.0, chunk=4096, speed=1.0,
+                   sample_format="s16", path=None, ramp=1.0):
+    # Returns a report dict; clients connect spread over `ramp` seconds
+    await wait_for_server(host, port)
+    stats = ClientStats()
+    if path is not None:
+        sources = [client_audio(0, seconds, path)]
+    else:
+        sources = [client_audio(index, seconds) for index in range(min(sessions, 12))]
+    clients = []
+    start = time.perf_counter()
+    for index in range(sessions):
+        audio = sources[index % len(sources)]
+        clients.append(asyncio.create_task(
+            run_client(host, port, index, audio, stats, seconds, chunk, speed, sample_format)))
+        await asyncio.sleep(ramp / sessions)
+    await asyncio.gather(*clients)
+    wall = time.perf_counter() - start
+    server = await fetch_json(host, port, "/stats")
+
+    audio_seconds = stats.hops * 1024 / SAMPLE_RATE
+    return {
+        "sessions": sessions,
+        "connected": stats.connected,
+        "failed": stats.failed,
+        "errors": stats.errors,
+        "messages": stats.messages,
+        "hops": stats.hops,
+        "wall_seconds": wall,
+        "hops_per_second": stats.hops / wall,
+        "realtime_sessions": audio_seconds / wall,
+        "latency_p50_ms": percentile_ms(stats.latencies, 50),
+        "latency_p95_ms": percentile_ms(stats.latencies, 95),
+        "latency_max_ms": percentile_ms(stats.latencies, 100),
+        "server": server,
+    }
+
+
+def format_report(report):
+    lines = [
+        f"sessions   {report['connected']}/{report['sessions']} connected, "
+        f"{report['failed']} refused, {report['errors']} errors",
+        f"throughput {report['hops_per_second']:.0f} hops/s over {report['wall_seconds']:.1f} s "
+        f"({report['realtime_sessions']:.1f} sessions' worth of real time)",
+        f"latency    p50 {report['latency_p50_ms']:.1f} ms  p95 {report['latency_p95_ms']:.1f} ms  "
+        f"max {report['latency_max_ms']:.1f} ms per message",
+    ]
+    server = report["server"]
+    lines.append(f"server     {server['hops_analysed']} hops analysed, {server['hops_gated']} gated, "
+                 f"{server['workers']} workers, {server['errors']} errors")
+    for stage, row in server["latency_ms"].items():
+        lines.append(f"  {stage:<12} p50 {row['p50_ms']} ms  p95 {row['p95_ms']} ms")
+    batching = server["batching"]
+    lines.append(f"batching   max {batching['max_batch']} windows / {batching['max_wait_ms']:g} ms: "
+                 f"{batching['batches']} batches of {batching['mean_size']:.1f} windows "
+                 f"({batching['mean_requests']:.1f} sessions), "
+                 f"{batching['windows_per_busy_second']:.0f} windows per busy second")
+    return "\n".join(lines)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Load-test the key server with local WebSocket clients")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("-n", "--sessions", type=int, default=200)
+    parser.add_argument("--seconds", type=float, default=10.0, help="audio streamed per session")
+    parser.add_argument("--chunk", type=int, default=4096, help="samples per message")
+    parser.add_argument("--speed", type=float, default=1.0,
+                        help="playback speed per client (0 sends as fast as the server replies)")
+    parser.add_argument("--format", choices=("f32", "s16"), default="s16")
+    parser.add_argument("--audio", help="stream this file instead of synthetic voices")
+    parser.add_argument("--spawn", action="store_true", help="start server.py for the test")
+    parser.add_argument("--workers", type=int, default=None, help="analysis workers of a spawned server")
+    parser.add_argument("--max-batch", type=int, default=None, help="micro-batch size of a spawned server")
+    parser.add_argument("--max-wait-ms", type=float, default=None, help="micro-batch wait of a spawned server")
+    parser.add_argument("--json", action="store_true", help="print the report as JSON")
+    args = parser.parse_args(argv)
+
+    server = None
+    if args.spawn:
+        server_script = os.path.join(os.path.dirname(os.path.abspath(__file__)), "server.py")
+        command = [sys.executable, server_script, "--host", args.host, "--port", str(args.port),
+                   "--max-sessions", str(max(1000, args.sessions))]
+        for option, value in (("--workers", args.workers), ("--max-batch", args.max_batch),
+                              ("--max-wait-ms", args.max_wait_ms)):
+            if value is not None:
+                command += [option, str(value)]
+        server = subprocess.Popen(command, stdout=subprocess.DEVNULL)
+    try:
+        report = asyncio.run(run_load(args.host, args.port, args.sessions, args.seconds, args.chunk,
+                                      args.speed, args.format, args.audio))
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait()
+    print(json.dumps(report, indent=2) if args.json else format_report(report))
+    return 0 if report["failed"] == 0 and report["errors"] == 0 else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,173 @@
+import numpy as np
+
+from simulation import PHONATION_MODES
+
+
+# Weight of a frame's chroma in the key estimate by phonation type: breathy
+# and falsetto frames have weak or few harmonics, so their chroma is noisier
+MODE_RELIABILITY = np.array([1.0, 0.7, 0.5, 1.0], dtype=np.float32)
+
+FEATURE_NAMES = ("hnr_db", "tilt_db_per_octave", "h1_h2_db", "cpp_db", "octaves_above_200hz")
+
+# Class means and a shared per-feature spread for (Modal, Falsetto, Breathy,
+# Pressed), measured with PhonationFeatureExtractor at n_fft=4096 on
+# simulation.synthetic_voice, whose harmonic slope, H1-H2 and aspiration
+# noise follow textbook values for each type (octave-band tilt also picks up
+# the noise, which is why breathy and falsetto read flatter than their
+# harmonics). They have not been validated on real voice recordings; the
+# phonation_classifier benchmark scores them on synthetic voices from a
+# perturbed generator, which is only a check of robustness to the textbook
+# values. PhonationClassifier.fit replaces them with estimates from
+# labelled frames.
+DEFAULT_MEANS = np.array([
+    [25.0, -5.0, 4.5, 24.0, 0.0],
+    [18.0, 0.5, 15.0, 16.0, 1.3],
+    [12.0, -2.5, 10.0, 16.5, 0.0],
+    [20.5, -0.5, -1.5, 33.0, 0.0],
+], dtype=np.float32)
+# Wider than the synthetic spread, which real voices exceed
+DEFAULT_SCALES = np.array([3.0, 3.0, 2.0, 3.0, 0.4], dtype=np.float32)
+
+
+class PhonationFeatureExtractor:
+    # Per-frame voice quality features from STFT power frames and the pitch
+    # tracker's F0 and periodicity, for a whole batch of frames at once:
+    #
+    #   hnr_db     harmonic-to-noise ratio, 10 log10(r / (1 - r)) of the
+    #              normalized autocorrelation r at the pitch period
+    #   tilt       slope of octave-band levels from 125 Hz to 8 kHz, dB/octave
+    #   h1_h2      level of the first harmonic minus the second, dB
+    #   cpp        cepstral peak prominence: height of the cepstral peak in
+    #              the pitch range above the regression line under it, dB
+    #   octaves    log2(F0 / 200 Hz), which mostly separates falsetto
+    #
+    # The band levels and the cepstral regression are precomputed matrices,
+    # so apart from one inverse FFT for the cepstrum a batch costs a few
+    # matrix products and gathers.
+
+    def __init__(self, sample_rate=44100, n_fft=4096, fmin=60.0, fmax=1000.0):
+        self.sample_rate = sample_rate
+        self.n_fft = n_fft
+        self.bin_hz = sample_rate / n_fft
+        freqs = np.fft.rfftfreq(n_fft, d=1.0 / sample_rate)
+
+        # Octave bands and the least-squares slope over their centres
+        edges = 125.0 * 2.0 ** np.arange(7)
+        edges = edges[edges <= sample_rate / 2]
+        self.bands = ((freqs[None, :] >= edges[:-1, None]) & (freqs[None, :] < edges[1:, None])).astype(np.float32)
+        octaves = np.arange(len(edges) - 1, dtype=np.float64)
+        centred = octaves - octaves.mean()
+        self._tilt = (centred / (centred ** 2).sum()).astype(np.float32)
+
+        # Quefrency range of the pitch search, and the line fit over it
+        self.min_q = max(2, int(sample_rate / fmax))
+        self.max_q = min(n_fft // 2 - 1, int(np.ceil(sample_rate / fmin)))
+        q = np.arange(self.min_q, self.max_q + 1, dtype=np.float64)
+        design = np.stack([q, np.ones_like(q)], axis=1)
+        self._line_fit = np.linalg.pinv(design).astype(np.float32)
+        self._q = q.astype(np.float32)
+        # Harmonic peaks are searched within +-2 bins of k * F0
+        self._offsets = np.arange(-2, 3)
+        self.n_features = len(FEATURE_NAMES)
+
+    def _harmonic_db(self, power_db, f0, harmonic):
+        centre = np.rint(harmonic * f0 / self.bin_hz).astype(np.int64)
+        index = np.clip(centre[..., None] + self._offsets, 0, power_db.shape[-1] - 1)
+        return np.take_along_axis(power_db, index, axis=-1).max(axis=-1)
+
+    def __call__(self, power, f0, periodicity):
+        # power ([channels,] k, n_bins), f0 and periodicity ([channels,] k)
+        # -> ([channels,] k, n_features); rows of unvoiced frames are zero
+        power_db = 10.0 * np.log10(power + 1e-12)
+
+        r = np.clip(periodicity, 1e-4, 1.0 - 1e-4)
+        hnr = 10.0 * np.log10(r / (1.0 - r))
+
+        band_db = 10.0 * np.log10(power @ self.bands.T + 1e-12)
+        tilt = band_db @ self._tilt
+
+        h1_h2 = self._harmonic_db(power_db, f0, 1) - self._harmonic_db(power_db, f0, 2)
+
+        cepstrum = np.fft.irfft(power_db, n=self.n_fft, axis=-1)[..., self.min_q:self.max_q + 1]
+        cepstrum_db = 20.0 * np.log10(np.abs(cepstrum) + 1e-9).astype(np.float32)
+        slope, intercept = np.moveaxis(cepstrum_db @ self._line_fit.T, -1, 0)
+        peak = np.argmax(cepstrum_db, axis=-1)
+        peak_db = np.take_along_axis(cepstrum_db, peak[..., None], axis=-1)[..., 0]
+        cpp = peak_db - (slope * self._q[peak] + intercept)
+
+        octaves = np.log2(np.maximum(f0, 1.0) / 200.0)
+        features = np.stack([hnr, tilt, h1_h2, cpp, octaves], axis=-1).astype(np.float32)
+        features *= (f0 > 0)[..., None]
+        return features
+
+
+class PhonationClassifier:
+    # Linear discriminant over the five voice quality features: Gaussian
+    # classes with a shared diagonal spread, which reduces to one (n, 5) x
+    # (5, 4) product plus a softmax for a batch of frames. Per-frame
+    # probabilities are smoothed over voiced frames with a per-frame `decay`,
+    # like the key estimator's chroma; unvoiced frames leave the estimate as
+    # it is.
+
+    def __init__(self, means=DEFAULT_MEANS, scales=DEFAULT_SCALES, decay=0.9, channels=None):
+        self.decay = decay
+        self.channels = channels
+        self.set_parameters(means, scales)
+        lead = () if channels is None else (channels,)
+        self.probs = np.full(lead + (len(PHONATION_MODES),), 1.0 / len(PHONATION_MODES), dtype=np.float32)
+
+    def set_parameters(self, means, scales):
+        self.means = np.asarray(means, dtype=np.float32)
+        self.scales = np.asarray(scales, dtype=np.float32)
+        precision = 1.0 / self.scales ** 2
+        self._weights = (self.means * precision).T
+        self._bias = -0.5 * (self.means ** 2 * precision).sum(axis=1)
+
+    @classmethod
+    def fit(cls, features, labels, **kwargs):
+        # Class means and pooled per-feature spread from labelled voiced
+        # frames (labels index PHONATION_MODES)
+        features, labels = np.asarray(features, dtype=np.float64), np.asarray(labels)
+        means = np.stack([features[labels == c].mean(axis=0) for c in range(len(PHONATION_MODES))])
+        scales = np.sqrt(((features - means[labels]) ** 2).mean(axis=0)) + 1e-6
+        return cls(means, scales, **kwargs)
+
+    def reset(self):
+        self.probs.fill(1.0 / len(PHONATION_MODES))
+
+    def frame_probabilities(self, features):
+        # (..., n_features) -> (..., 4) per-frame class probabilities
+        logits = features @ self._weights + self._bias
+        logits -= logits.max(axis=-1, keepdims=True)
+        np.exp(logits, out=logits)
+        logits /= logits.sum(axis=-1, keepdims=True)
+        return logits
+
+    def update(self, features, voiced):
+        # Feed ([channels,] k, n_features) frames with their voicing mask;
+        # returns the per-frame probabilities
+        frame_probs = self.frame_probabilities(features)
+        probs = self.probs if self.channels is not None else self.probs[None]
+        batch = frame_probs if self.channels is not None else frame_probs[None]
+        voiced = voiced if self.channels is not None else voiced[None]
+
+        # Decayed sum over each channel's voiced frames, as in
+        # StreamingKeyEstimator._update_channels
+        later = np.cumsum(voiced[:, ::-1], axis=1)[:, ::-1] - voiced
+        weights = np.where(voiced, self.decay ** later.astype(np.float32), 0.0).astype(np.float32)
+        probs *= (self.decay ** voiced.sum(axis=1, dtype=np.float32))[:, None]
+        probs += (1.0 - self.decay) * np.einsum('ck,ckp->cp', weights, batch)
+        probs /= probs.sum(axis=1, keepdims=True)
+        return frame_probs
+
+    def best_mode(self):
+        # (name, probability), or one pair per channel in multi-channel mode
+        if self.probs.ndim == 2:
+            return [(PHONATION_MODES[i], float(p[i])) for i, p in zip(self.probs.argmax(axis=1), self.probs)]
+        i = int(np.argmax(self.probs))
+        return PHONATION_MODES[i], float(self.probs[i])
+
+    def frame_weights(self, frame_probs, voiced):
+        # Chroma weight per frame for the key estimator; unvoiced frames
+        # (accompaniment, consonants) keep full weight
+        return np.where(voiced, frame_probs @ MODE_RELIABILITY, 1.0).astype(np.float32)
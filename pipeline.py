@@ -1,22 +1,59 @@
+import argparse
+import os
 import sys
 import numpy as np
 import pyqtgraph as pg
-from PyQt5.QtCore import Qt, QTimer, QUrl
+from PyQt5.QtCore import QEvent, Qt, QTimer, QUrl
 from PyQt5.QtWidgets import (QApplication, QMainWindow, QWidget, QVBoxLayout, QHBoxLayout, 
-                             QLabel, QComboBox, QPushButton, QSizePolicy, QGridLayout, QFrame)
+                             QLabel, QComboBox, QPushButton, QSizePolicy, QGridLayout, QFrame,
+                             QFileDialog)
 from PyQt5.QtGui import QColor, QPalette, QFont, QIcon
 import pyqtgraph.opengl as gl
-from scipy.io import wavfile
-from scipy.signal import stft
-from librosa.feature import mfcc, chroma_stft
-import librosa
-import queue
-import sounddevice as sd
+import time
+
+from embedding import EmbeddingCloud
+from feature_cache import DEFAULT_CACHE_DIR, FeatureCache
+from frame_scheduler import FrameScheduler
+from key_engine import KeyIdentificationEngine, simulated_chunk
+from key_estimation import KEY_NAMES
+from latency import LatencyHistogram
+from simulation import PHONATION_MODES, DistillationCurves, PhonationSpectrogramModel
+from student_model import load_default_model
+from transport import AudioChunkQueue
+
+SAMPLE_RECORDING = os.path.join(os.path.dirname(os.path.abspath(__file__)), "tmpx80dlm25.wav")
+
+# Sources that deliver real audio blocks through the engine's capture path
+CAPTURED_SOURCES = ("Sample Recording", "Live Microphone Input")
+
+# Per-singer colours in multi-channel mode (cycled beyond eight inputs)
+SINGER_COLORS = ('#89b4fa', '#a6e3a1', '#fab387', '#f5c2e7', '#94e2d5', '#f9e2af', '#cba6f7', '#eba0ac')
 
 class RealTimeKeyIdentificationViz(QMainWindow):
-    def __init__(self):
+    def __init__(self, recording=SAMPLE_RECORDING, queue_policy="drop-oldest", transport="queue",
+                 channels=1, cache=None, waveform_seconds=None, seed=None, clock=time.perf_counter,
+                 vad=True):
         super().__init__()
         
+        # File played by the "Sample Recording" source (WAV or MP3)
+        self.recording = recording
+        # What the audio queue does when analysis falls behind
+        self.queue_policy = queue_policy
+        # "shared" captures in a separate process over shared memory
+        self.transport = transport
+        # Input channels analysed separately, one singer per channel
+        self.channels = channels
+        # Optional FeatureCache so recordings are only decoded once
+        self.cache = cache
+        # Skip spectral analysis and heavy redraws while the input is silent
+        self.vad = vad
+        # Length of the waveform panel; None shows the newest 1000 samples
+        self.waveform_seconds = waveform_seconds
+        # Seed for the simulated panels and the frame scheduler's clock; offline
+        # replay passes a fixed seed and a virtual clock to make runs repeatable
+        self.seed = seed
+        self.clock = clock
+        
         # Setup UI
         self.setWindowTitle("Real-Time Vocal Key Identification System")
         self.setMinimumSize(1200, 800)
@@ -83,7 +120,7 @@ class RealTimeKeyIdentificationViz(QMainWindow):
         # Setup data and state
         self.setup_data()
         
-        # Setup timers for animations
+        # Single frame scheduler driving every panel
         self.setup_timers()
         
     def create_header(self):
@@ -177,7 +214,16 @@ class RealTimeKeyIdentificationViz(QMainWindow):
         self.flow_plot.setBackground('#313244')
         self.flow_plot.hideAxis('left')
         self.flow_plot.hideAxis('bottom')
-        data_flow_layout.addWidget(self.flow_plot)
+        
+        # Latency budget overlay (rolling per-stage p50/p95/p99)
+        self.latency_label = QLabel()
+        self.latency_label.setStyleSheet("font-family: monospace; font-size: 11px; color: #a6e3a1;")
+        self.latency_label.setAlignment(Qt.AlignTop | Qt.AlignLeft)
+        
+        flow_row = QHBoxLayout()
+        flow_row.addWidget(self.flow_plot, stretch=1)
+        flow_row.addWidget(self.latency_label)
+        data_flow_layout.addLayout(flow_row)
         
         self.main_layout.addWidget(data_flow_frame)
     
@@ -216,11 +262,18 @@ class RealTimeKeyIdentificationViz(QMainWindow):
             "Pressed"
         ])
         self.phonation_combo.currentIndexChanged.connect(self.change_phonation_mode)
+        # Recorded and live audio are classified automatically; the selector
+        # then follows the detected type
+        self.phonation_combo.setEnabled(self.audio_source_combo.currentText() not in CAPTURED_SOURCES)
         
         # Create start/stop button
         self.start_stop_btn = QPushButton("Start Visualization")
         self.start_stop_btn.clicked.connect(self.toggle_visualization)
         
+        # Export the per-stage latency measurements (JSON or CSV)
+        self.export_latency_btn = QPushButton("Export Latency")
+        self.export_latency_btn.clicked.connect(self.export_latency)
+        
         # Add widgets to layout
         controls_layout.addWidget(viz_mode_label)
         controls_layout.addWidget(self.viz_mode_combo)
@@ -232,6 +285,7 @@ class RealTimeKeyIdentificationViz(QMainWindow):
         controls_layout.addWidget(self.phonation_combo)
         controls_layout.addSpacing(20)
         controls_layout.addWidget(self.start_stop_btn)
+        controls_layout.addWidget(self.export_latency_btn)
         
         self.main_layout.addWidget(controls_frame)
     
@@ -240,8 +294,29 @@ class RealTimeKeyIdentificationViz(QMainWindow):
         self.is_running = False
         self.current_frame = 0
         self.audio_data = np.sin(np.linspace(0, 10 * np.pi, 1000)) * 0.5
-        self.buffer_size = 1000
-        self.audio_buffer = np.zeros(self.buffer_size)
+        self.sample_rate = 44100
+        self.buffer_size = int(self.waveform_seconds * self.sample_rate) if self.waveform_seconds else 1000
+        self.block_size = 1024
+        
+        # Headless capture/analysis engine; this window only paints its snapshots
+        # The distilled student model is optional; without trained weights the
+        # teacher/student panels fall back to the simulated curves
+        self.engine = KeyIdentificationEngine(sample_rate=self.sample_rate, block_size=self.block_size,
+                                              waveform_size=self.buffer_size,
+                                              queue_policy=self.queue_policy,
+                                              transport=self.transport,
+                                              channels=self.channels,
+                                              cache=self.cache,
+                                              vad=self.vad,
+                                              student_model=load_default_model())
+        self.painted_sequence = 0
+        # Newest analysis painted; silent (VAD-gated) snapshots repeat it
+        self.painted_analysis = 0
+        # Drops and overruns already logged, so each new loss is reported once
+        self.reported_losses = 0
+        
+        # Capture-to-paint latency of every painted snapshot
+        self.latency_histogram = LatencyHistogram()
         
         # Setup data structures for visualization
         self.setup_input_viz()
@@ -252,14 +327,35 @@ class RealTimeKeyIdentificationViz(QMainWindow):
         self.setup_embedding_viz()
         self.setup_flow_viz()
         
-        # Audio processing queue
-        self.audio_queue = queue.Queue(maxsize=10)
+    @property
+    def audio_buffer(self):
+        # Waveform of the latest analysis snapshot (read-only)
+        snapshot = self.engine.latest
+        if snapshot is None:
+            return np.zeros(self.buffer_size)
+        return snapshot.waveform
         
     def setup_input_viz(self):
         # Raw audio input waveform
         self.input_curve = self.input_plot.plot(self.audio_buffer, pen=pg.mkPen(color='#89b4fa', width=2))
+        self.input_plot.setXRange(0, self.buffer_size, padding=0)
+        # Long windows arrive as min/max envelopes at the plot's pixel width
+        self.input_plot.getViewBox().sigResized.connect(self.update_waveform_resolution)
+        # Further singers in multi-channel mode, one curve each
+        self.extra_input_curves = [
+            self.input_plot.plot(np.zeros(self.buffer_size),
+                                 pen=pg.mkPen(color=SINGER_COLORS[c % len(SINGER_COLORS)], width=1))
+            for c in range(1, self.channels)
+        ]
+        
+    def update_waveform_resolution(self):
+        width = int(self.input_plot.getViewBox().width())
+        self.engine.analyzer.set_waveform_points(max(width, 1))
         
     def setup_teacher_viz(self):
+        # Preallocated teacher/soft-target/student curves
+        self.distillation_curves = DistillationCurves(n_points=100, seed=self.seed)
+        
         # Representation of high-dimensional embeddings
         teacher_x = np.linspace(0, 100, 100)
         teacher_y = np.zeros(100)
@@ -279,6 +375,9 @@ class RealTimeKeyIdentificationViz(QMainWindow):
                                                    pen=pg.mkPen(color='#a6e3a1', width=2))
     
     def setup_phonation_viz(self):
+        # Simulated phonation spectrograms (cached harmonic bases per mode)
+        self.phonation_model = PhonationSpectrogramModel(n_time=100, n_freq=100, seed=self.seed)
+        
         # Phonation features visualization (as spectrogram)
         phonation_img = np.zeros((100, 100))
         self.phonation_img_item = pg.ImageItem(phonation_img)
@@ -290,14 +389,32 @@ class RealTimeKeyIdentificationViz(QMainWindow):
         color_map = pg.ColorMap(position, colors)
         self.phonation_img_item.setLookupTable(color_map.getLookupTable(0.0, 1.0, 256))
         
+        # Tracked F0 over the real spectrogram, one trace per singer; gaps
+        # where the voice is unvoiced
+        self.f0_curves = []
+        for c in range(self.channels):
+            curve = pg.PlotCurveItem(pen=pg.mkPen(color=SINGER_COLORS[c % len(SINGER_COLORS)], width=2),
+                                     connect='finite')
+            self.phonation_plot.addItem(curve)
+            self.f0_curves.append(curve)
+        
     def setup_output_viz(self):
-        # Key prediction visualization
-        keys = ['C', 'C#', 'D', 'D#', 'E', 'F', 'F#', 'G', 'G#', 'A', 'A#', 'B']
+        # Key prediction visualization (12 major then 12 minor keys)
+        keys = KEY_NAMES
         x = np.arange(len(keys))
         y = np.zeros(len(keys))
         
-        self.output_bars = pg.BarGraphItem(x=x, height=y, width=0.6, brush='#b4befe')
-        self.output_plot.addItem(self.output_bars)
+        # One bar series per singer, side by side within each key
+        if self.channels > 1:
+            self.output_plot.addLegend()
+        width = 0.6 / self.channels
+        self.output_bars = []
+        for c in range(self.channels):
+            offset = (c - (self.channels - 1) / 2) * width
+            brush = '#b4befe' if self.channels == 1 else SINGER_COLORS[c % len(SINGER_COLORS)]
+            bars = pg.BarGraphItem(x=x + offset, height=y, width=width, brush=brush, name=f"Singer {c + 1}")
+            self.output_plot.addItem(bars)
+            self.output_bars.append(bars)
         self.output_plot.setYRange(0, 1)
         self.output_plot.setXRange(-0.5, len(keys) - 0.5)
         
@@ -313,16 +430,13 @@ class RealTimeKeyIdentificationViz(QMainWindow):
         gx.setSpacing(5, 5, 5)
         self.embedding_view.addItem(gx)
         
-        # Create scatter points for embeddings
-        pos = np.random.normal(size=(100, 3))
-        size = np.random.random(100) * 0.5 + 0.5
-        color = np.zeros((100, 4))
-        color[:, 0] = np.linspace(0.3, 0.9, 100)  # Red
-        color[:, 1] = np.linspace(0.2, 0.7, 100)  # Green
-        color[:, 2] = 1.0  # Blue
-        color[:, 3] = 0.8  # Alpha
-        
-        self.embedding_scatter = gl.GLScatterPlotItem(pos=pos, size=size, color=color)
+        # Embeddings of recent analysis windows (student hidden layer, or
+        # chroma without a student), projected to 3D by incremental PCA into
+        # the cloud's preallocated position/colour arrays
+        self.embedding_cloud = EmbeddingCloud(self.engine.analyzer.embedding_size, capacity=10000)
+        self.embedded_sequence = 0
+        pos, color = self.embedding_cloud.update()
+        self.embedding_scatter = gl.GLScatterPlotItem(pos=pos, size=4, color=color)
         self.embedding_view.addItem(self.embedding_scatter)
     
     def setup_flow_viz(self):
@@ -372,50 +486,111 @@ class RealTimeKeyIdentificationViz(QMainWindow):
             self.flow_markers.append(marker)
     
     def setup_timers(self):
-        # Main animation timer
-        self.animation_timer = QTimer()
-        self.animation_timer.timeout.connect(self.update_visualization)
-        
-        # Flow animation timer
-        self.flow_timer = QTimer()
-        self.flow_timer.timeout.connect(self.update_flow)
-        
-        # Audio processing timer
-        self.audio_timer = QTimer()
-        self.audio_timer.timeout.connect(self.process_audio)
-        
-        # 3D embedding animation timer
-        self.embedding_timer = QTimer()
-        self.embedding_timer.timeout.connect(self.update_embeddings)
+        # One frame tick for all panels at a multiple of the refresh period;
+        # each task only runs when its data changed, and the frame rate backs
+        # off on overruns
+        screen = QApplication.primaryScreen()
+        refresh_hz = screen.refreshRate() if screen is not None else 60.0
+        self.frame_scheduler = FrameScheduler(refresh_hz=refresh_hz, target_fps=20.0, clock=self.clock)
+        self.frame_scheduler.add("audio", self.process_audio, period=0.1,
+                                 dirty=lambda: self.audio_source_combo.currentText() not in CAPTURED_SOURCES)
+        self.frame_scheduler.add("paint", self.update_visualization, dirty=self.paint_dirty)
+        self.frame_scheduler.add("embedding", self.update_embeddings, period=0.05,
+                                 dirty=self.embedding_dirty)
+        self.frame_scheduler.add("flow", self.update_flow, period=0.2)
+        
+        self.frame_timer = QTimer()
+        self.frame_timer.setTimerType(Qt.PreciseTimer)
+        self.frame_timer.setSingleShot(True)
+        self.frame_timer.timeout.connect(self.render_frame)
+    
+    def render_frame(self):
+        if not self.is_running:
+            return
+        self.frame_scheduler.tick()
+        # Paused while minimized; changeEvent restarts the loop
+        if not self.isMinimized():
+            self.frame_timer.start(self.frame_scheduler.next_delay_ms())
+    
+    def paint_dirty(self):
+        # New snapshot to blit, or simulated panels that animate every frame
+        snapshot = self.engine.latest
+        if snapshot is None or snapshot.sequence != self.painted_sequence:
+            return True
+        return (snapshot.student_probs is None
+                or self.audio_source_combo.currentText() not in CAPTURED_SOURCES)
+    
+    def embedding_dirty(self):
+        snapshot = self.engine.latest
+        return snapshot is not None and snapshot.analysis_sequence != self.embedded_sequence
+    
+    def changeEvent(self, event):
+        # Stop rendering while minimized (analysis keeps running)
+        if event.type() == QEvent.WindowStateChange and self.is_running:
+            if self.isMinimized():
+                self.frame_timer.stop()
+            elif not self.frame_timer.isActive():
+                self.frame_timer.start(0)
+        super().changeEvent(event)
     
     def toggle_visualization(self):
         if not self.is_running:
-            self.is_running = True
-            self.start_stop_btn.setText("Stop Visualization")
-            
-            # Start timers
-            self.animation_timer.start(50)  # 20 fps
-            self.flow_timer.start(200)      # Flow updates
-            self.audio_timer.start(100)     # Audio processing
-            self.embedding_timer.start(50)  # Embedding animation
-            
-            # Start audio if needed
-            if self.audio_source_combo.currentText() == "Live Microphone Input":
-                self.start_audio_capture()
+            self.start_session()
         else:
-            self.is_running = False
-            self.start_stop_btn.setText("Start Visualization")
-            
-            # Stop timers
-            self.animation_timer.stop()
-            self.flow_timer.stop()
-            self.audio_timer.stop()
-            self.embedding_timer.stop()
+            self.stop_session()
+    
+    def start_session(self, live=True):
+        # live=False leaves the render loop and audio input to the caller
+        # (offline replay ticks frames and pushes blocks itself)
+        self.is_running = True
+        self.start_stop_btn.setText("Stop Visualization")
+        
+        # Analysis runs on its own thread; the frames only paint snapshots
+        self.engine.start()
+        self.latency_histogram.reset()
+        self.engine.latencies.reset()
+        self.engine.audio_queue.reset_stats()
+        if self.engine.analyzer.vad is not None:
+            self.engine.analyzer.vad.reset_stats()
+        self.reported_losses = 0
+        self.frame_scheduler.reset_stats()
+        
+        if live:
+            # Start the render loop
+            self.frame_timer.start(0)
             
-            # Stop audio if needed
-            if hasattr(self, 'audio_stream') and self.audio_stream:
-                self.audio_stream.stop()
-                self.audio_stream.close()
+            # Start audio if needed
+            self.start_audio_capture()
+    
+    def stop_session(self, report=True):
+        self.is_running = False
+        self.start_stop_btn.setText("Start Visualization")
+        
+        # Stop the render loop
+        self.frame_timer.stop()
+        
+        # Stop audio if needed
+        self.engine.stop_capture()
+        
+        if report:
+            print("Capture-to-paint latency:")
+            print(self.latency_histogram.format())
+            print(self.engine.latencies.format())
+            print(self.engine.audio_queue.format())
+            if self.engine.analyzer.vad is not None:
+                print(self.engine.analyzer.vad.format())
+            print(self.frame_scheduler.format())
+    
+    def closeEvent(self, event):
+        self.engine.shutdown()
+        super().closeEvent(event)
+    
+    def export_latency(self):
+        path, _ = QFileDialog.getSaveFileName(self, "Export Latency", "latency_report.json",
+                                              "JSON (*.json);;CSV (*.csv)")
+        if path:
+            self.engine.latencies.export(path)
+            print(f"Latency report written to {path}")
     
     def change_viz_mode(self):
         # Change visualization mode based on selection
@@ -427,16 +602,20 @@ class RealTimeKeyIdentificationViz(QMainWindow):
         source = self.audio_source_combo.currentText()
         print(f"Audio source changed to: {source}")
         
-        # Reset audio data
-        self.audio_buffer = np.zeros(self.buffer_size)
-        self.input_curve.setData(self.audio_buffer)
-        
-        # Handle live microphone initialization if running
-        if self.is_running and source == "Live Microphone Input":
+        # Reset audio data (the worker clears its state before the next chunk)
+        self.engine.reset()
+        self.input_curve.setData(np.zeros(self.buffer_size))
+        for curve in self.extra_input_curves:
+            curve.setData(np.zeros(self.buffer_size))
+        self.embedding_cloud.clear()
+        self.phonation_combo.setEnabled(source not in CAPTURED_SOURCES)
+        self.phonation_plot.setTitle("Phonation Features")
+        
+        # Restart capture/playback for the new source if running
+        if self.is_running:
             self.start_audio_capture()
-        elif hasattr(self, 'audio_stream') and self.audio_stream:
-            self.audio_stream.stop()
-            self.audio_stream.close()
+        else:
+            self.engine.stop_capture()
     
     def change_phonation_mode(self):
         # Change phonation mode based on selection
@@ -444,25 +623,15 @@ class RealTimeKeyIdentificationViz(QMainWindow):
         print(f"Phonation mode changed to: {mode}")
     
     def start_audio_capture(self):
-        # Setup audio capture from microphone
-        def audio_callback(indata, frames, time, status):
-            if status:
-                print(f"Audio status: {status}")
-            # Convert to mono and put in queue
-            audio_mono = np.mean(indata, axis=1)
-            try:
-                self.audio_queue.put_nowait(audio_mono)
-            except queue.Full:
-                pass  # Queue is full, skip this frame
-        
+        # Setup audio capture from the microphone or a memory-mapped recording
+        source = self.audio_source_combo.currentText()
         try:
-            self.audio_stream = sd.InputStream(
-                callback=audio_callback,
-                channels=1,
-                samplerate=44100,
-                blocksize=1024
-            )
-            self.audio_stream.start()
+            if source == "Live Microphone Input":
+                self.engine.start_capture()
+            elif source == "Sample Recording":
+                self.engine.start_playback(self.recording, loop=True)
+            else:
+                self.engine.stop_capture()
         except Exception as e:
             print(f"Error starting audio stream: {e}")
     
@@ -472,66 +641,112 @@ class RealTimeKeyIdentificationViz(QMainWindow):
             
         audio_source = self.audio_source_combo.currentText()
         
-        if audio_source == "Live Microphone Input":
-            # Process audio from microphone queue
-            try:
-                audio_chunk = self.audio_queue.get_nowait()
-                # Update buffer with new data (rolling window)
-                self.audio_buffer = np.roll(self.audio_buffer, -len(audio_chunk))
-                self.audio_buffer[-len(audio_chunk):] = audio_chunk
-            except queue.Empty:
-                pass  # No new audio data
-        else:
-            # Simulated audio
-            t = np.linspace(0, 2*np.pi, 100)
-            current_t = (self.current_frame % 100) * 2*np.pi/100
-            new_chunk = np.sin(t + current_t) * 0.5
-            
-            if audio_source == "Samle Recording":
-                # Add some harmonic components to simulate a recording
-                new_chunk += np.sin(2*t + current_t*1.3) * 0.3
-                new_chunk += np.sin(3*t + current_t*0.7) * 0.15
-            
-            # Update buffer with new data (rolling window)
-            chunk_size = len(new_chunk)
-            self.audio_buffer = np.roll(self.audio_buffer, -chunk_size)
-            self.audio_buffer[-chunk_size:] = new_chunk
+        # Microphone and recording blocks are pushed by the engine's capture path
+        if audio_source not in CAPTURED_SOURCES:
+            # Simulated audio, handed to the engine like a captured block
+            self.engine.push(simulated_chunk(self.current_frame))
     
     def update_visualization(self):
         if not self.is_running:
             return
+        
+        paint_start = time.perf_counter_ns()
             
         # Update frame counter
         self.current_frame += 1
         
-        # Update input visualization
-        self.input_curve.setData(self.audio_buffer)
-        
+        # Blit the newest analysis snapshot, if one arrived since the last paint
+        snapshot = self.engine.latest
+        new_snapshot = snapshot is not None and snapshot.sequence != self.painted_sequence
+        if new_snapshot:
+            self.painted_sequence = snapshot.sequence
+            # Raw samples, or a min/max envelope with its sample positions
+            waveforms = np.atleast_2d(snapshot.waveform)
+            x = snapshot.waveform_x
+            for curve, waveform in zip([self.input_curve] + self.extra_input_curves, waveforms):
+                if x is None:
+                    curve.setData(waveform)
+                else:
+                    curve.setData(x, waveform)
+        
+        # Spectrogram, F0 and key panels only redraw for new analysis
+        new_analysis = new_snapshot and snapshot.analysis_sequence != self.painted_analysis
+        if new_analysis:
+            self.painted_analysis = snapshot.analysis_sequence
+            if self.audio_source_combo.currentText() in CAPTURED_SOURCES:
+                # Real spectrogram history (time x frequency), singers stacked
+                # along the frequency axis
+                spectrogram = snapshot.spectrogram
+                self.phonation_img_item.setImage(spectrogram.reshape(-1, spectrogram.shape[-1]).T)
+                self.update_f0_overlay(snapshot, spectrogram.shape[-2])
+                self.update_detected_phonation(snapshot)
+            for bars, probs in zip(self.output_bars, np.atleast_2d(self.generate_key_prediction())):
+                bars.setOpts(height=probs)
+            if snapshot.student_probs is not None:
+                # Teacher (chroma key estimator) vs distilled student key
+                # distributions, for the first singer in multi-channel mode.
+                # The student's soft targets came from a centred multi-second
+                # context that a live stream cannot see, so that curve is
+                # hidden rather than repeating the teacher.
+                keys = np.arange(len(KEY_NAMES))
+                self.teacher_curve.setData(keys, np.atleast_2d(snapshot.key_probs)[0])
+                self.soft_targets_curve.setVisible(False)
+                self.student_curve.setData(keys, np.atleast_2d(snapshot.student_probs)[0])
+        
+        if snapshot is None or snapshot.student_probs is None:
+            self.update_simulated_distillation()
+        
+        self.update_phonation_viz()
+        
+        paint_end = time.perf_counter_ns()
+        self.engine.latencies.record("paint", paint_end - paint_start)
+        if new_snapshot:
+            # Capture-to-paint for each snapshot, counted once
+            self.engine.latencies.record("end_to_end", paint_end - snapshot.capture_ns)
+            self.latency_histogram.record((paint_end - snapshot.capture_ns) / 1e9)
+    
+    def update_simulated_distillation(self):
         # Update teacher model visualization (high-dim embeddings projection)
-        t = np.linspace(0, 4*np.pi, 100)
-        teacher_y = np.sin(t + self.current_frame/10) * 0.5 + np.sin(2*t + self.current_frame/8) * 0.3
+        # and student model visualization (knowledge distillation); all three
+        # curves share one base signal, updated in place
+        t = self.distillation_curves.t
+        teacher_y, soft_targets, student_preds = self.distillation_curves.update(self.current_frame)
         self.teacher_curve.setData(t, teacher_y)
-        
-        # Update student model visualization (knowledge distillation)
-        # Soft targets (teacher outputs)
-        soft_targets = np.sin(t + self.current_frame/10) * 0.5 + np.sin(2*t + self.current_frame/8) * 0.3
-        soft_targets += np.random.normal(0, 0.05, size=len(t))  # Add noise
-        
-        # Student predictions (trying to match teacher)
-        student_preds = np.sin(t + self.current_frame/10) * 0.5 + np.sin(2*t + self.current_frame/8) * 0.3
-        student_preds += np.random.normal(0, 0.15, size=len(t))  # Add more noise
-        
+        self.soft_targets_curve.setVisible(True)
         self.soft_targets_curve.setData(t, soft_targets)
         self.student_curve.setData(t, student_preds)
-        
-        # Update phonation visualization
-        phonation_mode = self.phonation_combo.currentText()
-        spec = self.generate_phonation_spectrogram(phonation_mode)
-        self.phonation_img_item.setImage(spec.T)
-        
-        # Update key prediction visualization
-        key_probs = self.generate_key_prediction()
-        self.output_bars.setOpts(height=key_probs)
+    
+    def update_phonation_viz(self):
+        # Update simulated phonation visualization (real audio uses the snapshot)
+        if self.audio_source_combo.currentText() not in CAPTURED_SOURCES:
+            phonation_mode = self.phonation_combo.currentText()
+            spec = self.generate_phonation_spectrogram(phonation_mode)
+            self.phonation_img_item.setImage(spec.T)
+            for curve in self.f0_curves:
+                curve.setData([], [])
+    
+    def update_detected_phonation(self, snapshot):
+        # Classified phonation type per singer in the panel title; the
+        # selector shows the first singer's
+        if snapshot.phonation is None:
+            return
+        probs = np.atleast_2d(snapshot.phonation)
+        modes = probs.argmax(axis=1)
+        self.phonation_combo.blockSignals(True)
+        self.phonation_combo.setCurrentIndex(int(modes[0]))
+        self.phonation_combo.blockSignals(False)
+        self.phonation_plot.setTitle("Phonation Features: " + "  ".join(
+            f"{PHONATION_MODES[m]} {p[m]:.0%}" for m, p in zip(modes, probs)))
+    
+    def update_f0_overlay(self, snapshot, n_bins):
+        # F0 in spectrogram bin units, each singer offset to its own band
+        if snapshot.f0 is None:
+            return
+        bin_hz = self.engine.sample_rate / self.engine.analyzer.stft.n_fft
+        x = np.arange(snapshot.f0.shape[-1]) + 0.5
+        for c, (curve, f0) in enumerate(zip(self.f0_curves, np.atleast_2d(snapshot.f0))):
+            y = np.where(f0 > 0, f0 / bin_hz + c * n_bins, np.nan)
+            curve.setData(x, y)
     
     def update_flow(self):
         if not self.is_running:
@@ -548,100 +763,109 @@ class RealTimeKeyIdentificationViz(QMainWindow):
             else:
                 # Data point is outside the pipeline
                 marker.setData([-2], [0])  # Hide it outside view
+        
+        # Refresh the latency budget and transport overlay
+        audio_queue = self.engine.audio_queue
+        lines = [self.engine.latencies.format(), audio_queue.format()]
+        if self.engine.analyzer.vad is not None:
+            lines.append(self.engine.analyzer.vad.format())
+        lines.append(self.frame_scheduler.format())
+        worker = self.engine.worker
+        if worker is not None and worker.error is not None:
+            # The panels hold the last good snapshot; say why
+            lines.append(f"analysis failed {worker.failures} times, last: {worker.error}")
+        self.latency_label.setText("\n".join(lines))
+        
+        # Log whenever analysis has fallen behind since the last refresh
+        losses = audio_queue.dropped_chunks + audio_queue.overruns
+        if losses > self.reported_losses:
+            self.reported_losses = losses
+            print(f"Analysis falling behind: {audio_queue.format()}")
     
     def update_embeddings(self):
         if not self.is_running:
             return
             
-        # Update 3D embedding visualization
-        # Rotate current points
-        pos = self.embedding_scatter.pos()
-        
-        # Apply rotation and small random movement
-        angle = self.current_frame * 0.01
-        rotation = np.array([
-            [np.cos(angle), -np.sin(angle), 0],
-            [np.sin(angle), np.cos(angle), 0],
-            [0, 0, 1]
-        ])
-        
-        new_pos = np.dot(pos, rotation)
-        new_pos += np.random.normal(0, 0.1, size=new_pos.shape)  # Add small random movement
-        
-        # Update scatter plot
-        self.embedding_scatter.setData(pos=new_pos)
+        # Add the newest window's embedding (one point per singer), coloured
+        # by its key; silent windows have no embedding worth plotting
+        snapshot = self.engine.latest
+        if snapshot is not None and snapshot.analysis_sequence != self.embedded_sequence:
+            self.embedded_sequence = snapshot.analysis_sequence
+            if snapshot.embedding is not None and snapshot.embedding.any():
+                keys = np.atleast_2d(snapshot.key_probs).argmax(axis=1)
+                self.embedding_cloud.add(np.atleast_2d(snapshot.embedding), keys)
+        
+        # Re-project the cloud in place and slowly orbit the camera
+        pos, color = self.embedding_cloud.update()
+        self.embedding_scatter.setData(pos=pos, color=color)
+        self.embedding_view.orbit(0.3, 0)
     
     def generate_phonation_spectrogram(self, mode):
         # Generate different spectrograms based on phonation mode
-        t = np.linspace(0, 10, 100)
-        spec = np.zeros((100, 100))
-        
-        if mode == "Modal":
-            # Strong fundamental, balanced harmonics
-            for i in range(100):
-                harmonic_strength = np.exp(-i/20)
-                freq = i / 2
-                spec[:, i] = np.sin(2*np.pi*freq*t + self.current_frame/10) * harmonic_strength
-        
-        elif mode == "Falsetto":
-            # Weaker fundamental, stronger high harmonics, narrower bandwidth
-            for i in range(100):
-                if i < 20:
-                    harmonic_strength = np.exp(-(i-20)**2/200)
-                else:
-                    harmonic_strength = np.exp(-(i-50)**2/500)
-                freq = i / 1.5
-                spec[:, i] = np.sin(2*np.pi*freq*t + self.current_frame/10) * harmonic_strength
-        
-        elif mode == "Breathy":
-            # More noise, weaker harmonics
-            for i in range(100):
-                harmonic_strength = np.exp(-i/30) * 0.6
-                freq = i / 2
-                spec[:, i] = np.sin(2*np.pi*freq*t + self.current_frame/10) * harmonic_strength
-            
-            # Add noise
-            spec += np.random.normal(0, 0.2, size=spec.shape)
-            
-        elif mode == "Pressed":
-            # Stronger harmonics, more energy
-            for i in range(100):
-                harmonic_strength = np.exp(-i/15) * 1.2
-                if i % 2 == 0:  # Emphasize even harmonics
-                    harmonic_strength *= 1.3
-                freq = i / 2
-                spec[:, i] = np.sin(2*np.pi*freq*t + self.current_frame/10) * harmonic_strength
-        
-        # Add time-varying component
-        modulation = np.sin(self.current_frame / 20)
-        spec *= (1 + modulation * 0.2)
-        
-        # Normalize
-        spec = (spec - spec.min()) / (spec.max() - spec.min() + 1e-9)
-        return spec
+        return self.phonation_model.render(mode, self.current_frame)
     
     def generate_key_prediction(self):
-        # Generate simulated key prediction probabilities
-        keys = ['C', 'C#', 'D', 'D#', 'E', 'F', 'F#', 'G', 'G#', 'A', 'A#', 'B']
-        probs = np.zeros(len(keys))
-        
-        # Make a primary prediction that shifts over time
-        primary_idx = (self.current_frame // 100) % len(keys)
-        probs[primary_idx] = 0.7 + 0.2 * np.sin(self.current_frame / 30)
-        
-        # Add probability to neighboring keys
-        for i in range(len(keys)):
-            distance = min(abs(i - primary_idx), len(keys) - abs(i - primary_idx))
-            if distance > 0:
-                probs[i] = max(0, 0.6 - distance * 0.15) * (0.8 + 0.2 * np.sin(self.current_frame / 20 + i))
-        
-        # Normalize
-        return probs / (probs.sum() + 1e-9)
+        # Key probabilities from the latest analysis snapshot (one row per
+        # singer in multi-channel mode)
+        snapshot = self.engine.latest
+        if snapshot is None:
+            shape = (self.channels, len(KEY_NAMES)) if self.channels > 1 else len(KEY_NAMES)
+            return np.full(shape, 1.0 / len(KEY_NAMES))
+        return snapshot.key_probs
 
 def main():
-    app = QApplication(sys.argv)
-    window = RealTimeKeyIdentificationViz()
+    parser = argparse.ArgumentParser(description="Real-Time Vocal Key Identification System")
+    parser.add_argument("--recording", default=SAMPLE_RECORDING,
+                        help="audio file played by the Sample Recording source")
+    parser.add_argument("--queue-policy", default="drop-oldest", choices=AudioChunkQueue.POLICIES,
+                        help="what the audio queue does when analysis falls behind")
+    parser.add_argument("--transport", default="queue", choices=("queue", "shared"),
+                        help="in-process queue, or shared memory with capture in its own process")
+    parser.add_argument("--channels", type=int, default=1,
+                        help="input channels analysed separately, one singer each (default: 1, mixed down)")
+    parser.add_argument("--cache-dir", default=DEFAULT_CACHE_DIR,
+                        help="where decoded recordings are cached for replay")
+    parser.add_argument("--no-cache", action="store_true",
+                        help="decode recordings on every replay")
+    parser.add_argument("--waveform-seconds", type=float, default=None,
+                        help="length of the waveform panel (default: the newest 1000 samples)")
+    parser.add_argument("--no-vad", action="store_true",
+                        help="analyse silent input too instead of skipping it")
+    parser.add_argument("--replay", metavar="PATH",
+                        help="replay a recording faster than real time on a virtual clock, "
+                             "print throughput and frame times, and exit")
+    parser.add_argument("--replay-seconds", type=float, default=None,
+                        help="stop the replay after this much audio")
+    parser.add_argument("--seed", type=int, default=None,
+                        help="seed for the simulated panels (replays are repeatable with a fixed seed)")
+    parser.add_argument("--offscreen", action="store_true",
+                        help="render with Qt's offscreen platform (no display needed)")
+    args, qt_args = parser.parse_known_args()
+    
+    if args.offscreen:
+        # Must be set before the QApplication is created
+        os.environ["QT_QPA_PLATFORM"] = "offscreen"
+    app = QApplication(sys.argv[:1] + qt_args)
+    clock = time.perf_counter
+    if args.replay:
+        from replay import VirtualClock
+        clock = VirtualClock()
+    window = RealTimeKeyIdentificationViz(recording=args.recording, queue_policy=args.queue_policy,
+                                          transport=args.transport, channels=args.channels,
+                                          cache=None if args.no_cache else FeatureCache(args.cache_dir),
+                                          waveform_seconds=args.waveform_seconds, seed=args.seed,
+                                          clock=clock, vad=not args.no_vad)
     window.show()
+    if args.replay:
+        from replay import format_report, run_replay
+        report = run_replay(window, app, args.replay, max_seconds=args.replay_seconds)
+        print(format_report(report))
+        print(window.engine.latencies.format())
+        print(window.engine.audio_queue.format())
+        if window.engine.analyzer.vad is not None:
+            print(window.engine.analyzer.vad.format())
+        window.close()
+        return
     sys.exit(app.exec_())
 
 if __name__ == "__main__":
@@ -0,0 +1,141 @@
+import numpy as np
+
+
+def pitch_class_profile(f0, width=0.5):
+    # (..., 12) pitch-class distribution of F0 values in Hz: a Gaussian of
+    # `width` semitones around each pitch, on the circle, summing to 1.
+    # Unvoiced frames (f0 <= 0) give all zeros.
+    f0 = np.asarray(f0, dtype=np.float32)
+    voiced = f0 > 0
+    midi = 69.0 + 12.0 * np.log2(np.where(voiced, f0, 440.0) / 440.0)
+    distance = np.abs((midi[..., None] - np.arange(12) + 6.0) % 12.0 - 6.0)
+    profile = np.exp(-0.5 * (distance / width) ** 2)
+    profile /= profile.sum(axis=-1, keepdims=True)
+    profile *= voiced[..., None]
+    return profile.astype(np.float32)
+
+
+class StreamingPitchTracker:
+    # YIN-style F0 tracker that works on the STFT's power frames, so the
+    # spectrum is computed once for key, student and pitch analysis.
+    #
+    # The inverse FFT of a power frame is the autocorrelation of the
+    # windowed frame (Wiener-Khinchin). Dividing by the window's own
+    # autocorrelation undoes the taper (Boersma 1993), 1 - r(tau)/r(0) is
+    # the YIN difference function under a stationarity assumption, and the
+    # cumulative-mean normalization and absolute threshold follow YIN. Every
+    # step is a vectorized operation over (channels, frames, lags), and the
+    # per-frame F0 / voicing confidence history is kept like the STFT's
+    # spectrogram history (doubled, so it is one contiguous slice) with the
+    # same columns.
+    #
+    # Lags past fmin are never needed, and with a Hann window the circular
+    # wrap-around of an unpadded n_fft frame is negligible there.
+
+    def __init__(self, sample_rate=44100, n_fft=4096, fmin=60.0, fmax=1000.0, threshold=0.15,
+                 silence=1e-6, history=200, channels=None):
+        self.sample_rate = sample_rate
+        self.n_fft = n_fft
+        self.threshold = threshold
+        self.min_lag = max(2, int(sample_rate / fmax))
+        self.max_lag = min(n_fft // 2 - 2, int(np.ceil(sample_rate / fmin)))
+        # Frame energy (r(0) of the windowed frame) below which it is unvoiced
+        self.silence = silence * n_fft
+        self.channels = channels
+        self._lead = () if channels is None else (channels,)
+
+        n_lags = self.max_lag + 2
+        window = np.hanning(n_fft)
+        window_acf = np.fft.irfft(np.abs(np.fft.rfft(window)) ** 2, n=n_fft)[:n_lags]
+        # 1 / (normalized window autocorrelation), applied per lag
+        self._window_gain = (window_acf[0] / window_acf).astype(np.float32)
+        self._lags = np.arange(n_lags)
+        self._tau = np.arange(n_lags, dtype=np.float32)
+        self._tau[0] = 1.0
+        self._search = (self._lags >= self.min_lag) & (self._lags <= self.max_lag)
+
+        self.f0 = np.zeros(self._lead, dtype=np.float32)
+        self.confidence = np.zeros(self._lead, dtype=np.float32)
+        # Normalized autocorrelation at the chosen lag for each frame of the
+        # last push (the harmonic-to-noise ratio's periodicity, Boersma 1993)
+        self.periodicity = np.empty(self._lead + (0,), dtype=np.float32)
+        self.history_len = history
+        self._history = np.zeros((2,) + self._lead + (2 * history,), dtype=np.float32)
+        self._head = 0
+
+    def reset(self):
+        self.f0.fill(0)
+        self.confidence.fill(0)
+        self._history.fill(0)
+        self._head = 0
+
+    def push(self, power):
+        # power: ([channels,] k, n_bins) STFT frames. Returns (f0 Hz,
+        # confidence in [0, 1]), each ([channels,] k); unvoiced frames are 0
+        if power.shape[-2] == 0:
+            empty = np.empty(power.shape[:-1], dtype=np.float32)
+            self.periodicity = empty
+            return empty, empty
+        n_lags = len(self._lags)
+        acf = np.fft.irfft(power, n=self.n_fft, axis=-1)[..., :n_lags].astype(np.float32)
+        energy = acf[..., :1].copy()
+
+        # Difference function d(tau) = 1 - r(tau) / r(0), taper removed
+        diff = acf
+        diff *= self._window_gain
+        diff /= energy + 1e-20
+        np.subtract(1.0, diff, out=diff)
+
+        # Cumulative mean normalized difference, d'(0) = 1
+        cumulative = np.cumsum(diff, axis=-1)
+        cumulative[..., 0] = 1.0
+        diff *= self._tau
+        diff /= np.maximum(cumulative, 1e-12)
+        diff[..., 0] = 1.0
+
+        # First lag in range under the threshold, then the bottom of that dip;
+        # frames that never dip below it take the global minimum, unvoiced
+        below = (diff < self.threshold) & self._search
+        dipped = below.any(axis=-1)
+        first = np.argmax(below, axis=-1)[..., None]
+        after = ~below & (self._lags > first)
+        end = np.where(after.any(axis=-1), np.argmax(after, axis=-1), n_lags)[..., None]
+        in_dip = np.where(dipped[..., None], (self._lags >= first) & (self._lags < end), self._search)
+        best = np.argmin(np.where(in_dip, diff, np.inf), axis=-1)
+
+        # Parabolic interpolation around the chosen lag
+        left = np.take_along_axis(diff, (best - 1)[..., None], axis=-1)[..., 0]
+        centre = np.take_along_axis(diff, best[..., None], axis=-1)[..., 0]
+        right = np.take_along_axis(diff, (best + 1)[..., None], axis=-1)[..., 0]
+        curvature = left - 2 * centre + right
+        shift = np.where(curvature > 0, 0.5 * (left - right) / np.where(curvature > 0, curvature, 1.0), 0.0)
+        shift = np.clip(shift, -0.5, 0.5)
+
+        # Undo the normalization at the chosen lag: r(tau)/r(0) = 1 - d(tau)
+        raw = centre * np.take_along_axis(cumulative, best[..., None], axis=-1)[..., 0] / self._tau[best]
+        self.periodicity = np.clip(1.0 - raw, 0.0, 1.0).astype(np.float32)
+
+        voiced = dipped & (energy[..., 0] > self.silence)
+        f0 = np.where(voiced, self.sample_rate / (best + shift), 0.0).astype(np.float32)
+        confidence = np.where(voiced, np.clip(1.0 - centre, 0.0, 1.0), 0.0).astype(np.float32)
+        self._append_history(f0, confidence)
+        self.f0[...] = f0[..., -1]
+        self.confidence[...] = confidence[..., -1]
+        return f0, confidence
+
+    def _append_history(self, f0, confidence):
+        k = f0.shape[-1]
+        if k > self.history_len:
+            f0, confidence = f0[..., -self.history_len:], confidence[..., -self.history_len:]
+            self._head = (self._head + k - self.history_len) % self.history_len
+            k = self.history_len
+        columns = (self._head + np.arange(k)) % self.history_len
+        for row, values in enumerate((f0, confidence)):
+            self._history[row][..., columns] = values
+            self._history[row][..., columns + self.history_len] = values
+        self._head = (self._head + k) % self.history_len
+
+    def history(self):
+        # Zero-copy (2, [channels,] history) view of F0 and confidence,
+        # oldest column first, aligned with StreamingSTFT.history()
+        return self._history[..., self._head:self._head + self.history_len]
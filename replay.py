@@ -0,0 +1,99 @@
+import time
+
+import numpy as np
+
+from key_estimation import KEY_NAMES
+
+
+# Offline replay: a recording is pushed through the same engine.push ->
+# queue -> AnalysisWorker -> snapshot -> paint path as live capture, but the
+# render loop is driven frame by frame against a virtual clock instead of a
+# Qt timer. Before each frame the audio due by that frame's virtual time is
+# pushed and analysis is waited on, so every run over the same file (with a
+# fixed seed for the simulated panels) paints the same frames however fast
+# the machine is, and runs as much faster than real time as it can.
+
+
+class VirtualClock:
+    # Callable stand-in for time.perf_counter that only moves when advanced
+    def __init__(self, start=0.0):
+        self.now = start
+
+    def __call__(self):
+        return self.now
+
+    def advance(self, seconds):
+        self.now += seconds
+
+
+def percentile_ms(times, q):
+    return float(np.percentile(times, q)) * 1000 if len(times) else 0.0
+
+
+def run_replay(window, app, path, max_seconds=None, timeout=10.0):
+    # Replays `path` through a RealTimeKeyIdentificationViz built with a
+    # VirtualClock (pass clock=VirtualClock() to the window). Returns a dict
+    # with the audio seconds processed per wall second and per-frame paint
+    # times in real milliseconds.
+    engine = window.engine
+    scheduler = window.frame_scheduler
+    clock = scheduler.clock
+    if not isinstance(clock, VirtualClock):
+        raise ValueError("replay needs a window built with clock=VirtualClock()")
+
+    window.audio_source_combo.setCurrentText("Sample Recording")
+    window.start_session(live=False)
+    chunks = engine.recording_chunks(path, loop=False)
+    limit = None if max_seconds is None else int(max_seconds * engine.sample_rate)
+
+    pushed = 0
+    frame_times = []
+    exhausted = False
+    start = time.perf_counter()
+    while not exhausted:
+        # Frames follow the scheduler's own interval
+        clock.advance(scheduler.interval)
+        due = int(round(clock() * engine.sample_rate))
+        if limit is not None:
+            due = min(due, limit)
+        while pushed < due:
+            chunk = next(chunks, None)
+            if chunk is None:
+                break
+            engine.push(chunk, block=True)
+            pushed += len(chunk)
+        exhausted = pushed < due or (limit is not None and pushed >= limit)
+        if not engine.wait_for_samples(pushed, timeout):
+            error = engine.worker.error if engine.worker is not None else None
+            raise TimeoutError(f"analysis did not reach {pushed} samples within {timeout} s"
+                               + (f" (last error: {error})" if error else ""))
+
+        frame_start = time.perf_counter()
+        scheduler.tick()
+        app.processEvents()
+        frame_times.append(time.perf_counter() - frame_start)
+    wall = time.perf_counter() - start
+    window.stop_session(report=False)
+
+    # Final key per singer
+    snapshot = engine.latest
+    keys = ([KEY_NAMES[i] for i in np.atleast_2d(snapshot.key_probs).argmax(axis=-1)]
+            if snapshot is not None else [])
+    audio_seconds = pushed / engine.sample_rate
+    return {
+        "audio_seconds": audio_seconds,
+        "wall_seconds": wall,
+        "realtime_factor": audio_seconds / wall if wall else 0.0,
+        "frames": len(frame_times),
+        "frame_p50_ms": percentile_ms(frame_times, 50),
+        "frame_p95_ms": percentile_ms(frame_times, 95),
+        "frame_max_ms": max(frame_times, default=0.0) * 1000,
+        "keys": keys,
+    }
+
+
+def format_report(report):
+    return (f"replayed {report['audio_seconds']:.1f} s of audio in {report['wall_seconds']:.2f} s "
+            f"({report['realtime_factor']:.1f}x real time), {report['frames']} frames  "
+            f"frame p50 {report['frame_p50_ms']:.1f} ms  p95 {report['frame_p95_ms']:.1f} ms  "
+            f"max {report['frame_max_ms']:.1f} ms  key {'/'.join(report['keys']) or '-'}")
@@ -0,0 +1,86 @@
+import numpy as np
+
+
+class AudioRingBuffer:
+    # Preallocated single-producer/single-consumer ring buffer for audio samples.
+    #
+    # Samples are stored twice (at p and p + capacity) so the most recent n
+    # samples are always one contiguous slice of the storage. Writes cost
+    # O(chunk) and reads return zero-copy views, so there is no np.roll-style
+    # copy of the whole buffer on every chunk.
+    #
+    # The producer only advances `_head`/`_written` after the samples have been
+    # stored, so a consumer on another thread never sees a half-written chunk.
+    # A view of n samples stays valid until capacity - n further samples have
+    # been written; size the capacity with that headroom in mind.
+    #
+    # With `channels` set, storage is (channels, 2 * capacity): write() takes
+    # interleaved (n, channels) chunks and views are (channels, n).
+
+    def __init__(self, capacity, dtype=np.float32, channels=None):
+        if capacity <= 0:
+            raise ValueError("capacity must be positive")
+        self.capacity = int(capacity)
+        self.dtype = np.dtype(dtype)
+        self.channels = channels
+        shape = (2 * self.capacity,) if channels is None else (channels, 2 * self.capacity)
+        self._data = np.zeros(shape, dtype=self.dtype)
+        self._head = 0
+        self._written = 0
+
+    def __len__(self):
+        return min(self._written, self.capacity)
+
+    @property
+    def total_written(self):
+        # Monotonic sample counter; consumers use it to detect new data
+        return self._written
+
+    def write(self, chunk):
+        chunk = np.asarray(chunk)
+        n = len(chunk)
+        if n == 0:
+            return
+        if n > self.capacity:
+            # Only the newest `capacity` samples can be kept
+            self._written += n - self.capacity
+            chunk = chunk[-self.capacity:]
+            n = self.capacity
+        if self.channels is not None:
+            # Time on the last axis, like the storage
+            chunk = chunk.T
+
+        cap = self.capacity
+        head = self._head
+        first = min(n, cap - head)
+
+        # Primary copy and its mirror; at most two slices each
+        self._data[..., head:head + first] = chunk[..., :first]
+        self._data[..., head + cap:head + cap + first] = chunk[..., :first]
+        if first < n:
+            rest = n - first
+            self._data[..., :rest] = chunk[..., first:]
+            self._data[..., cap:cap + rest] = chunk[..., first:]
+
+        # Publish only after the data is in place
+        self._head = (head + n) % cap
+        self._written += n
+
+    def view(self, n=None):
+        # Zero-copy view of the newest n samples in chronological order
+        if n is None:
+            n = self.capacity
+        if n > self.capacity:
+            raise ValueError("requested window is larger than the ring capacity")
+        end = self._head + self.capacity
+        return self._data[..., end - n:end]
+
+    def read_into(self, out):
+        # Copy the newest out.shape[-1] samples into a caller-owned array
+        out[:] = self.view(out.shape[-1])
+        return out
+
+    def clear(self):
+        self._data.fill(0)
+        self._head = 0
+        self._written = 0
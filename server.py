@@ -0,0 +1,439 @@
+import argparse
+import asyncio
+import json
+import os
+import signal
+import time
+from concurrent.futures import ProcessPoolExecutor
+from urllib.parse import parse_qs, urlsplit
+
+import numpy as np
+
+from audio_io import StreamingResampler, pcm_to_float32
+from batching import MicroBatcher
+from features import ChromaExtractor
+from key_engine import hop_features, update_hop_models
+from key_estimation import KEY_NAMES, StreamingKeyEstimator
+from latency import StageLatencies
+from phonation import PhonationClassifier, PhonationFeatureExtractor
+from pitch import StreamingPitchTracker
+from ring_buffer import AudioRingBuffer
+from simulation import PHONATION_MODES
+from vad import VoiceActivityDetector
+from websocket_protocol import (INTERNAL_ERROR, TEXT, UNSUPPORTED_DATA, ConnectionClosed, WebSocket,
+                                handshake_response, http_response, is_upgrade, read_http_request)
+
+
+# Local streaming key detection server (asyncio, no web framework).
+#
+#   ws://HOST:PORT/stream?rate=44100&channels=1&format=f32
+#       Send binary messages of interleaved little-endian PCM (format f32 or
+#       s16, any rate; it is resampled to 44.1 kHz). Every message is answered
+#       with one JSON text message holding a result per completed 1024-sample
+#       hop: key distribution, phonation type, F0 and voicing. Send the text
+#       message "reset" to start the key estimate over.
+#   GET /health, GET /stats
+#       Session count, and throughput and per-stage latency as JSON.
+#
+# The analysis is the headless StreamAnalyzer chain (STFT -> F0 -> phonation
+# -> key), split so that every connection only holds a 4096-sample ring of
+# its newest audio, its VAD state and the small key / phonation accumulators
+# (about 35 kB). The spectral work and the accumulator updates run in a
+# process pool, on micro-batches of the windows pending from all sessions
+# (see batching.MicroBatcher), as calls that take and return that state, so
+# the event loop only frames, gates, batches and serializes.
+
+SAMPLE_RATE = 44100
+N_FFT = 4096
+HOP_LENGTH = 1024
+FORMATS = {"f32": np.dtype("<f4"), "s16": np.dtype("<i2")}
+
+# Per worker process; see init_worker
+_hop_analyzer = None
+
+
+def _scatter(values, counts, hops):
+    # Rows of a concatenated (n, ...) batch into a (sessions, hops, ...)
+    # grid, zero past each session's own hop count
+    grid = np.zeros((len(counts), hops) + values.shape[1:], dtype=values.dtype)
+    starts = np.cumsum(counts) - counts
+    rows = np.repeat(np.arange(len(counts)), counts)
+    grid[rows, np.arange(len(values)) - starts[rows]] = values
+    return grid
+
+
+class HopAnalyzer:
+    # The per-hop analysis of StreamAnalyzer for frames cut by sessions,
+    # batched across them, through the same key_engine.hop_features and
+    # update_hop_models stages: the frames of every session in the batch go
+    # through one rfft and one pass of hop_features. The sessions' key and
+    # phonation states are then stacked as the channels of a multi-channel
+    # estimator and classifier and advanced hop by hop with
+    # update_hop_models, so every hop gets its own distribution; sessions
+    # with fewer hops are padded with silent, unvoiced frames, which leave
+    # their state as it is.
+
+    def __init__(self, sample_rate=SAMPLE_RATE, n_fft=N_FFT, decay=0.975):
+        self.sample_rate = sample_rate
+        self.n_fft = n_fft
+        self.decay = decay
+        self.window = np.hanning(n_fft).astype(np.float32)
+        self.chroma = ChromaExtractor(sample_rate, n_fft)
+        self.pitch = StreamingPitchTracker(sample_rate, n_fft, history=1)
+        self.phonation_features = PhonationFeatureExtractor(sample_rate, n_fft)
+
+    def __call__(self, frames, key_chroma, phonation_probs):
+        # frames: one (k, n_fft) array per session; key_chroma (sessions, 12)
+        # and phonation_probs (sessions, 4) their states. Returns one
+        # (key_chroma, phonation_probs, key_probs (k, 24), phonation (k, 4),
+        # f0 (k,), voicing confidence (k,)) tuple per session
+        counts = np.array([len(f) for f in frames])
+        spectrum = np.fft.rfft(np.concatenate(frames) * self.window, axis=-1)
+        power = (spectrum.real ** 2 + spectrum.imag ** 2).astype(np.float32)
+        sessions, hops = len(frames), int(counts.max(initial=0))
+        f0, confidence, features, frame_chroma = (
+            _scatter(values, counts, hops)
+            for values in hop_features(power, self.pitch, self.phonation_features, self.chroma))
+
+        key = StreamingKeyEstimator(self.sample_rate, self.n_fft, decay=self.decay, channels=sessions)
+        key.chroma[:] = key_chroma
+        phonation = PhonationClassifier(channels=sessions)
+        phonation.probs[:] = phonation_probs
+        key_probs = np.empty((sessions, hops, len(KEY_NAMES)), dtype=np.float32)
+        phonation_out = np.empty((sessions, hops, len(PHONATION_MODES)), dtype=np.float32)
+        for i in range(hops):
+            hop = slice(i, i + 1)
+            key_probs[:, i] = update_hop_models(phonation, key, f0[:, hop], confidence[:, hop],
+                                                features[:, hop], frame_chroma[:, hop])
+            phonation_out[:, i] = phonation.probs
+        return [(key.chroma[s].copy(), phonation.probs[s].copy(), key_probs[s, :n], phonation_out[s, :n],
+                 f0[s, :n], confidence[s, :n]) for s, n in enumerate(counts)]
+
+
+def init_worker(sample_rate=SAMPLE_RATE, n_fft=N_FFT):
+    global _hop_analyzer
+    _hop_analyzer = HopAnalyzer(sample_rate, n_fft)
+
+
+def analyze_batch(frames, key_chroma, phonation_probs):
+    # Runs in a pool worker
+    return _hop_analyzer(frames, key_chroma, phonation_probs)
+
+
+class Session:
+    # Per-connection state. Incoming PCM is downmixed, resampled if needed
+    # and written hop by hop into an n_fft ring; every completed hop yields
+    # the ring's newest n_fft samples as one analysis frame, which is the
+    # framing StreamingSTFT uses (zero history before the first samples).
+
+    def __init__(self, session_id, rate=SAMPLE_RATE, channels=1, sample_format="f32",
+                 n_fft=N_FFT, hop_length=HOP_LENGTH):
+        self.id = session_id
+        self.channels = channels
+        self.dtype = FORMATS[sample_format]
+        self.n_fft = n_fft
+        self.hop_length = hop_length
+        self.resampler = StreamingResampler(rate, SAMPLE_RATE) if rate != SAMPLE_RATE else None
+        self.ring = AudioRingBuffer(n_fft)
+        self.vad = VoiceActivityDetector(hop_length)
+        self.reset()
+
+    def reset(self):
+        self.ring.clear()
+        self.vad.reset()
+        self.pending = 0
+        self.hops = 0
+        self.key_chroma = np.zeros(12, dtype=np.float32)
+        self.phonation_probs = np.full(len(PHONATION_MODES), 1.0 / len(PHONATION_MODES), dtype=np.float32)
+        self.key_probs = np.full(len(KEY_NAMES), 1.0 / len(KEY_NAMES), dtype=np.float32)
+
+    def decode(self, payload):
+        usable = len(payload) - len(payload) % (self.dtype.itemsize * self.channels)
+        samples = np.frombuffer(payload[:usable], dtype=self.dtype)
+        if self.channels > 1:
+            samples = samples.reshape(-1, self.channels)
+        samples = pcm_to_float32(samples)
+        if self.resampler is not None:
+            samples = self.resampler.process(samples)
+        return samples
+
+    def frames(self, samples):
+        # (k, n_fft) frames for the hops completed by these samples
+        frames = []
+        pos = 0
+        while pos < len(samples):
+            take = min(self.hop_length - self.pending, len(samples) - pos)
+            self.ring.write(samples[pos:pos + take])
+            self.pending += take
+            pos += take
+            if self.pending == self.hop_length:
+                frames.append(self.ring.view(self.n_fft).copy())
+                self.pending = 0
+        return np.stack(frames) if frames else np.empty((0, self.n_fft), dtype=np.float32)
+
+    def apply(self, result):
+        # Store the state returned by the batch analysis; returns per-hop replies
+        self.key_chroma, self.phonation_probs, key_probs, phonation, f0, confidence = result
+        if len(key_probs):
+            self.key_probs = key_probs[-1]
+        return [self._reply(key_probs[i], phonation[i], float(f0[i]), float(confidence[i]))
+                for i in range(len(key_probs))]
+
+    def gated(self, n_hops):
+        # Replies for hops skipped as silence: the key holds, nothing voiced
+        return [self._reply(self.key_probs, self.phonation_probs, 0.0, 0.0, gated=True)
+                for _ in range(n_hops)]
+
+    def _reply(self, key_probs, phonation, f0, confidence, gated=False):
+        self.hops += 1
+        key = int(np.argmax(key_probs))
+        mode = int(np.argmax(phonation))
+        return {
+            "hop": self.hops,
+            "time": round(self.hops * self.hop_length / SAMPLE_RATE, 4),
+            "gated": gated,
+            "key": KEY_NAMES[key],
+            "key_confidence": round(float(key_probs[key]), 4),
+            "key_probs": np.round(key_probs, 4).tolist(),
+            "phonation": PHONATION_MODES[mode],
+            "phonation_probs": np.round(phonation, 4).tolist(),
+            "f0": round(f0, 2),
+            "voicing": round(confidence, 3),
+        }
+
+
+class KeyServer:
+    STAGES = ("decode", "analysis", "reply", "end_to_end")
+
+    def __init__(self, workers=None, max_sessions=1000, max_batch=64, max_wait=0.005, max_message=1 << 20):
+        self.workers = os.cpu_count() if workers is None else workers
+        self.max_sessions = max_sessions
+        self.max_message = max_message
+        self.pool = None
+        self.local = None
+        # Batches are sized in analysis windows (hops), one batch per worker
+        self.batcher = MicroBatcher(self.run_batch, max_batch, max_wait, concurrency=self.workers,
+                                    size=lambda request: len(request[0]))
+        self.sessions = {}
+        # Handler task -> writer of every open connection
+        self.connections = {}
+        self.next_id = 0
+        self.latencies = StageLatencies(stages=self.STAGES)
+        self.messages = 0
+        self.hops_analysed = 0
+        self.hops_gated = 0
+        self.errors = 0
+        self.started = time.perf_counter()
+
+    def start_pool(self):
+        if self.workers > 0:
+            self.pool = ProcessPoolExecutor(max_workers=self.workers, initializer=init_worker,
+                                            initargs=(SAMPLE_RATE, N_FFT))
+            # Start the workers now, before the listening socket exists, so
+            # forked workers neither inherit it nor pay the setup on a request
+            self.pool.submit(int).result()
+        else:
+            # In-process analysis on the event loop, for debugging
+            self.local = HopAnalyzer()
+
+    async def close_connections(self, timeout=2.0):
+        # Close every open connection and let its handler return on its own,
+        # instead of being cancelled mid-read when the event loop stops
+        for writer in list(self.connections.values()):
+            writer.close()
+        if self.connections:
+            await asyncio.wait(list(self.connections), timeout=timeout)
+
+    def shutdown(self):
+        self.batcher.close()
+        if self.pool is not None:
+            self.pool.shutdown(cancel_futures=True)
+
+    async def analyze(self, frames, key_chroma, phonation_probs):
+        return await self.batcher.submit((frames, key_chroma, phonation_probs))
+
+    async def run_batch(self, requests):
+        frames, key_chroma, phonation_probs = zip(*requests)
+        args = (list(frames), np.stack(key_chroma), np.stack(phonation_probs))
+        if self.pool is None:
+            return self.local(*args)
+        return await asyncio.get_running_loop().run_in_executor(self.pool, analyze_batch, *args)
+
+    def stats(self):
+        elapsed = time.perf_counter() - self.started
+        hops = self.hops_analysed + self.hops_gated
+        return {
+            "sessions": len(self.sessions),
+            "sessions_total": self.next_id,
+            "workers": self.workers,
+            "messages": self.messages,
+            "hops_analysed": self.hops_analysed,
+            "hops_gated": self.hops_gated,
+            "errors": self.errors,
+            "audio_seconds_per_second": hops * HOP_LENGTH / SAMPLE_RATE / elapsed if elapsed else 0.0,
+            "latency_ms": {row["stage"]: {k: (None if v != v else round(v, 3)) for k, v in row.items()
+                                          if k.endswith("_ms")}
+                           for row in self.latencies.summary()},
+            "batching": self.batcher.stats(),
+        }
+
+    def format(self):
+        stats = self.stats()
+        total = stats["latency_ms"]["end_to_end"]
+        return (f"sessions {stats['sessions']}  hops {stats['hops_analysed']} analysed / "
+                f"{stats['hops_gated']} gated  {stats['audio_seconds_per_second']:.1f} audio s/s  "
+                f"end-to-end p50 {total['p50_ms']} ms  p95 {total['p95_ms']} ms\n"
+                f"  {self.batcher.format()}")
+
+    async def handle(self, reader, writer):
+        self.connections[asyncio.current_task()] = writer
+        try:
+            method, target, headers = await read_http_request(reader)
+        except (asyncio.IncompleteReadError, asyncio.LimitOverrunError, ValueError):
+            self.connections.pop(asyncio.current_task(), None)
+            writer.close()
+            return
+        url = urlsplit(target)
+        try:
+            if url.path == "/stream" and is_upgrade(headers):
+                await self.stream(reader, writer, headers, parse_qs(url.query))
+            elif method != "GET":
+                writer.write(http_response(405))
+            elif url.path in ("/", "/health"):
+                body = {"status": "ok", "sessions": len(self.sessions)}
+                writer.write(http_response(200, json.dumps(body).encode()))
+            elif url.path == "/stats":
+                writer.write(http_response(200, json.dumps(self.stats()).encode()))
+            else:
+                writer.write(http_response(404))
+            await writer.drain()
+        except ConnectionError:
+            # Client gone
+            pass
+        except Exception as e:
+            # A bug in a request handler: log it and drop this connection
+            # rather than leave it as an unhandled task error
+            self.errors += 1
+            print(f"error serving {url.path}: {e!r}", flush=True)
+        finally:
+            # Also on cancellation, which propagates
+            self.connections.pop(asyncio.current_task(), None)
+            writer.close()
+
+    async def stream(self, reader, writer, headers, query):
+        try:
+            rate = int(query.get("rate", [SAMPLE_RATE])[0])
+            channels = int(query.get("channels", [1])[0])
+            sample_format = query.get("format", ["f32"])[0]
+            if rate <= 0 or channels <= 0 or sample_format not in FORMATS:
+                raise ValueError
+        except ValueError:
+            writer.write(http_response(400, b'{"error": "expected rate, channels and format=f32|s16"}'))
+            return
+        if len(self.sessions) >= self.max_sessions:
+            writer.write(http_response(503, b'{"error": "too many sessions"}'))
+            return
+
+        writer.write(handshake_response(headers))
+        socket = WebSocket(reader, writer, max_size=self.max_message)
+        session = Session(self.next_id, rate, channels, sample_format)
+        self.next_id += 1
+        self.sessions[session.id] = session
+        try:
+            while True:
+                opcode, payload = await socket.recv()
+                if opcode == TEXT:
+                    if payload.strip() != b"reset":
+                        await socket.close(UNSUPPORTED_DATA, "expected PCM or 'reset'")
+                        break
+                    session.reset()
+                    continue
+                arrived = time.perf_counter_ns()
+                # One message in flight per session: the next one is not read
+                # until this reply is sent, so a slow pool pushes back on the
+                # client through TCP instead of queueing audio here
+                try:
+                    reply = await self.process(session, payload, arrived)
+                except Exception as e:
+                    # Analysis raised or the pool broke (BrokenProcessPool):
+                    # report it to the client and close this session
+                    self.errors += 1
+                    print(f"session {session.id}: analysis failed: {e!r}", flush=True)
+                    await socket.close(INTERNAL_ERROR, "analysis failed")
+                    break
+                sending = time.perf_counter_ns()
+                await socket.send(reply)
+                done = time.perf_counter_ns()
+                self.latencies.record("reply", done - sending)
+                self.latencies.record("end_to_end", done - arrived)
+        except ConnectionClosed:
+            pass
+        finally:
+            del self.sessions[session.id]
+
+    async def process(self, session, payload, arrived):
+        samples = session.decode(payload)
+        active = session.vad(samples)
+        frames = session.frames(samples)
+        decoded = time.perf_counter_ns()
+        self.latencies.record("decode", decoded - arrived)
+
+        if active and len(frames):
+            result = await self.analyze(frames, session.key_chroma, session.phonation_probs)
+            self.latencies.record("analysis", time.perf_counter_ns() - decoded)
+            hops = session.apply(result)
+            self.hops_analysed += len(hops)
+        else:
+            hops = session.gated(len(frames))
+            self.hops_gated += len(hops)
+        self.messages += 1
+        return json.dumps({"session": session.id, "hops": hops})
+
+    async def report(self, interval):
+        while True:
+            await asyncio.sleep(interval)
+            print(self.format(), flush=True)
+
+
+async def serve(host="127.0.0.1", port=8765, workers=None, max_sessions=1000, max_batch=64, max_wait=0.005,
+                stats_interval=0.0):
+    server = KeyServer(workers, max_sessions, max_batch, max_wait)
+    server.start_pool()
+    # SIGTERM (e.g. from loadtest.py --spawn) shuts the pool down cleanly
+    asyncio.get_running_loop().add_signal_handler(signal.SIGTERM, asyncio.current_task().cancel)
+    listener = await asyncio.start_server(server.handle, host, port, backlog=max(100, max_sessions))
+    print(f"key server on ws://{host}:{port}/stream ({server.workers} analysis workers)", flush=True)
+    reporter = asyncio.create_task(server.report(stats_interval)) if stats_interval > 0 else None
+    try:
+        async with listener:
+            await listener.serve_forever()
+    finally:
+        if reporter is not None:
+            reporter.cancel()
+        await server.close_connections()
+        server.shutdown()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Stream PCM over WebSocket, get key and phonation per hop")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--workers", type=int, default=None,
+                        help="analysis processes (default: CPU count; 0 analyses on the event loop)")
+    parser.add_argument("--max-sessions", type=int, default=1000)
+    parser.add_argument("--max-batch", type=int, default=64,
+                        help="analysis windows per micro-batch (1 disables batching)")
+    parser.add_argument("--max-wait-ms", type=float, default=5.0,
+                        help="longest a window waits for its batch to fill")
+    parser.add_argument("--stats-interval", type=float, default=0.0,
+                        help="print throughput and latency every N seconds")
+    args = parser.parse_args()
+    try:
+        asyncio.run(serve(args.host, args.port, args.workers, args.max_sessions, args.max_batch,
+                          args.max_wait_ms / 1000.0, args.stats_interval))
+    except (KeyboardInterrupt, asyncio.CancelledError):
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,160 @@
+import math
+
+import numpy as np
+
+
+PHONATION_MODES = ["Modal", "Falsetto", "Breathy", "Pressed"]
+
+
+def phonation_harmonics(mode, n_freq=100):
+    # Harmonic weights and frequencies for each simulated phonation type.
+    # The index is scaled so the envelope shapes match the original 100-bin
+    # model at any resolution.
+    i = np.arange(n_freq) * (100.0 / n_freq)
+
+    if mode == "Modal":
+        # Strong fundamental, balanced harmonics
+        weights = np.exp(-i / 20)
+        freqs = i / 2
+    elif mode == "Falsetto":
+        # Weaker fundamental, stronger high harmonics, narrower bandwidth
+        weights = np.where(i < 20, np.exp(-(i - 20) ** 2 / 200), np.exp(-(i - 50) ** 2 / 500))
+        freqs = i / 1.5
+    elif mode == "Breathy":
+        # More noise (added per frame), weaker harmonics
+        weights = np.exp(-i / 30) * 0.6
+        freqs = i / 2
+    elif mode == "Pressed":
+        # Stronger harmonics, more energy, emphasised even harmonics
+        weights = np.exp(-i / 15) * 1.2
+        weights[::2] *= 1.3
+        freqs = i / 2
+    else:
+        raise ValueError(f"unknown phonation mode: {mode}")
+    return weights, freqs
+
+
+# Glottal source settings per phonation type for synthetic_voice():
+# (harmonic slope dB/octave, H1 gain dB, aspiration noise level, F0 range Hz)
+VOICE_PARAMS = {
+    "Modal": (-12.0, -8.0, 0.05, (110.0, 300.0)),
+    "Falsetto": (-20.0, -5.0, 0.125, (330.0, 700.0)),
+    "Breathy": (-15.0, -5.0, 0.25, (110.0, 300.0)),
+    "Pressed": (-6.0, -8.0, 0.025, (110.0, 300.0)),
+}
+
+
+def synthetic_voice(mode, f0, sample_rate=44100, seconds=1.0, rng=None, params=None):
+    # Harmonic voice with 5 Hz vibrato, a textbook source slope and H1 level
+    # for the phonation type, and white aspiration noise, at -20 dBFS RMS.
+    # params overrides the type's (slope, H1 gain, noise level), e.g. to
+    # test a classifier on voices it was not calibrated on.
+    rng = np.random.default_rng(rng)
+    slope, h1_gain, noise = VOICE_PARAMS[mode][:3] if params is None else params
+    t = np.arange(int(sample_rate * seconds)) / sample_rate
+    phase = 2 * np.pi * np.cumsum(f0 * (1 + 0.01 * np.sin(2 * np.pi * 5 * t))) / sample_rate
+    voice = np.zeros_like(t)
+    for h in range(1, int(8000 // f0)):
+        gain_db = slope * np.log2(h) + (h1_gain if h == 1 else 0.0)
+        voice += 10 ** (gain_db / 20) * np.sin(h * phase + rng.uniform(0, 2 * np.pi))
+    voice /= np.sqrt(np.mean(voice ** 2))
+    voice += noise * rng.standard_normal(len(t))
+    return (0.1 * voice / np.sqrt(np.mean(voice ** 2))).astype(np.float32)
+
+
+class PhonationSpectrogramModel:
+    # Vectorized simulated phonation spectrogram.
+    #
+    # Every column is w_i * sin(2*pi*f_i*t + phase), which expands to
+    # (w_i * sin(2*pi*f_i*t)) * cos(phase) + (w_i * cos(2*pi*f_i*t)) * sin(phase).
+    # The two weighted bases are time-invariant and cached per mode, so a frame
+    # is two scalar-broadcast multiply-adds into a preallocated output instead
+    # of a Python loop of np.sin calls.
+
+    NOISE_MODES = {"Breathy": 0.2}
+
+    def __init__(self, n_time=100, n_freq=100, seed=None):
+        self.n_time = n_time
+        self.n_freq = n_freq
+        self.t = np.linspace(0, 10, n_time)
+        self.rng = np.random.default_rng(seed)
+        self._bases = {}
+        self._spec = np.empty((n_time, n_freq), dtype=np.float32)
+        self._scratch = np.empty((n_time, n_freq), dtype=np.float32)
+
+    def basis(self, mode):
+        if mode not in self._bases:
+            weights, freqs = phonation_harmonics(mode, self.n_freq)
+            angle = 2 * np.pi * np.outer(self.t, freqs)
+            self._bases[mode] = (
+                (np.sin(angle) * weights).astype(np.float32),
+                (np.cos(angle) * weights).astype(np.float32),
+            )
+        return self._bases[mode]
+
+    def render(self, mode, frame):
+        # Returns a reused (n_time, n_freq) buffer normalized to [0, 1]
+        sin_basis, cos_basis = self.basis(mode)
+        phase = frame / 10
+
+        spec = self._spec
+        np.multiply(sin_basis, np.cos(phase), out=spec)
+        np.multiply(cos_basis, np.sin(phase), out=self._scratch)
+        spec += self._scratch
+
+        noise = self.NOISE_MODES.get(mode)
+        if noise:
+            self.rng.standard_normal(dtype=np.float32, out=self._scratch)
+            self._scratch *= noise
+            spec += self._scratch
+
+        # The original slow modulation scaled the whole frame by a positive
+        # factor, which min/max normalization cancels, so it is omitted here
+        lo = spec.min()
+        spec -= lo
+        spec /= spec.max() + 1e-9
+        return spec
+
+
+class DistillationCurves:
+    # Teacher / soft-target / student curves for the distillation panels.
+    #
+    # All three share one base signal per frame,
+    #   0.5 * sin(t + frame/10) + 0.3 * sin(2t + frame/8),
+    # evaluated from precomputed sin/cos phase tables with the angle-sum
+    # identity. Every output and noise array is preallocated and updated in
+    # place, so a frame allocates no arrays.
+
+    def __init__(self, n_points=100, seed=None):
+        self.t = np.linspace(0, 4*np.pi, n_points)
+        self._sin1, self._cos1 = np.sin(self.t), np.cos(self.t)
+        self._sin2, self._cos2 = np.sin(2 * self.t), np.cos(2 * self.t)
+        self.rng = np.random.default_rng(seed)
+
+        self.teacher = np.zeros(n_points)
+        self.soft_targets = np.zeros(n_points)
+        self.student = np.zeros(n_points)
+        self._scratch = np.zeros(n_points)
+
+    def update(self, frame):
+        a = frame / 10
+        b = frame / 8
+        base, scratch = self.teacher, self._scratch
+
+        # Teacher curve is the base signal itself
+        np.multiply(self._sin1, 0.5 * math.cos(a), out=base)
+        np.multiply(self._cos1, 0.5 * math.sin(a), out=scratch)
+        base += scratch
+        np.multiply(self._sin2, 0.3 * math.cos(b), out=scratch)
+        base += scratch
+        np.multiply(self._cos2, 0.3 * math.sin(b), out=scratch)
+        base += scratch
+
+        # Soft targets (teacher outputs) and noisier student predictions
+        self.rng.standard_normal(out=self.soft_targets)
+        self.soft_targets *= 0.05
+        self.soft_targets += base
+        self.rng.standard_normal(out=self.student)
+        self.student *= 0.15
+        self.student += base
+        return self.teacher, self.soft_targets, self.student
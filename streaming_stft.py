@@ -0,0 +1,108 @@
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+
+class StreamingSTFT:
+    # Incremental STFT: each push() transforms only the frames completed by the
+    # new samples. The tail of the previous push is carried over so frames
+    # overlap correctly across chunk boundaries.
+    #
+    # The window, the frame staging buffer and the spectrogram history are all
+    # preallocated; numpy's pocketfft caches its twiddle factors per size, so
+    # repeated transforms of the same n_fft reuse the same plan.
+    #
+    # The history keeps `history` columns of log power and, like the audio
+    # ring buffer, stores every column twice so the chronological spectrogram
+    # is always one contiguous zero-copy slice.
+    #
+    # With `channels` set every channel is transformed in the same batched
+    # rfft: push() takes (n, channels) chunks and returns (channels, k, n_bins)
+    # power, and the history is (channels, max_bin, history).
+
+    def __init__(self, n_fft=4096, hop_length=1024, history=200, max_bin=None, channels=None):
+        if hop_length > n_fft:
+            raise ValueError("hop_length must not exceed n_fft")
+        self.n_fft = n_fft
+        self.hop_length = hop_length
+        self.n_bins = n_fft // 2 + 1
+        self.max_bin = self.n_bins if max_bin is None else min(max_bin, self.n_bins)
+        self.history_len = history
+        self.window = np.hanning(n_fft).astype(np.float32)
+        self.channels = channels
+        self._lead = () if channels is None else (channels,)
+
+        # Carried samples (always < n_fft) followed by the newest chunk
+        self._stage = np.zeros(self._lead + (4 * n_fft,), dtype=np.float32)
+        self._carry_len = n_fft - hop_length
+
+        self._history = np.zeros(self._lead + (self.max_bin, 2 * history), dtype=np.float32)
+        self._head = 0
+        self.frames_emitted = 0
+
+    def reset(self):
+        self._stage.fill(0)
+        self._carry_len = self.n_fft - self.hop_length
+        self._history.fill(0)
+        self._head = 0
+        self.frames_emitted = 0
+
+    def _stage_chunk(self, chunk):
+        # Append a chunk after the carried samples; returns (total staged,
+        # number of complete frames)
+        n = len(chunk)
+        total = self._carry_len + n
+        if total > self._stage.shape[-1]:
+            grown = np.zeros(self._lead + (2 * total,), dtype=np.float32)
+            grown[..., :self._carry_len] = self._stage[..., :self._carry_len]
+            self._stage = grown
+        self._stage[..., self._carry_len:total] = chunk if self.channels is None else chunk.T
+        n_frames = 0 if total < self.n_fft else (total - self.n_fft) // self.hop_length + 1
+        return total, n_frames
+
+    def _carry(self, total, n_frames):
+        # Keep the unconsumed tail for the next push
+        consumed = n_frames * self.hop_length
+        self._carry_len = total - consumed
+        self._stage[..., :self._carry_len] = self._stage[..., consumed:total]
+
+    def push(self, chunk):
+        # Returns the power spectra of the new frames, shape ([channels,] k, n_bins)
+        total, n_frames = self._stage_chunk(chunk)
+        if n_frames == 0:
+            self._carry_len = total
+            return np.empty(self._lead + (0, self.n_bins), dtype=np.float32)
+
+        frames = sliding_window_view(self._stage[..., :total], self.n_fft, axis=-1)
+        frames = frames[..., ::self.hop_length, :][..., :n_frames, :]
+        spectrum = np.fft.rfft(frames * self.window, axis=-1)
+        power = (spectrum.real ** 2 + spectrum.imag ** 2).astype(np.float32)
+        self._append_history(power)
+        self._carry(total, n_frames)
+        return power
+
+    def skip(self, chunk):
+        # Advance past a chunk without transforming it (e.g. silence gated by
+        # a VAD): its frames are dropped and the history does not move, but
+        # the carried tail stays correct for the next push()
+        total, n_frames = self._stage_chunk(chunk)
+        self._carry(total, n_frames)
+        return np.empty(self._lead + (0, self.n_bins), dtype=np.float32)
+
+    def _append_history(self, power):
+        k = power.shape[-2]
+        self.frames_emitted += k
+        if k > self.history_len:
+            power = power[..., -self.history_len:, :]
+            self._head = (self._head + k - self.history_len) % self.history_len
+            k = self.history_len
+
+        columns = (self._head + np.arange(k)) % self.history_len
+        log_power = 10.0 * np.log10(np.swapaxes(power[..., :self.max_bin], -1, -2) + 1e-10)
+        self._history[..., columns] = log_power
+        self._history[..., columns + self.history_len] = log_power
+
+        self._head = (self._head + k) % self.history_len
+
+    def history(self):
+        # Zero-copy ([channels,] max_bin, history) view, oldest column first
+        return self._history[..., self._head:self._head + self.history_len]
@@ -0,0 +1,80 @@
+import os
+
+import numpy as np
+
+
+# Weights written by train_student.py; loaded by the GUI when present
+DEFAULT_MODEL = os.path.join(os.path.dirname(os.path.abspath(__file__)), "student_key_model.npz")
+
+
+def load_default_model():
+    return StudentKeyModel.load(DEFAULT_MODEL) if os.path.exists(DEFAULT_MODEL) else None
+
+
+class StudentKeyModel:
+    # Small NumPy-only MLP mapping a window of [chroma | MFCC] features to 24
+    # key logits (12 major, then 12 minor; see key_estimation.KEY_NAMES).
+    # Inference is two matrix products on a (batch, n_features) array, so many
+    # windows are scored in one call. Trained offline by train_student.py
+    # against the long-context chroma teacher.
+
+    def __init__(self, w1, b1, w2, b2, feature_mean, feature_std, context=32):
+        self.w1 = np.asarray(w1, dtype=np.float32)
+        self.b1 = np.asarray(b1, dtype=np.float32)
+        self.w2 = np.asarray(w2, dtype=np.float32)
+        self.b2 = np.asarray(b2, dtype=np.float32)
+        self.feature_mean = np.asarray(feature_mean, dtype=np.float32)
+        self.feature_std = np.asarray(feature_std, dtype=np.float32)
+        # Number of STFT frames averaged into one input window
+        self.context = int(context)
+
+    @classmethod
+    def initialize(cls, n_features, n_hidden=64, n_keys=24, context=32, seed=0):
+        rng = np.random.default_rng(seed)
+        return cls(
+            rng.normal(0, np.sqrt(2.0 / n_features), (n_features, n_hidden)),
+            np.zeros(n_hidden),
+            rng.normal(0, np.sqrt(1.0 / n_hidden), (n_hidden, n_keys)),
+            np.zeros(n_keys),
+            np.zeros(n_features),
+            np.ones(n_features),
+            context=context,
+        )
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            return cls(data['w1'], data['b1'], data['w2'], data['b2'],
+                       data['feature_mean'], data['feature_std'], int(data['context']))
+
+    def save(self, path):
+        np.savez(path, w1=self.w1, b1=self.b1, w2=self.w2, b2=self.b2,
+                 feature_mean=self.feature_mean, feature_std=self.feature_std,
+                 context=self.context)
+
+    def hidden(self, features):
+        x = (np.atleast_2d(features) - self.feature_mean) / self.feature_std
+        h = x @ self.w1
+        h += self.b1
+        np.maximum(h, 0, out=h)
+        return h
+
+    def predict_logits(self, features):
+        return self.logits_from_hidden(self.hidden(features))
+
+    def logits_from_hidden(self, h):
+        logits = h @ self.w2
+        logits += self.b2
+        return logits
+
+    def predict_proba(self, features, temperature=1.0):
+        return self.proba_from_hidden(self.hidden(features), temperature)
+
+    def proba_from_hidden(self, h, temperature=1.0):
+        # Lets callers that also want the hidden layer (e.g. as an
+        # embedding) run the first layer once
+        logits = self.logits_from_hidden(h) / temperature
+        logits -= logits.max(axis=1, keepdims=True)
+        np.exp(logits, out=logits)
+        logits /= logits.sum(axis=1, keepdims=True)
+        return logits
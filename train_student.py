@@ -0,0 +1,156 @@
+import argparse
+import os
+import time
+
+import numpy as np
+
+from audio_io import find_audio_files
+from feature_cache import DEFAULT_CACHE_DIR, FeatureCache, file_frame_features
+from features import window_means
+from key_estimation import key_correlations
+from student_model import DEFAULT_MODEL, StudentKeyModel
+
+
+# Offline knowledge distillation for the student key model.
+#
+# Teacher: Krumhansl-Kessler correlation of chroma accumulated over a long,
+# centred context (several seconds, looking ahead), softened with a
+# temperature. Student: StudentKeyModel on short causal windows of
+# [chroma | MFCC] features, trained to match the teacher's soft targets.
+# Both are augmented with all 12 transpositions.
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+
+def teacher_targets(frame_features, context, teacher_context, temperature):
+    # Soft targets for the student window ending at each frame, from chroma
+    # summed over a centred teacher_context-frame span around it
+    chroma = frame_features[:, :12]
+    long_chroma = window_means(chroma, teacher_context)
+    # long_chroma[j] covers frames j .. j + teacher_context - 1; centre it on
+    # the student window that ends at frame j + teacher_context // 2
+    n_windows = len(frame_features) - context + 1
+    ends = np.arange(context - 1, context - 1 + n_windows)
+    idx = np.clip(ends - teacher_context // 2, 0, len(long_chroma) - 1)
+    logits = key_correlations(long_chroma[idx]) / temperature
+    logits -= logits.max(axis=1, keepdims=True)
+    probs = np.exp(logits)
+    return probs / probs.sum(axis=1, keepdims=True)
+
+
+def transpose(windows, targets, k):
+    # Shift pitch content up k semitones: roll chroma and both key blocks
+    windows = windows.copy()
+    windows[:, :12] = np.roll(windows[:, :12], k, axis=1)
+    targets = np.hstack([np.roll(targets[:, :12], k, axis=1), np.roll(targets[:, 12:], k, axis=1)])
+    return windows, targets
+
+
+def build_dataset(paths, context, teacher_context, teacher_temperature, holdout, cache=None):
+    train, test = [], []
+    for path in paths:
+        start = time.perf_counter()
+        frames = file_frame_features(path, cache=cache)
+        if len(frames) < teacher_context:
+            print(f"Skipping {path}: too short")
+            continue
+        windows = window_means(frames, context)
+        targets = teacher_targets(frames, context, teacher_context, teacher_temperature)
+        split = int(len(windows) * (1 - holdout))
+        for k in range(12):
+            train.append(transpose(windows[:split], targets[:split], k))
+            test.append(transpose(windows[split:], targets[split:], k))
+        print(f"{len(windows):6d} windows from {os.path.basename(path)} "
+              f"({time.perf_counter() - start:.1f} s)")
+
+    def stack(parts):
+        return np.vstack([w for w, _ in parts]), np.vstack([t for _, t in parts])
+    return stack(train), stack(test)
+
+
+def evaluate(model, windows, targets, temperature):
+    probs = model.predict_proba(windows, temperature)
+    kl = np.sum(targets * (np.log(targets + 1e-12) - np.log(probs + 1e-12)), axis=1).mean()
+    agreement = (probs.argmax(axis=1) == targets.argmax(axis=1)).mean()
+    return kl, agreement
+
+
+def train(model, windows, targets, epochs, batch_size, learning_rate, temperature, seed=0):
+    # Adam on the distillation cross-entropy; d(loss)/d(logits) = (p_s - p_t) / T
+    rng = np.random.default_rng(seed)
+    params = [model.w1, model.b1, model.w2, model.b2]
+    m = [np.zeros_like(p) for p in params]
+    v = [np.zeros_like(p) for p in params]
+    beta1, beta2, step = 0.9, 0.999, 0
+
+    x_all = (windows - model.feature_mean) / model.feature_std
+    for epoch in range(epochs):
+        order = rng.permutation(len(windows))
+        for start in range(0, len(order), batch_size):
+            batch = order[start:start + batch_size]
+            x, p_t = x_all[batch], targets[batch]
+
+            h = np.maximum(x @ model.w1 + model.b1, 0)
+            logits = (h @ model.w2 + model.b2) / temperature
+            logits -= logits.max(axis=1, keepdims=True)
+            p_s = np.exp(logits)
+            p_s /= p_s.sum(axis=1, keepdims=True)
+
+            d_logits = (p_s - p_t) / (temperature * len(batch))
+            d_h = (d_logits @ model.w2.T) * (h > 0)
+            grads = [x.T @ d_h, d_h.sum(axis=0), h.T @ d_logits, d_logits.sum(axis=0)]
+
+            step += 1
+            for p, g, m_i, v_i in zip(params, grads, m, v):
+                m_i *= beta1
+                m_i += (1 - beta1) * g
+                v_i *= beta2
+                v_i += (1 - beta2) * g * g
+                m_hat = m_i / (1 - beta1 ** step)
+                v_hat = v_i / (1 - beta2 ** step)
+                p -= (learning_rate * m_hat / (np.sqrt(v_hat) + 1e-8)).astype(p.dtype)
+
+        kl, agreement = evaluate(model, windows, targets, temperature)
+        print(f"epoch {epoch + 1:3d}: train KL {kl:.4f}, top-1 agreement {agreement:.3f}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Distill the student key model from the chroma teacher")
+    parser.add_argument("inputs", nargs="*", default=[HERE],
+                        help="audio files, directories or globs (default: bundled recordings)")
+    parser.add_argument("-o", "--output", default=DEFAULT_MODEL)
+    parser.add_argument("--context", type=int, default=32, help="student window, in STFT frames")
+    parser.add_argument("--teacher-context", type=int, default=172, help="teacher span, in STFT frames")
+    parser.add_argument("--teacher-temperature", type=float, default=0.1)
+    parser.add_argument("--temperature", type=float, default=2.0, help="distillation temperature")
+    parser.add_argument("--hidden", type=int, default=64)
+    parser.add_argument("--epochs", type=int, default=20)
+    parser.add_argument("--batch-size", type=int, default=256)
+    parser.add_argument("--learning-rate", type=float, default=1e-3)
+    parser.add_argument("--holdout", type=float, default=0.1, help="tail fraction of each file held out")
+    parser.add_argument("--cache-dir", default=DEFAULT_CACHE_DIR, help="feature cache directory")
+    parser.add_argument("--no-cache", action="store_true", help="always decode and extract features")
+    args = parser.parse_args(argv)
+
+    paths = find_audio_files(args.inputs)
+    if not paths:
+        parser.error("no audio files matched")
+
+    (x_train, y_train), (x_test, y_test) = build_dataset(
+        paths, args.context, args.teacher_context, args.teacher_temperature, args.holdout,
+        cache=None if args.no_cache else FeatureCache(args.cache_dir))
+
+    model = StudentKeyModel.initialize(x_train.shape[1], n_hidden=args.hidden, context=args.context)
+    model.feature_mean = x_train.mean(axis=0).astype(np.float32)
+    model.feature_std = (x_train.std(axis=0) + 1e-6).astype(np.float32)
+
+    train(model, x_train, y_train, args.epochs, args.batch_size, args.learning_rate, args.temperature)
+    kl, agreement = evaluate(model, x_test, y_test, args.temperature)
+    print(f"held out: KL {kl:.4f}, top-1 agreement with teacher {agreement:.3f}")
+
+    model.save(args.output)
+    print(f"Saved {args.output}")
+
+
+if __name__ == "__main__":
+    main()
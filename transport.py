@@ -0,0 +1,396 @@
+import collections
+import queue
+import threading
+import time
+
+import numpy as np
+
+from audio_io import pcm_to_float32
+
+
+class AudioChunkQueue:
+    # Bounded queue of (capture_ns, samples) between capture and analysis with
+    # an explicit backpressure policy and drop accounting:
+    #
+    #   drop-oldest  a full queue discards its oldest chunk (keeps latency low)
+    #   drop-newest  a full queue rejects the incoming chunk
+    #   block        the producer waits for room (offline sources only; never
+    #                use it from a PortAudio callback)
+    #
+    # Raises queue.Empty like queue.Queue so consumers can use either.
+
+    POLICIES = ("drop-oldest", "drop-newest", "block")
+
+    def __init__(self, maxsize=32, policy="drop-oldest"):
+        if policy not in self.POLICIES:
+            raise ValueError(f"unknown queue policy {policy!r}, expected one of {self.POLICIES}")
+        self.maxsize = maxsize
+        self.policy = policy
+        self._items = collections.deque()
+        self._lock = threading.Lock()
+        self._not_empty = threading.Condition(self._lock)
+        self._not_full = threading.Condition(self._lock)
+
+        self.enqueued_chunks = 0
+        self.dropped_chunks = 0
+        self.dropped_samples = 0
+        self.overruns = 0
+        self.high_watermark = 0
+
+    def qsize(self):
+        return len(self._items)
+
+    def put(self, item, block=None, timeout=None):
+        # Returns False if this (or, for drop-oldest, an older) chunk was dropped;
+        # block=True/False overrides the policy for this call
+        if block is None:
+            block = self.policy == "block"
+        with self._not_full:
+            accepted = True
+            if len(self._items) >= self.maxsize:
+                if block:
+                    if not self._not_full.wait_for(lambda: len(self._items) < self.maxsize, timeout):
+                        self._count_drop(item)
+                        return False
+                elif self.policy == "drop-newest":
+                    self._count_drop(item)
+                    return False
+                else:
+                    self._count_drop(self._items.popleft())
+                    accepted = False
+            self._items.append(item)
+            self.enqueued_chunks += 1
+            self.high_watermark = max(self.high_watermark, len(self._items))
+            self._not_empty.notify()
+            return accepted
+
+    def put_nowait(self, item):
+        return self.put(item, block=False)
+
+    def get(self, block=True, timeout=None):
+        with self._not_empty:
+            if block and not self._not_empty.wait_for(lambda: self._items, timeout):
+                raise queue.Empty
+            if not self._items:
+                raise queue.Empty
+            item = self._items.popleft()
+            self._not_full.notify()
+            return item
+
+    def get_nowait(self):
+        return self.get(block=False)
+
+    def drain(self):
+        # Every pending item, oldest first, in one lock acquisition
+        with self._lock:
+            items = list(self._items)
+            self._items.clear()
+            self._not_full.notify_all()
+            return items
+
+    def record_overrun(self):
+        # Input overflow reported by the audio driver (samples lost before us)
+        self.overruns += 1
+
+    def _count_drop(self, item):
+        self.dropped_chunks += 1
+        self.dropped_samples += len(item[1])
+
+    def reset_stats(self):
+        self.enqueued_chunks = self.dropped_chunks = self.dropped_samples = 0
+        self.overruns = self.high_watermark = 0
+
+    def stats(self):
+        return {
+            "policy": self.policy,
+            "depth": len(self._items),
+            "maxsize": self.maxsize,
+            "high_watermark": self.high_watermark,
+            "enqueued_chunks": self.enqueued_chunks,
+            "dropped_chunks": self.dropped_chunks,
+            "dropped_samples": self.dropped_samples,
+            "overruns": self.overruns,
+        }
+
+    def format(self):
+        return (f"queue {len(self._items)}/{self.maxsize} ({self.policy}, peak {self.high_watermark})  "
+                f"dropped {self.dropped_chunks} chunks / {self.dropped_samples} samples  "
+                f"overruns {self.overruns}")
+
+
+class SharedAudioRing:
+    # Single-producer audio transport over multiprocessing.shared_memory, so
+    # capture can run in its own process and analysis in others with no
+    # pickling or per-block allocation.
+    #
+    # Layout: an int64 header, then per-slot capture time and length, then
+    # n_slots fixed slots of slot_size float32 samples (mono, or interleaved
+    # (slot_size, channels) for multi-channel capture). write_index and
+    # read_index count slots ever written/consumed; each has exactly one
+    # writer, and an aligned int64 store is a single instruction, so the
+    # indices are updated atomically. The producer fills a slot before
+    # publishing it by bumping write_index.
+    #
+    # It exposes the same put/get/drain/stats interface as AudioChunkQueue,
+    # with the same policies: drop-oldest lets the producer overwrite unread
+    # slots (the consumer notices it was lapped and counts the loss; the
+    # slot the producer may be rewriting counts as lapped too),
+    # drop-newest rejects a block when all slots are unread, block polls for
+    # room. Drops are counted by whichever side detects them (the consumer
+    # under drop-oldest, the producer otherwise). Capture times come from
+    # time.perf_counter_ns(), which is system-wide (CLOCK_MONOTONIC) on
+    # Linux, so they stay comparable across processes.
+
+    POLICIES = AudioChunkQueue.POLICIES
+
+    # Header fields, one int64 each
+    WRITE_INDEX, READ_INDEX, ENQUEUED, DROPPED_CHUNKS, DROPPED_SAMPLES, OVERRUNS, HIGH_WATERMARK, \
+        N_SLOTS, SLOT_SIZE, POLICY, CHANNELS = range(11)
+    HEADER_SIZE = 16
+
+    def __init__(self, shm, owner, consume=True):
+        self.shm = shm
+        self.owner = owner
+        header = np.ndarray((self.HEADER_SIZE,), dtype=np.int64, buffer=shm.buf)
+        n_slots, slot_size = int(header[self.N_SLOTS]), int(header[self.SLOT_SIZE])
+        channels = int(header[self.CHANNELS])
+        # None keeps mono slots 1-D and mono writes downmixed
+        self.channels = channels if channels > 1 else None
+        slot_shape = (slot_size,) if self.channels is None else (slot_size, channels)
+        offset = header.nbytes
+        self._header = header
+        self._capture_ns = np.ndarray((n_slots,), dtype=np.int64, buffer=shm.buf, offset=offset)
+        offset += self._capture_ns.nbytes
+        self._lengths = np.ndarray((n_slots,), dtype=np.int64, buffer=shm.buf, offset=offset)
+        offset += self._lengths.nbytes
+        self._slots = np.ndarray((n_slots,) + slot_shape, dtype=np.float32, buffer=shm.buf, offset=offset)
+
+        self.maxsize = n_slots
+        self.slot_size = slot_size
+        self.policy = self.POLICIES[int(header[self.POLICY])]
+        # A tap (consume=False) follows the stream with a private cursor and
+        # never moves read_index, so it adds no backpressure
+        self.consume = consume
+        self._cursor = int(header[self.READ_INDEX] if consume else header[self.WRITE_INDEX])
+        # Largest safe gap between write_index and the cursor. A producer that
+        # may lap this reader (drop-oldest, or any policy for a tap) is
+        # already rewriting slot write_index % n_slots, which is the
+        # cursor's slot once the gap reaches n_slots.
+        laps = self.policy == "drop-oldest" or not consume
+        self._max_gap = n_slots - 1 if laps else n_slots
+
+    @classmethod
+    def create(cls, n_slots=64, slot_size=1024, policy="drop-oldest", name=None, channels=1):
+        if policy not in cls.POLICIES:
+            raise ValueError(f"unknown queue policy {policy!r}, expected one of {cls.POLICIES}")
+        if n_slots < 2:
+            # A lapping producer always has one slot in flight
+            raise ValueError("a shared ring needs at least 2 slots")
+        from multiprocessing import shared_memory
+
+        size = 8 * cls.HEADER_SIZE + 16 * n_slots + 4 * n_slots * slot_size * channels
+        shm = shared_memory.SharedMemory(name=name, create=True, size=size)
+        header = np.ndarray((cls.HEADER_SIZE,), dtype=np.int64, buffer=shm.buf)
+        header[:] = 0
+        header[cls.N_SLOTS] = n_slots
+        header[cls.SLOT_SIZE] = slot_size
+        header[cls.POLICY] = cls.POLICIES.index(policy)
+        header[cls.CHANNELS] = channels
+        return cls(shm, owner=True)
+
+    @classmethod
+    def attach(cls, name, consume=True):
+        # Open a ring created by another process; it stays owned (and is
+        # unlinked) by its creator
+        import multiprocessing
+        from multiprocessing import resource_tracker, shared_memory
+
+        shm = shared_memory.SharedMemory(name=name)
+        # Before Python 3.13 attaching registers the segment with this
+        # process's resource tracker, which would unlink it on exit. Children
+        # started by multiprocessing share their parent's tracker, where the
+        # creator's registration must stay.
+        if multiprocessing.parent_process() is None:
+            resource_tracker.unregister(shm._name, "shared_memory")
+        return cls(shm, owner=False, consume=consume)
+
+    @property
+    def name(self):
+        return self.shm.name
+
+    def close(self):
+        # Views must go before the mapping can be closed
+        self._header = self._capture_ns = self._lengths = self._slots = None
+        self.shm.close()
+        if self.owner:
+            self.shm.unlink()
+
+    def qsize(self):
+        return min(int(self._header[self.WRITE_INDEX]) - self._cursor, self.maxsize)
+
+    # Producer side
+
+    def put(self, item, block=None, timeout=None):
+        # Writes (capture_ns, samples) into one slot per slot_size samples;
+        # integer PCM is converted (and downmixed for a mono ring) straight
+        # into the slot.
+        # Returns False if this or an unread older block was dropped.
+        capture_ns, samples = item
+        accepted = True
+        for start in range(0, len(samples), self.slot_size):
+            accepted &= self.write(samples[start:start + self.slot_size], capture_ns, block, timeout)
+        return accepted
+
+    def put_nowait(self, item):
+        return self.put(item, block=False)
+
+    def write(self, samples, capture_ns, block=None, timeout=None):
+        header = self._header
+        if block is None:
+            block = self.policy == "block"
+        index = int(header[self.WRITE_INDEX])
+
+        full = index - int(header[self.READ_INDEX]) >= self.maxsize
+        if full:
+            if block:
+                deadline = None if timeout is None else time.monotonic() + timeout
+                while index - int(header[self.READ_INDEX]) >= self.maxsize:
+                    if deadline is not None and time.monotonic() > deadline:
+                        self._count_drop(len(samples))
+                        return False
+                    time.sleep(0.0005)
+                full = False
+            elif self.policy == "drop-newest":
+                self._count_drop(len(samples))
+                return False
+
+        slot = index % self.maxsize
+        n = len(samples)
+        pcm_to_float32(samples, out=self._slots[slot], channels=self.channels)
+        self._lengths[slot] = n
+        self._capture_ns[slot] = capture_ns
+        # Publish only after the slot is complete
+        header[self.WRITE_INDEX] = index + 1
+        header[self.ENQUEUED] += 1
+        depth = min(index + 1 - int(header[self.READ_INDEX]), self.maxsize)
+        if depth > header[self.HIGH_WATERMARK]:
+            header[self.HIGH_WATERMARK] = depth
+        return not full
+
+    def record_overrun(self):
+        self._header[self.OVERRUNS] += 1
+
+    def _count_drop(self, n_samples):
+        self._header[self.DROPPED_CHUNKS] += 1
+        self._header[self.DROPPED_SAMPLES] += n_samples
+
+    # Consumer side
+
+    def _read(self):
+        # Next unread block as (capture_ns, private copy), or None when
+        # caught up. Lapped slots are skipped and counted as drops.
+        header = self._header
+        while True:
+            written = int(header[self.WRITE_INDEX])
+            if self._cursor >= written:
+                return None
+            if written - self._cursor > self._max_gap:
+                # Overwritten (or being overwritten) slots' lengths are gone;
+                # assume they were full
+                lost = written - self._cursor - self._max_gap
+                if self.consume:
+                    header[self.DROPPED_CHUNKS] += lost
+                    header[self.DROPPED_SAMPLES] += lost * self.slot_size
+                self._cursor = written - self._max_gap
+
+            slot = self._cursor % self.maxsize
+            capture_ns = int(self._capture_ns[slot])
+            samples = self._slots[slot][:self._lengths[slot]].copy()
+            # The producer may have started rewriting the slot while it was
+            # copied; if so, skip ahead and try again
+            if int(header[self.WRITE_INDEX]) - self._cursor <= self._max_gap:
+                break
+
+        self._cursor += 1
+        if self.consume:
+            header[self.READ_INDEX] = self._cursor
+        return capture_ns, samples
+
+    def get(self, block=True, timeout=None):
+        # Polls; there is no cross-process condition variable to wait on
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            item = self._read()
+            if item is not None:
+                return item
+            if not block or (deadline is not None and time.monotonic() > deadline):
+                raise queue.Empty
+            time.sleep(0.001)
+
+    def get_nowait(self):
+        return self.get(block=False)
+
+    def drain(self):
+        items = []
+        item = self._read()
+        while item is not None:
+            items.append(item)
+            item = self._read()
+        return items
+
+    def reset_stats(self):
+        self._header[self.ENQUEUED:self.HIGH_WATERMARK + 1] = 0
+
+    @property
+    def dropped_chunks(self):
+        return int(self._header[self.DROPPED_CHUNKS])
+
+    @property
+    def dropped_samples(self):
+        return int(self._header[self.DROPPED_SAMPLES])
+
+    @property
+    def overruns(self):
+        return int(self._header[self.OVERRUNS])
+
+    @property
+    def high_watermark(self):
+        return int(self._header[self.HIGH_WATERMARK])
+
+    def stats(self):
+        return {
+            "policy": self.policy,
+            "depth": self.qsize(),
+            "maxsize": self.maxsize,
+            "high_watermark": self.high_watermark,
+            "enqueued_chunks": int(self._header[self.ENQUEUED]),
+            "dropped_chunks": self.dropped_chunks,
+            "dropped_samples": self.dropped_samples,
+            "overruns": self.overruns,
+        }
+
+    def format(self):
+        return (f"shm {self.qsize()}/{self.maxsize} ({self.policy}, peak {self.high_watermark})  "
+                f"dropped {self.dropped_chunks} chunks / {self.dropped_samples} samples  "
+                f"overruns {self.overruns}")
+
+
+def run_capture_process(ring_name, sample_rate, block_size, device, channels, stop_event):
+    # Entry point of the capture process: PortAudio blocks go straight into
+    # the shared ring (converted in place, no queue, no allocation) until
+    # stop_event is set
+    import sounddevice as sd
+
+    ring = SharedAudioRing.attach(ring_name, consume=False)
+
+    def audio_callback(indata, frames, time_info, status):
+        if status.input_overflow:
+            ring.record_overrun()
+        ring.write(indata, time.perf_counter_ns(), block=False)
+
+    try:
+        with sd.InputStream(callback=audio_callback, device=device, channels=channels,
+                            samplerate=sample_rate, blocksize=block_size):
+            stop_event.wait()
+    finally:
+        ring.close()
@@ -0,0 +1,70 @@
+import numpy as np
+
+
+class VoiceActivityDetector:
+    # Energy / zero-crossing voice activity detection per hop, at the front
+    # of the analysis chain so silent hops skip the STFT, pitch, key and
+    # student stages entirely.
+    #
+    # A hop opens the gate when it is louder than open_db (dBFS), or louder
+    # than close_db with a zero-crossing rate above fricative_zcr (unvoiced
+    # consonants are quiet but noisy). The gate only closes after `hangover`
+    # consecutive hops below close_db, so the band between the two levels
+    # and short pauses inside a phrase do not make it flicker. Per hop the
+    # cost is two reductions over the samples, vectorized over channels; the
+    # analyzer keeps going while any channel is active.
+
+    def __init__(self, hop_length=1024, open_db=-45.0, close_db=-55.0, fricative_zcr=0.25,
+                 hangover=8, channels=None):
+        self.hop_length = hop_length
+        self.open_db = open_db
+        self.close_db = close_db
+        self.fricative_zcr = fricative_zcr
+        self.hangover = hangover
+        self.channels = channels
+        lead = () if channels is None else (channels,)
+        self.active = np.zeros(lead, dtype=bool)
+        self._quiet = np.zeros(lead, dtype=np.int64)
+        self.hops = 0
+        self.skipped_hops = 0
+
+    def reset(self):
+        self.active.fill(False)
+        self._quiet.fill(0)
+
+    def reset_stats(self):
+        self.hops = 0
+        self.skipped_hops = 0
+
+    @property
+    def skipped_fraction(self):
+        return self.skipped_hops / self.hops if self.hops else 0.0
+
+    def __call__(self, samples):
+        # samples: float32 (n,) or (n, channels). True if any hop of the
+        # chunk is active on any channel, i.e. the chunk must be analysed
+        n_hops = max(1, len(samples) // self.hop_length)
+        per_hop = len(samples) // n_hops
+        if per_hop < 2:
+            return bool(self.active.any())
+        hops = samples[:n_hops * per_hop].reshape((n_hops, per_hop) + samples.shape[1:])
+
+        power = np.einsum('hi...,hi...->h...', hops, hops) / per_hop
+        energy_db = 10.0 * np.log10(power + 1e-12)
+        crossings = np.count_nonzero(np.signbit(hops[:, 1:]) != np.signbit(hops[:, :-1]), axis=1)
+        zcr = crossings / (per_hop - 1)
+
+        any_active = False
+        for db, rate in zip(energy_db, zcr):
+            trigger = (db > self.open_db) | ((db > self.close_db) & (rate > self.fricative_zcr))
+            self._quiet[...] = np.where(db < self.close_db, self._quiet + 1, 0)
+            self.active[...] = trigger | (self.active & (self._quiet < self.hangover))
+            any_active |= bool(self.active.any())
+        # Chunks are analysed or skipped as a whole
+        self.hops += n_hops
+        if not any_active:
+            self.skipped_hops += n_hops
+        return any_active
+
+    def format(self):
+        return f"vad skipped {self.skipped_fraction:6.1%} of {self.hops} hops"
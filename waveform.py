@@ -0,0 +1,31 @@
+import numpy as np
+
+
+class WaveformDecimator:
+    # Min/max decimation of the newest n_samples to n_columns plot columns.
+    #
+    # The window is reshaped to (columns, samples_per_column) and reduced
+    # with one vectorized min and one max straight into a preallocated,
+    # interleaved [min0, max0, min1, max1, ...] output, so a line plot draws
+    # each column as a vertical stroke covering every peak. What reaches the
+    # plot is O(columns) however long the window is. With a leading channel
+    # axis (multi-channel rings) every channel is reduced in the same call.
+
+    def __init__(self, n_samples, n_columns, channels=None):
+        self.n_columns = max(1, min(n_columns, n_samples // 2))
+        self.per_column = n_samples // self.n_columns
+        # The oldest n_samples % n_columns samples are left out of the window
+        self.n_samples = self.per_column * self.n_columns
+        lead = () if channels is None else (channels,)
+        self.out = np.zeros(lead + (2 * self.n_columns,), dtype=np.float32)
+        # Sample index of each output point, for the plot's x axis
+        self.x = np.repeat(np.arange(self.n_columns) * self.per_column + self.per_column // 2, 2)
+        self.x += n_samples - self.n_samples
+        self.x.setflags(write=False)
+
+    def __call__(self, samples):
+        # samples: (..., >= n_samples) with time on the last axis, e.g. a ring view
+        blocks = samples[..., -self.n_samples:].reshape(samples.shape[:-1] + (self.n_columns, self.per_column))
+        np.min(blocks, axis=-1, out=self.out[..., 0::2])
+        np.max(blocks, axis=-1, out=self.out[..., 1::2])
+        return self.out
@@ -0,0 +1,201 @@
+import asyncio
+import base64
+import hashlib
+import os
+import struct
+
+import numpy as np
+
+
+# Minimal RFC 6455 WebSocket framing over asyncio streams, for the key
+# server and its load-test client. Covers what they use: the HTTP upgrade,
+# binary and text messages (fragmented or not), ping/pong and close.
+# Extensions and subprotocols are not negotiated.
+
+GUID = "258EAFA5-E914-47DA-95CA-C5AB0DC85B11"
+
+CONTINUATION, TEXT, BINARY, CLOSE, PING, PONG = 0x0, 0x1, 0x2, 0x8, 0x9, 0xA
+
+# Close codes
+NORMAL_CLOSURE = 1000
+PROTOCOL_ERROR = 1002
+UNSUPPORTED_DATA = 1003
+MESSAGE_TOO_BIG = 1009
+INTERNAL_ERROR = 1011
+
+
+class ConnectionClosed(Exception):
+    def __init__(self, code=NORMAL_CLOSURE, reason=""):
+        super().__init__(f"connection closed ({code}) {reason}".strip())
+        self.code = code
+        self.reason = reason
+
+
+def accept_key(key):
+    digest = hashlib.sha1((key + GUID).encode()).digest()
+    return base64.b64encode(digest).decode()
+
+
+async def read_http_request(reader, limit=16384):
+    # (method, target, headers with lower-cased names) of one HTTP/1.1 request
+    head = await reader.readuntil(b"\r\n\r\n")
+    if len(head) > limit:
+        raise ValueError("request header too large")
+    lines = head.decode("latin-1").split("\r\n")
+    method, target, _ = lines[0].split(" ", 2)
+    headers = {}
+    for line in lines[1:]:
+        if ":" in line:
+            name, value = line.split(":", 1)
+            headers[name.strip().lower()] = value.strip()
+    return method, target, headers
+
+
+def is_upgrade(headers):
+    return (headers.get("upgrade", "").lower() == "websocket"
+            and "upgrade" in headers.get("connection", "").lower()
+            and "sec-websocket-key" in headers)
+
+
+def handshake_response(headers):
+    return ("HTTP/1.1 101 Switching Protocols\r\n"
+            "Upgrade: websocket\r\n"
+            "Connection: Upgrade\r\n"
+            f"Sec-WebSocket-Accept: {accept_key(headers['sec-websocket-key'])}\r\n\r\n").encode()
+
+
+def http_response(status, body=b"", content_type="application/json"):
+    reason = {200: "OK", 400: "Bad Request", 404: "Not Found", 405: "Method Not Allowed",
+              503: "Service Unavailable"}.get(status, "")
+    return (f"HTTP/1.1 {status} {reason}\r\n"
+            f"Content-Type: {content_type}\r\n"
+            f"Content-Length: {len(body)}\r\n"
+            "Connection: close\r\n\r\n").encode() + body
+
+
+def apply_mask(payload, mask):
+    # XOR with the repeating 4-byte mask, vectorized for large messages
+    n = len(payload)
+    if n == 0:
+        return payload
+    data = np.frombuffer(payload, dtype=np.uint8)
+    key = np.frombuffer(mask * (n // 4 + 1), dtype=np.uint8)[:n]
+    return np.bitwise_xor(data, key).tobytes()
+
+
+def encode_frame(opcode, payload, mask=False, fin=True):
+    header = bytearray([(0x80 if fin else 0) | opcode])
+    n = len(payload)
+    mask_bit = 0x80 if mask else 0
+    if n < 126:
+        header.append(mask_bit | n)
+    elif n < 1 << 16:
+        header.append(mask_bit | 126)
+        header += struct.pack("!H", n)
+    else:
+        header.append(mask_bit | 127)
+        header += struct.pack("!Q", n)
+    if mask:
+        # Clients must mask every frame (RFC 6455 section 5.3)
+        key = os.urandom(4)
+        return bytes(header) + key + apply_mask(payload, key)
+    return bytes(header) + payload
+
+
+class WebSocket:
+    # One open connection. The server side sends unmasked frames and expects
+    # masked ones; the client side (mask=True) does the opposite. Messages
+    # larger than max_size close the connection with 1009.
+
+    def __init__(self, reader, writer, mask=False, max_size=1 << 20):
+        self.reader = reader
+        self.writer = writer
+        self.mask = mask
+        self.max_size = max_size
+        self.closed = False
+
+    async def _read_frame(self):
+        first, second = await self.reader.readexactly(2)
+        fin, opcode = bool(first & 0x80), first & 0x0F
+        masked, n = bool(second & 0x80), second & 0x7F
+        if n == 126:
+            n, = struct.unpack("!H", await self.reader.readexactly(2))
+        elif n == 127:
+            n, = struct.unpack("!Q", await self.reader.readexactly(8))
+        if masked == self.mask:
+            # Clients mask, servers do not
+            await self.close(PROTOCOL_ERROR, "bad masking")
+            raise ConnectionClosed(PROTOCOL_ERROR, "bad masking")
+        if n > self.max_size:
+            await self.close(MESSAGE_TOO_BIG)
+            raise ConnectionClosed(MESSAGE_TOO_BIG)
+        key = await self.reader.readexactly(4) if masked else None
+        payload = await self.reader.readexactly(n)
+        if masked:
+            payload = apply_mask(payload, key)
+        return fin, opcode, payload
+
+    async def recv(self):
+        # (opcode, payload) of the next TEXT or BINARY message; answers pings
+        # and raises ConnectionClosed on close or EOF
+        fragments, message_opcode, size = [], None, 0
+        while True:
+            try:
+                fin, opcode, payload = await self._read_frame()
+            except (asyncio.IncompleteReadError, ConnectionError):
+                self.closed = True
+                raise ConnectionClosed(1006, "connection lost")
+            if opcode == PING:
+                await self.send(payload, PONG)
+                continue
+            if opcode == PONG:
+                continue
+            if opcode == CLOSE:
+                code = struct.unpack("!H", payload[:2])[0] if len(payload) >= 2 else NORMAL_CLOSURE
+                await self.close(code)
+                raise ConnectionClosed(code, payload[2:].decode("utf-8", "replace"))
+            if opcode != CONTINUATION:
+                message_opcode = opcode
+            size += len(payload)
+            if size > self.max_size:
+                await self.close(MESSAGE_TOO_BIG)
+                raise ConnectionClosed(MESSAGE_TOO_BIG)
+            fragments.append(payload)
+            if fin:
+                return message_opcode, b"".join(fragments)
+
+    async def send(self, payload, opcode=None):
+        if self.closed:
+            raise ConnectionClosed(1006, "connection lost")
+        if isinstance(payload, str):
+            payload, opcode = payload.encode(), opcode or TEXT
+        self.writer.write(encode_frame(opcode or BINARY, payload, mask=self.mask))
+        await self.writer.drain()
+
+    async def close(self, code=NORMAL_CLOSURE, reason=""):
+        if self.closed:
+            return
+        self.closed = True
+        try:
+            self.writer.write(encode_frame(CLOSE, struct.pack("!H", code) + reason.encode(), mask=self.mask))
+            await self.writer.drain()
+        except ConnectionError:
+            pass
+
+
+async def connect(host, port, path="/", max_size=1 << 20):
+    # Client side of the upgrade; returns an open WebSocket
+    reader, writer = await asyncio.open_connection(host, port)
+    key = base64.b64encode(os.urandom(16)).decode()
+    writer.write((f"GET {path} HTTP/1.1\r\n"
+                  f"Host: {host}:{port}\r\n"
+                  "Upgrade: websocket\r\n"
+                  "Connection: Upgrade\r\n"
+                  f"Sec-WebSocket-Key: {key}\r\n"
+                  "Sec-WebSocket-Version: 13\r\n\r\n").encode())
+    await writer.drain()
+    _, status, headers = await read_http_request(reader)
+    if status != "101" or headers.get("sec-websocket-accept") != accept_key(key):
+        writer.close()
+        raise ConnectionError(f"websocket upgrade to {path} refused")
+    return WebSocket(reader, writer, mask=True, max_size=max_size)